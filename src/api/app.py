@@ -2,14 +2,16 @@ import uvicorn
 from fastapi import FastAPI, HTTPException, Security, Depends
 from fastapi.security.api_key import APIKeyHeader
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from src.api.v1.metrics import router as metrics_router
 from src.api.v1.prompts import router as prompts_router
 from src.api.v1.logs import router as log_router
 from src.api.v1.sources import router as source_router
+from src.api.v1.stats import router as stats_router
+from src.api.v1.exports import router as exports_router
+from src.api.dependencies import async_database, database
+from src.infrastructure.clickhouse import clickhouse_analytics
 from src.config.config import APP_PORT, ENV, API_KEY
-from src.infrastructure.database import DataBase
-
-database = DataBase()
 
 API_KEY_NAME = "X-API-KEY"
 api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=False)
@@ -25,9 +27,14 @@ app = FastAPI(
     title="Prompt Parsing System API",
     description="API with required EndPoints - Structured",
     version="1.0.0",
-    on_startup=[database.create_all_tables],
-    on_shutdown=[database.engine.dispose],
+    on_startup=[database.require_schema],
+    on_shutdown=[
+        clickhouse_analytics.close,
+        database.dispose,
+        async_database.dispose,
+    ],
     dependencies=[Depends(get_api_key)],
+    default_response_class=ORJSONResponse,
 )
 
 
@@ -45,6 +52,8 @@ app.include_router(prefix="/api", router=metrics_router, tags=["METRICS"])
 app.include_router(prefix="/api", router=prompts_router, tags=["PROMPTS"])
 app.include_router(prefix="/api", router=log_router, tags=["LOGS"])
 app.include_router(prefix="/api", router=source_router, tags=["SOURCE"])
+app.include_router(prefix="/api", router=stats_router, tags=["STATS"])
+app.include_router(prefix="/api", router=exports_router, tags=["EXPORTS"])
 
 
 def start_app():
@@ -1,5 +1,38 @@
-from typing import Annotated
-from src.infrastructure.database import DataBase
-from fastapi import Depends
+from typing import Annotated, Optional
+from src.config import config
+from src.infrastructure.async_database import AsyncDataBase, create_async_db_engine
+from src.infrastructure.database import DataBase, create_db_engine
+from fastapi import Depends, Query
 
-database_depends = Annotated[DataBase, Depends(DataBase)]
+# One application-scoped engine (and connection pool) shared by every request
+database = DataBase(
+    engine=create_db_engine(),
+    read_engine=create_db_engine(config.DB_READ_DSN) if config.DB_READ_DSN else None,
+)
+# Async engine used by the (async) route handlers
+async_database = AsyncDataBase(
+    engine=create_async_db_engine(),
+    read_engine=(
+        create_async_db_engine(config.DB_READ_DSN) if config.DB_READ_DSN else None
+    ),
+)
+
+
+def get_database() -> DataBase:
+    return database
+
+
+def get_async_database(
+    max_staleness: Optional[float] = Query(
+        None,
+        ge=0,
+        description="Max replica lag (seconds) the read accepts, else primary",
+    ),
+) -> AsyncDataBase:
+    if max_staleness is None:
+        return async_database
+    return async_database.fresh(max_staleness)
+
+
+database_depends = Annotated[DataBase, Depends(get_database)]
+async_database_depends = Annotated[AsyncDataBase, Depends(get_async_database)]
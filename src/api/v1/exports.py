@@ -0,0 +1,84 @@
+import csv
+import io
+from typing import AsyncIterator, Literal, Optional
+
+import orjson
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+
+from src.api.dependencies import async_database_depends
+from src.infrastructure.models import Brands, Citations, Sentiments
+from src.infrastructure.shared import get_date
+
+router = APIRouter(
+    prefix="/report/exports", responses={404: {"description": "Not found"}}
+)
+
+EXPORT_TABLES = {"brands": Brands, "citations": Citations, "sentiments": Sentiments}
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+async def to_ndjson(batches: AsyncIterator[list[dict]]) -> AsyncIterator[bytes]:
+    async for batch in batches:
+        yield b"".join(orjson.dumps(row) + b"\n" for row in batch)
+
+
+async def to_csv(
+    batches: AsyncIterator[list[dict]], columns: list[str]
+) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns)
+    writer.writeheader()
+    async for batch in batches:
+        for row in batch:
+            # JSON columns (e.g. sentiment phrases) are written as JSON text
+            writer.writerow(
+                {
+                    key: (
+                        orjson.dumps(value).decode()
+                        if isinstance(value, (list, dict))
+                        else value
+                    )
+                    for key, value in row.items()
+                }
+            )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+@router.get("/{dataset}")
+async def export_report_rows(
+    dataset: Literal["brands", "citations", "sentiments"],
+    brand_report_id: str,
+    database: async_database_depends,
+    start_date: Optional[str] = Query(None, description="Defaults to 7 days ago"),
+    end_date: Optional[str] = Query(None, description="Defaults to no upper bound"),
+    model: str = "all",
+    format: Literal["ndjson", "csv"] = "ndjson",
+):
+    """
+    Stream every row of a report table as NDJSON or CSV. Rows are read with a
+    server-side cursor and written batch by batch, so the export size does
+    not affect memory use.
+    """
+    table = EXPORT_TABLES[dataset]
+    batches = database.stream_report_rows(
+        table,
+        brand_report_id=brand_report_id,
+        start_date=start_date or get_date(),
+        end_date=end_date,
+        model=model,
+    )
+    if format == "csv":
+        content = to_csv(batches, list(table.__table__.columns.keys()))
+    else:
+        content = to_ndjson(batches)
+    filename = f"{brand_report_id}-{dataset}.{format}"
+    return StreamingResponse(
+        content,
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
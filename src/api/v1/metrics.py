@@ -1,24 +1,16 @@
 from datetime import datetime, timedelta
 from typing import Annotated
 
-import dateparser
 from fastapi import APIRouter, Depends, HTTPException
 
-from src.infrastructure.database import DataBase
+from src.api.dependencies import async_database_depends
+from src.infrastructure.shared import get_date
 
 router = APIRouter(
     prefix="/report/metrics", responses={404: {"description": "Not found"}}
 )
 
 
-def get_date() -> str:
-    """Get date"""
-    date_node = dateparser.parse("7 days Ago")
-    if date_node:
-        return date_node.strftime("%Y-%m-%d %H:%M:%S")
-    return ""
-
-
 def common_parameters(
     brand: str,
     brand_report_id: str,
@@ -37,12 +29,12 @@ def common_parameters(
 
 # Brand Mentions
 @router.get("/mentions")
-def brand_mentions(
+async def brand_mentions(
     arguments: Annotated[dict, Depends(common_parameters)],
-    database: Annotated[DataBase, Depends(DataBase)],
+    database: async_database_depends,
 ):
     try:
-        result = database.get_brand_mention(
+        result = await database.get_brand_mention(
             brand=arguments["brand"],
             brand_report_id=arguments["brand_report_id"],
             start_date=arguments["start_date"],
@@ -56,12 +48,12 @@ def brand_mentions(
 
 # Brand Share of Voice
 @router.get("/share-of-voice")
-def brand_sov(
+async def brand_sov(
     arguments: Annotated[dict, Depends(common_parameters)],
-    database: Annotated[DataBase, Depends(DataBase)],
+    database: async_database_depends,
 ):
     try:
-        result = database.get_brand_sov(
+        result = await database.get_brand_sov(
             brand=arguments["brand"],
             brand_report_id=arguments["brand_report_id"],
             start_date=arguments["start_date"],
@@ -75,12 +67,12 @@ def brand_sov(
 
 # Brand Coverage
 @router.get("/coverage")
-def brand_coverage(
+async def brand_coverage(
     arguments: Annotated[dict, Depends(common_parameters)],
-    database: Annotated[DataBase, Depends(DataBase)],
+    database: async_database_depends,
 ):
     try:
-        result = database.get_brand_coverage(
+        result = await database.get_brand_coverage(
             brand=arguments["brand"],
             brand_report_id=arguments["brand_report_id"],
             start_date=arguments["start_date"],
@@ -94,12 +86,12 @@ def brand_coverage(
 
 # Brand Position
 @router.get("/position")
-def brand_position(
+async def brand_position(
     arguments: Annotated[dict, Depends(common_parameters)],
-    database: Annotated[DataBase, Depends(DataBase)],
+    database: async_database_depends,
 ):
     try:
-        result = database.get_brand_position(
+        result = await database.get_brand_position(
             brand=arguments["brand"],
             brand_report_id=arguments["brand_report_id"],
             start_date=arguments["start_date"],
@@ -111,14 +103,33 @@ def brand_position(
         raise HTTPException(status_code=500, detail=f"Server Error: {e}")
 
 
+# Brand Summary (mentions, share of voice, coverage and position)
+@router.get("/summary")
+async def brand_summary(
+    arguments: Annotated[dict, Depends(common_parameters)],
+    database: async_database_depends,
+):
+    try:
+        result = await database.get_brand_summary(
+            brand=arguments["brand"],
+            brand_report_id=arguments["brand_report_id"],
+            start_date=arguments["start_date"],
+            end_date=arguments["end_date"],
+            model=arguments["model"],
+        )
+        return {"data": result.get("data", {})}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Server Error: {e}")
+
+
 # Brand Ranking
 @router.get("/ranking")
-def brand_ranking(
+async def brand_ranking(
     arguments: Annotated[dict, Depends(common_parameters)],
-    database: Annotated[DataBase, Depends(DataBase)],
+    database: async_database_depends,
 ):
     try:
-        result = database.get_brand_ranking(
+        result = await database.get_brand_ranking(
             brand_report_id=arguments["brand_report_id"],
             start_date=arguments["start_date"],
             end_date=arguments["end_date"],
@@ -131,37 +142,36 @@ def brand_ranking(
 
 # Brand Ranking over time
 @router.get("/ranking-over-time")
-def brand_ranking_over_time(
+async def brand_ranking_over_time(
     arguments: Annotated[dict, Depends(common_parameters)],
-    database: Annotated[DataBase, Depends(DataBase)],
+    database: async_database_depends,
+    fill_gaps: bool = False,
 ):
     try:
-        result = database.get_brand_ranking_over_time(
+        result = await database.get_brand_ranking_over_time(
             brand_report_id=arguments["brand_report_id"],
             start_date=arguments["start_date"],
             end_date=arguments["end_date"],
             model=arguments["model"],
+            brand=arguments["brand"],
+            fill_gaps=fill_gaps,
         )
-        output = []
-        for r in result:
-            if r["brand_name"].lower() == arguments["brand"].lower():
-                output.append(r)
-        return {"data": {"ranking": output or []}}
+        return {"data": {"ranking": result or []}}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Server Error: {e}")
 
 
 # Get Brand Info
 @router.get("/brand-info")
-def get_brand_info(
+async def get_brand_info(
     brand_report_id: str,
     prompt_id: str,
     model: str,
     date: str,
-    database: Annotated[DataBase, Depends(DataBase)],
+    database: async_database_depends,
 ):
     try:
-        result = database.get_info(
+        result = await database.get_info(
             brand_report_id=brand_report_id, date=date, model=model, prompt_id=prompt_id
         )
         return result
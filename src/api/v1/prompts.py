@@ -1,12 +1,13 @@
 from time import time
-from typing import Annotated, Optional
+from typing import Literal, Optional
 
-import dateparser
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import ORJSONResponse
+from starlette.concurrency import run_in_threadpool
 
 from src.infrastructure import celery_app
 from src.infrastructure.aws_storage import AWSStorage
-from src.infrastructure.database import DataBase
+from src.api.dependencies import async_database_depends
 from src.infrastructure.shared import super_clean
 
 router = APIRouter(
@@ -14,14 +15,6 @@ router = APIRouter(
 )
 
 
-def get_date() -> str:
-    """Get date"""
-    date_node = dateparser.parse("7 days Ago")
-    if date_node:
-        return date_node.strftime("%Y-%m-%d %H:%M:%S")
-    return ""
-
-
 # Shared query parameters
 def common_parameters(
     brand_report_id: str = Query(..., description="Brand report ID"),
@@ -44,6 +37,7 @@ def parse_output(
     s3_key: str,
     languague: str,
     date: str,
+    extraction_mode: Literal["split", "fused"] = "split",
 ) -> dict:
     """Start the worflow"""
     try:
@@ -59,7 +53,8 @@ def parse_output(
                 s3_key,
                 languague,
                 date,
-            )
+            ),
+            kwargs={"extraction_mode": extraction_mode},
         )
         return {"details": "Parser started", "process": process_id}
     except Exception as e:
@@ -67,21 +62,29 @@ def parse_output(
 
 
 @router.get("/reports")
-def get_reports(
-    db: Annotated[DataBase, Depends(DataBase)],
+async def get_reports(
+    db: async_database_depends,
     brand_report_id: str,
     limit: int = 20,
     page: int = 1,
 ):
     offset = (page - 1) * limit
-    results = db.get_reports(brand_report_id, limit, offset)
-    return results
+    results = await db.get_reports(brand_report_id, limit, offset)
+    return ORJSONResponse(results)
+
+
+def load_report_files(report: dict, model: str) -> tuple[str, str]:
+    """Presigned snapshot URL and cleaned markdown of a report (blocking S3)"""
+    aws_storage = AWSStorage()
+    snapshot_url = aws_storage.get_presigned_url(report["snapshot"])
+    markdown = aws_storage.get_file_content(report["markdown"])
+    return snapshot_url, super_clean(markdown if markdown else "", model)
 
 
 @router.get("/outputs")
-def get_outputs(
+async def get_outputs(
     prompt_id: str,
-    db: Annotated[DataBase, Depends(DataBase)],
+    db: async_database_depends,
     brand_report_id: str = Query(..., description="Brand report ID"),
     date: Optional[str] = Query(None, description="Report date"),
     model: str = Query("chatgpt", description="Model name"),
@@ -96,15 +99,16 @@ def get_outputs(
                                   Example: "7 days ago" or "2023-01-01"
     """
     try:
-        aws_storage = AWSStorage()
-        report = db.get_report_outputs(
+        report = await db.get_report_outputs(
             brand_report_id,
             prompt_id,
             date,
             model,
         )
         # Retrieve all unique available dates according to max_date
-        available_dates = db.get_report_dates(max_dates=max_date, prompt_id=prompt_id)
+        available_dates = await db.get_report_dates(
+            max_dates=max_date, prompt_id=prompt_id
+        )
         if not report:
             return {
                 "snapshot_url": "",
@@ -114,10 +118,9 @@ def get_outputs(
 
         # Generate AWS S3 pre-signed URLs
         print("GETTING PRESIGNED URLS")
-        snapshot_url = aws_storage.get_presigned_url(report["snapshot"])
-        markdown = aws_storage.get_file_content(report["markdown"])
-
-        cleaned_markdown = super_clean(markdown if markdown else "", model)
+        snapshot_url, cleaned_markdown = await run_in_threadpool(
+            load_report_files, report, model
+        )
         return {
             "snapshot_url": snapshot_url,
             "markdown": cleaned_markdown,
@@ -130,30 +133,29 @@ def get_outputs(
 
 
 @router.get("/citations")
-def get_citations(
-    db: Annotated[DataBase, Depends(DataBase)], prompt_id: str, date: str, model: str
+async def get_citations(
+    db: async_database_depends, prompt_id: str, date: str, model: str
 ):
     """
     Retrieve citations for a given report.
     """
     try:
-        citations = db.get_citations(prompt_id, date, model)
-        print(citations)
-        return {"citations": citations}
+        citations = await db.get_citations(prompt_id, date, model)
+        return ORJSONResponse({"citations": citations})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Server Error: {e}")
 
 
 @router.get("/sentiments")
-def get_sentiments(
-    db: Annotated[DataBase, Depends(DataBase)], prompt_id: str, date: str, model: str
+async def get_sentiments(
+    db: async_database_depends, prompt_id: str, date: str, model: str
 ):
     """
     Retrieve sentiment analysis results for a given report.
     Adds helper counters for positive and negative phrases.
     """
     try:
-        sentiments = db.get_sentiments(prompt_id, date, model)
+        sentiments = await db.get_sentiments(prompt_id, date, model)
 
         for sentiment in sentiments:
             sentiment["count_positive_phrases"] = len(
@@ -163,6 +165,6 @@ def get_sentiments(
                 sentiment.get("negative_phrases", [])
             )
 
-        return {"sentiments": sentiments}
+        return ORJSONResponse({"sentiments": sentiments})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Server Error: {e}")
@@ -0,0 +1,37 @@
+from fastapi import APIRouter, HTTPException
+
+from src.api.dependencies import async_database, database_depends
+from src.infrastructure.clickhouse import clickhouse_analytics
+from src.infrastructure.llm_cache import llm_cache
+
+router = APIRouter(prefix="/stats", responses={404: {"description": "Not found"}})
+
+
+@router.get("/db-pool")
+def get_db_pool_stats(database: database_depends):
+    """Connection pool usage of the API engine (for pool sizing)"""
+    try:
+        return {
+            "details": database.pool_stats(),
+            "async": async_database.pool_stats(),
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Server Error: {e}")
+
+
+@router.get("/clickhouse")
+def get_clickhouse_stats():
+    """Rows queued, written and failed by the ClickHouse dual-write"""
+    try:
+        return {"details": clickhouse_analytics.stats()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Server Error: {e}")
+
+
+@router.get("/llm-cache")
+def get_llm_cache_stats():
+    """Gemini response cache hits, misses and evictions (all workers)"""
+    try:
+        return {"details": llm_cache.stats()["global"]}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Server Error: {e}")
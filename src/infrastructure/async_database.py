@@ -0,0 +1,427 @@
+import asyncio
+import copy
+from typing import AsyncIterator, Callable, Optional
+
+from sqlalchemy import TextClause, exc
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlmodel import SQLModel
+
+from src.config import config
+from src.infrastructure.clickhouse import (
+    OUTBOX_PENDING_SQL,
+    ClickHouseAnalytics,
+    clickhouse_analytics,
+)
+from src.infrastructure.database import InstrumentedQueuePool, ReplicaLag
+from src.infrastructure.dates import parse_date
+from src.infrastructure.models import Citations, Output_Reports, Sentiments
+from src.infrastructure.queries import (
+    REPLICA_LAG_SQL,
+    brand_coverage_result,
+    brand_coverage_stmt,
+    brand_mention_result,
+    brand_mention_stmt,
+    brand_position_result,
+    brand_position_stmt,
+    brand_ranking_over_time_result,
+    brand_ranking_over_time_stmt,
+    brand_ranking_result,
+    brand_ranking_stmt,
+    brand_sov_result,
+    brand_sov_stmt,
+    brand_summary_result,
+    brand_summary_stmt,
+    db_url,
+    domain_coverage_result,
+    domain_coverage_stmts,
+    latest_date_stmt,
+    prompt_rows_stmt,
+    report_dates_stmt,
+    report_output_stmt,
+    report_rows_stmt,
+    reports_stmt,
+    unique_report_dates,
+)
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    """InstrumentedQueuePool for the asyncio engine"""
+
+
+def create_async_db_engine(dsn: Optional[str] = None, **kwargs) -> AsyncEngine:
+    """
+    Create a pooled psycopg (async) engine (on `dsn`, or on the DB_*
+    settings); keyword arguments override the pool settings. Requests wait
+    on the pool, not on a worker thread.
+    """
+    options = dict(
+        poolclass=InstrumentedAsyncQueuePool,
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_timeout=config.DB_POOL_TIMEOUT,
+        pool_recycle=config.DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+        query_cache_size=config.DB_QUERY_CACHE_SIZE,
+        connect_args={"prepare_threshold": config.DB_PREPARE_THRESHOLD},
+    )
+    options.update(kwargs)
+    return create_async_engine(db_url("psycopg_async", dsn), **options)
+
+
+class AsyncDataBase:
+    """
+    Async variant of the `DataBase` read methods used by the API. The SQL
+    comes from the same builders (src.infrastructure.queries) so both
+    return the same values. ClickHouse (blocking client) runs in a thread.
+    """
+
+    def __init__(
+        self,
+        engine: Optional[AsyncEngine] = None,
+        read_engine: Optional[AsyncEngine] = None,
+    ) -> None:
+        self.analytics: Optional[ClickHouseAnalytics] = (
+            clickhouse_analytics if config.CLICKHOUSE_ENABLED else None
+        )
+        self.engine = engine or create_async_db_engine()
+        # same routing as DataBase: reads on the replica unless it lags
+        self.read_engine = read_engine
+        self.replica_lag = ReplicaLag()
+        self.max_staleness = config.DB_READ_MAX_STALENESS
+
+    def fresh(self, max_staleness: float) -> "AsyncDataBase":
+        """See DataBase.fresh"""
+        database = copy.copy(self)
+        database.max_staleness = max_staleness
+        return database
+
+    async def _read_engine(self) -> AsyncEngine:
+        if self.read_engine is None:
+            return self.engine
+        if self.replica_lag.due():
+            try:
+                async with self.read_engine.connect() as connection:
+                    lag = await connection.scalar(REPLICA_LAG_SQL)
+            except exc.SQLAlchemyError as e:
+                print(f"DATABASE: Read replica unavailable: {e}")
+                lag = None
+            self.replica_lag.update(lag)
+        if self.replica_lag.route(self.max_staleness) == "replica":
+            return self.read_engine
+        return self.engine
+
+    async def dispose(self) -> None:
+        """Close the pooled connections (primary and replica)"""
+        await self.engine.dispose()
+        if self.read_engine is not None:
+            await self.read_engine.dispose()
+
+    def pool_stats(self) -> dict:
+        stats = getattr(self.engine.pool, "stats", None)
+        result = stats() if stats else {"status": self.engine.pool.status()}
+        if self.read_engine is not None:
+            stats = getattr(self.read_engine.pool, "stats", None)
+            result["replica"] = dict(
+                stats() if stats else {"status": self.read_engine.pool.status()},
+                **self.replica_lag.stats(),
+            )
+        return result
+
+    async def get_reports(
+        self, brand_report_id: str, limit: int = 20, offset: int = 0
+    ) -> list[dict]:
+        async with (await self._read_engine()).connect() as connection:
+            result = await connection.execute(
+                reports_stmt(brand_report_id, limit, offset)
+            )
+            return [dict(row) for row in result.mappings().all()]
+
+    async def get_report_outputs(
+        self,
+        brand_report_id: str,
+        prompt_id: str,
+        date: Optional[str] = None,
+        model: str = "all",
+    ) -> dict | None:
+        async with (await self._read_engine()).connect() as connection:
+            if date is None:
+                report_date = await connection.scalar(
+                    latest_date_stmt(
+                        Output_Reports,
+                        brand_report_id=brand_report_id,
+                        prompt_id=prompt_id,
+                    )
+                )
+            else:
+                report_date = parse_date(date)
+            if not report_date:
+                return None
+
+            result = await connection.execute(
+                report_output_stmt(brand_report_id, prompt_id, report_date, model)
+            )
+            row = result.mappings().first()
+        return dict(row) if row else None
+
+    async def _get_prompt_rows(
+        self,
+        table: type[SQLModel],
+        prompt_id: str,
+        date: Optional[str] = None,
+        model: str = "all",
+    ) -> list[dict]:
+        async with (await self._read_engine()).connect() as connection:
+            if date is None:
+                report_date = await connection.scalar(
+                    latest_date_stmt(table, prompt_id=prompt_id)
+                )
+            else:
+                report_date = parse_date(date)
+            if not report_date:
+                return []
+
+            result = await connection.execute(
+                prompt_rows_stmt(table, prompt_id, report_date, model)
+            )
+            return [dict(row) for row in result.mappings().all()]
+
+    async def get_citations(
+        self, prompt_id: str, date: Optional[str] = None, model: str = "all"
+    ) -> list[dict]:
+        return await self._get_prompt_rows(Citations, prompt_id, date, model)
+
+    async def get_sentiments(
+        self, prompt_id: str, date: Optional[str] = None, model: str = "all"
+    ) -> list[dict]:
+        return await self._get_prompt_rows(Sentiments, prompt_id, date, model)
+
+    async def get_citations_by_report(
+        self,
+        brand_report_id: str,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        model: str = "all",
+    ) -> list[dict]:
+        async with (await self._read_engine()).connect() as connection:
+            result = await connection.execute(
+                report_rows_stmt(
+                    Citations, brand_report_id, start_date, end_date, model
+                )
+            )
+            return [dict(row) for row in result.mappings().all()]
+
+    async def get_report_dates(
+        self, prompt_id: str, max_dates: str = "7 days ago"
+    ) -> list[str]:
+        async with (await self._read_engine()).connect() as connection:
+            result = await connection.scalars(report_dates_stmt(prompt_id, max_dates))
+            return unique_report_dates(result.all())
+
+    async def stream_report_rows(
+        self,
+        table: type[SQLModel],
+        brand_report_id: str,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        model: str = "all",
+        batch_size: int = config.DB_EXPORT_BATCH_SIZE,
+    ) -> AsyncIterator[list[dict]]:
+        """Same batches as DataBase.stream_report_rows (server-side cursor)"""
+        statement = report_rows_stmt(
+            table, brand_report_id, start_date, end_date, model
+        ).order_by(table.date, table.id)
+        async with (await self._read_engine()).connect() as connection:
+            result = await connection.stream(
+                statement.execution_options(yield_per=batch_size)
+            )
+            async for partition in result.mappings().partitions():
+                yield [dict(row) for row in partition]
+
+    async def get_domain_citation_coverage(
+        self,
+        brand_report_id: str,
+        domain: str,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        model: str = "all",
+        limit: int = 50,
+    ) -> dict:
+        if await self._use_analytics(brand_report_id):
+            return await asyncio.to_thread(
+                self.analytics.get_domain_citation_coverage,
+                brand_report_id=brand_report_id,
+                domain=domain,
+                start_date=start_date,
+                end_date=end_date,
+                model=model,
+                limit=limit,
+            )
+        totals_stmt, urls_stmt = domain_coverage_stmts(
+            brand_report_id, domain, start_date, end_date, model, limit
+        )
+        async with (await self._read_engine()).connect() as connection:
+            totals = (await connection.execute(totals_stmt)).one()
+            url_rows = (await connection.execute(urls_stmt)).fetchall()
+        return domain_coverage_result(domain, totals, url_rows)
+
+    # --------------------------ANALYTICS------------------------------
+    async def _use_analytics(self, brand_report_id: str) -> bool:
+        """See DataBase._use_analytics"""
+        if not self.analytics:
+            return False
+        async with self.engine.connect() as connection:
+            pending = await connection.execute(
+                OUTBOX_PENDING_SQL, {"brand_report_id": brand_report_id}
+            )
+            return pending.first() is None
+
+    async def _brand_metric(
+        self,
+        name: str,
+        stmt: Callable[..., TextClause],
+        result: Callable,
+        many: bool = False,
+        **arguments,
+    ):
+        """Run a brand metric on ClickHouse (in a thread) or Postgres"""
+        if await self._use_analytics(arguments["brand_report_id"]):
+            return await asyncio.to_thread(getattr(self.analytics, name), **arguments)
+        async with (await self._read_engine()).connect() as connection:
+            rows = await connection.execute(stmt(**arguments))
+            return result(rows.fetchall() if many else rows.first())
+
+    async def get_brand_mention(
+        self,
+        brand: str,
+        brand_report_id: str,
+        end_date: str,
+        model: str,
+        start_date: str,
+    ) -> dict:
+        return await self._brand_metric(
+            "get_brand_mention",
+            brand_mention_stmt,
+            brand_mention_result,
+            brand=brand,
+            brand_report_id=brand_report_id,
+            start_date=start_date,
+            end_date=end_date,
+            model=model,
+        )
+
+    async def get_brand_sov(
+        self,
+        brand: str,
+        brand_report_id: str,
+        end_date: str,
+        model: str,
+        start_date: str,
+    ) -> dict:
+        return await self._brand_metric(
+            "get_brand_sov",
+            brand_sov_stmt,
+            brand_sov_result,
+            brand=brand,
+            brand_report_id=brand_report_id,
+            start_date=start_date,
+            end_date=end_date,
+            model=model,
+        )
+
+    async def get_brand_coverage(
+        self,
+        brand: str,
+        brand_report_id: str,
+        end_date: str,
+        model: str,
+        start_date: str,
+    ) -> dict:
+        return await self._brand_metric(
+            "get_brand_coverage",
+            brand_coverage_stmt,
+            brand_coverage_result,
+            brand=brand,
+            brand_report_id=brand_report_id,
+            start_date=start_date,
+            end_date=end_date,
+            model=model,
+        )
+
+    async def get_brand_position(
+        self,
+        brand: str,
+        brand_report_id: str,
+        end_date: str,
+        model: str,
+        start_date: str,
+    ) -> dict:
+        return await self._brand_metric(
+            "get_brand_position",
+            brand_position_stmt,
+            brand_position_result,
+            brand=brand,
+            brand_report_id=brand_report_id,
+            start_date=start_date,
+            end_date=end_date,
+            model=model,
+        )
+
+    async def get_brand_summary(
+        self,
+        brand: str,
+        brand_report_id: str,
+        end_date: str,
+        model: str,
+        start_date: str,
+    ) -> dict:
+        return await self._brand_metric(
+            "get_brand_summary",
+            brand_summary_stmt,
+            brand_summary_result,
+            brand=brand,
+            brand_report_id=brand_report_id,
+            start_date=start_date,
+            end_date=end_date,
+            model=model,
+        )
+
+    async def get_brand_ranking(
+        self,
+        brand_report_id: str,
+        start_date: str,
+        end_date: str,
+        model: str,
+    ) -> list:
+        return await self._brand_metric(
+            "get_brand_ranking",
+            brand_ranking_stmt,
+            brand_ranking_result,
+            many=True,
+            brand_report_id=brand_report_id,
+            start_date=start_date,
+            end_date=end_date,
+            model=model,
+        )
+
+    async def get_brand_ranking_over_time(
+        self,
+        brand_report_id: str,
+        start_date: str,
+        end_date: str,
+        model: str,
+        brand: Optional[str] = None,
+        fill_gaps: bool = False,
+    ) -> list:
+        return await self._brand_metric(
+            "get_brand_ranking_over_time",
+            brand_ranking_over_time_stmt,
+            brand_ranking_over_time_result,
+            many=True,
+            brand_report_id=brand_report_id,
+            start_date=start_date,
+            end_date=end_date,
+            model=model,
+            brand=brand,
+            fill_gaps=fill_gaps,
+        )
@@ -8,10 +8,10 @@ from src.config import config
 
 
 class AWSStorage:
-    def __init__(self):
+    def __init__(self, s3_client=None):
         self.bucket_name = config.BUCKET_NAME
-        self.region_name = "eu-north-1"
-        self.s3_client = boto3.client(
+        self.region_name = config.AWS_REGION_NAME
+        self.s3_client = s3_client or boto3.client(
             "s3",
             region_name=self.region_name,
             aws_access_key_id=config.AWS_ACCESS_KEY_ID,
@@ -0,0 +1,168 @@
+import re
+from collections import deque
+from typing import Iterable, Optional
+
+
+def _is_word(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+def _lower(content: str) -> str:
+    """Lowercase without shifting character offsets"""
+    lowered = content.lower()
+    if len(lowered) == len(content):
+        return lowered
+    return "".join(c.lower() if len(c.lower()) == 1 else c for c in content)
+
+
+def count_word_with_apostrophe(word: str, content: str) -> int:
+    """Reference (per-brand regex) implementation of the mention counter"""
+    pattern = r"\b" + re.escape(word) + r"(?:'s)?\b"
+    return len(re.findall(pattern, content, flags=re.IGNORECASE))
+
+
+class BrandMatcher:
+    """
+    Aho-Corasick matcher counting every brand in a single pass.
+
+    For each brand `match` returns the number of mentions, with the same
+    semantics as `count_word_with_apostrophe` (case-insensitive, word
+    boundaries, optional possessive 's), and the first raw position of the
+    brand in the lowercased content (like `str.find`).
+    """
+
+    def __init__(self, brands: Iterable[str]) -> None:
+        self.brands = list(dict.fromkeys(brands))
+        self.patterns = [_lower(brand) for brand in self.brands]
+        self._goto: list[dict[str, int]] = [{}]
+        self._outputs: list[list[int]] = [[]]
+        for index, pattern in enumerate(self.patterns):
+            if pattern:
+                self._add(pattern, index)
+        self._fail = self._build_failure_links()
+
+    def _add(self, pattern: str, index: int) -> None:
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                self._goto.append({})
+                self._outputs.append([])
+                next_state = len(self._goto) - 1
+                self._goto[state][char] = next_state
+            state = next_state
+        self._outputs[state].append(index)
+
+    def _build_failure_links(self) -> list[int]:
+        fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = self._goto[fallback].get(char, 0)
+                self._outputs[next_state] = (
+                    self._outputs[next_state] + self._outputs[fail[next_state]]
+                )
+        return fail
+
+    def _occurrences(self, content: str) -> list[list[int]]:
+        """Start offsets of every raw occurrence, per pattern"""
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        occurrences: list[list[int]] = [[] for _ in self.patterns]
+        state = 0
+        for position, char in enumerate(content):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for index in outputs[state]:
+                occurrences[index].append(position - len(self.patterns[index]) + 1)
+        return occurrences
+
+    @staticmethod
+    def _is_boundary(content: str, position: int) -> bool:
+        before = position > 0 and _is_word(content[position - 1])
+        after = position < len(content) and _is_word(content[position])
+        return before != after
+
+    def _match_end(self, content: str, start: int, pattern: str) -> Optional[int]:
+        """End of the `\\bpattern(?:'s)?\\b` match starting at `start`, if any"""
+        if not self._is_boundary(content, start):
+            return None
+        end = start + len(pattern)
+        if content.startswith("'s", end) and self._is_boundary(content, end + 2):
+            return end + 2
+        if self._is_boundary(content, end):
+            return end
+        return None
+
+    def match(self, content: str) -> dict[str, tuple[int, Optional[int]]]:
+        """Map every brand to (mention count, first position or None)"""
+        lowered = _lower(content)
+        results = {}
+        for index, starts in enumerate(self._occurrences(lowered)):
+            brand, pattern = self.brands[index], self.patterns[index]
+            if not pattern:
+                results[brand] = (count_word_with_apostrophe(brand, content), 0)
+                continue
+
+            count = 0
+            last_end = 0
+            for start in starts:
+                if start < last_end:
+                    continue
+                end = self._match_end(lowered, start, pattern)
+                if end is None:
+                    continue
+                count += 1
+                last_end = end
+            results[brand] = (count, starts[0] if starts else None)
+        return results
+
+
+if __name__ == "__main__":
+    # Micro-benchmark: single pass matcher vs the per-brand regex path
+    import random
+    import timeit
+
+    random.seed(0)
+    brands = [
+        "nike", "adidas", "new balance", "asics", "brooks", "saucony", "hoka",
+        "on running", "puma", "reebok", "under armour", "mizuno", "altra",
+        "salomon", "skechers", "fila", "vans", "converse", "newton", "karhu",
+        "topo", "inov-8", "merrell", "la sportiva", "scarpa", "diadora",
+        "le coq", "k-swiss", "lotto", "umbro",
+    ]  # fmt: skip
+    vocabulary = ["the", "best", "shoe", "for", "running", "is", "great", "and"]
+    words = []
+    for _ in range(3000):
+        if random.random() < 0.05:
+            suffix = "'s" if random.random() < 0.1 else ""
+            words.append(random.choice(brands).title() + suffix)
+        else:
+            words.append(random.choice(vocabulary))
+    content = " ".join(words) + "."
+
+    def regex_path():
+        content_lower = content.lower()
+        return {
+            brand: (
+                count_word_with_apostrophe(brand, content),
+                content_lower.find(brand),
+            )
+            for brand in brands
+        }
+
+    def matcher_path():
+        return BrandMatcher(brands).match(content)
+
+    expected = {b: (c, i if i != -1 else None) for b, (c, i) in regex_path().items()}
+    assert matcher_path() == expected
+
+    runs = 50
+    for name, func in (("regex", regex_path), ("matcher", matcher_path)):
+        seconds = timeit.timeit(func, number=runs) / runs
+        print(f"{name:>8}: {seconds * 1000:.2f} ms per document")
@@ -1,8 +1,15 @@
 from celery import Celery
+from celery.signals import worker_process_init, worker_process_shutdown
 import logging
 from src.infrastructure.redis_service import RedisBase, RedisLogHandler
 from src.config.config import REDIS_URL
+from src.infrastructure.dates import date_parser
+from src.infrastructure.domains import domain_normalizer
+from src.infrastructure.llm_cache import llm_cache
 from src.infrastructure.llm_service import LLMService
+from src.infrastructure.prompt_repository import prompt_repository
+from src.infrastructure.resources import resources
+from src.infrastructure.clickhouse import clickhouse_analytics
 
 app = Celery(
     "tasks",
@@ -44,6 +51,24 @@ app.conf.broker_heartbeat = 10  # Detect dead broker connections faster
 app.conf.broker_heartbeat_checkrate = 2
 
 
+# --- Per-process resources (Gemini, S3, DB engine) ---
+@worker_process_init.connect
+def init_worker_resources(**kwargs):
+    resources.init()
+
+
+@worker_process_shutdown.connect
+def close_worker_resources(**kwargs):
+    print(f"RESOURCES: {resources.stats()}")
+    print(f"PROMPT CACHE: {prompt_repository.stats()}")
+    print(f"LLM CACHE: {llm_cache.stats()}")
+    print(f"DOMAIN CACHE: {domain_normalizer.stats()}")
+    print(f"DATE CACHE: {date_parser.stats()}")
+    # write the rows still queued for ClickHouse before the process exits
+    clickhouse_analytics.close()
+    resources.close()
+
+
 @app.task
 def run_browser(
     process_id: str,
@@ -54,6 +79,7 @@ def run_browser(
     s3_key: str,
     languague: str,
     date: str,
+    extraction_mode: str = "split",
 ):
     redis_handler = None
     # Redis log wrapper
@@ -85,8 +111,14 @@ def run_browser(
         brand=brand,
         s3_key=s3_key,
         logger=task_logger,
+        extraction_mode=extraction_mode,
     )
     matching_scraper.main()
+    task_logger.info(f"Resources: {resources.stats()}")
+    task_logger.info(f"Prompt cache: {prompt_repository.stats()}")
+    task_logger.info(f"LLM cache: {llm_cache.stats()}")
+    task_logger.info(f"Domain cache: {domain_normalizer.stats()}")
+    task_logger.info(f"Date cache: {date_parser.stats()}")
     if redis_handler:
         task_logger.removeHandler(redis_handler)
         task_logger.removeHandler(console)
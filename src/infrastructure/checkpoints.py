@@ -0,0 +1,89 @@
+import json
+from typing import Any, Optional
+
+import redis
+
+from src.config import config
+
+KEY_PREFIX = "checkpoint:"
+PERSISTED = "persisted"
+
+_redis: Optional[redis.Redis] = None
+
+
+def redis_session() -> redis.Redis:
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis(
+            host=config.REDIS_HOST,
+            port=config.REDIS_PORT,
+            db=config.REDIS_DB,
+            decode_responses=True,
+        )
+    return _redis
+
+
+class StageCheckpoints:
+    """
+    Results of the completed stages of one task, in a Redis hash keyed by
+    its process_id. A redelivered task (worker lost, acks_late) loads them
+    instead of downloading and calling Gemini again.
+
+    Redis errors only cost the checkpoint: the stage is simply run again.
+    """
+
+    def __init__(
+        self,
+        process_id: str,
+        enabled: bool = config.CHECKPOINTS_ENABLED,
+        ttl: int = config.CHECKPOINT_TTL,
+    ) -> None:
+        self.key = KEY_PREFIX + process_id
+        self.enabled = enabled
+        self.ttl = ttl
+
+    def load(self, stage: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        try:
+            value = redis_session().hget(self.key, stage)
+        except Exception as e:
+            print(f"CHECKPOINTS: Redis error {e}")
+            return None
+        return json.loads(value) if value is not None else None
+
+    def save(self, stage: str, value: Any) -> None:
+        if not self.enabled:
+            return
+        try:
+            pipe = redis_session().pipeline()
+            pipe.hset(self.key, stage, json.dumps(value))
+            pipe.expire(self.key, self.ttl)
+            pipe.execute()
+        except Exception as e:
+            print(f"CHECKPOINTS: Redis error {e}")
+
+    def persisted(self) -> bool:
+        return bool(self.load(PERSISTED))
+
+    def mark_persisted(self) -> None:
+        """Drop the stage results, only remember that the task is saved"""
+        if not self.enabled:
+            return
+        try:
+            pipe = redis_session().pipeline()
+            pipe.delete(self.key)
+            pipe.hset(self.key, PERSISTED, json.dumps(True))
+            pipe.expire(self.key, self.ttl)
+            pipe.execute()
+        except Exception as e:
+            print(f"CHECKPOINTS: Redis error {e}")
+
+    def stages(self) -> list[str]:
+        if not self.enabled:
+            return []
+        try:
+            return list(redis_session().hkeys(self.key))
+        except Exception as e:
+            print(f"CHECKPOINTS: Redis error {e}")
+            return []
@@ -0,0 +1,671 @@
+"""
+Optional ClickHouse analytics backend.
+
+When CLICKHOUSE_ENABLED is set, DataBase hands every saved report row to
+`clickhouse_analytics`, which writes them to ReplacingMergeTree tables
+(deduplicated on id) from a background thread in batches, and routes the
+brand metrics and citation coverage queries here instead of Postgres.
+
+Every save also leaves a marker in the Postgres `clickhouse_outbox` table,
+in the same transaction. The writer drops the markers once the rows are
+inserted (retrying with backoff); until then, or for good if the insert
+failed, the report is read from Postgres. `replay` mirrors the reports
+still marked again and clears their markers.
+
+Usage:
+    python -m src.infrastructure.clickhouse migrate
+    python -m src.infrastructure.clickhouse backfill <brand_report_id>
+    python -m src.infrastructure.clickhouse replay
+"""
+
+import queue
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Iterable, Optional
+
+import clickhouse_connect
+from sqlalchemy import Engine, text
+
+from src.config import config
+from src.infrastructure.dates import parse_date
+from src.infrastructure.models import Brands, Citations, Sentiments, Token_Reports
+
+TABLES = {
+    "brands": """
+        CREATE TABLE IF NOT EXISTS brands (
+            id UInt64,
+            brand_report_id String,
+            brand String,
+            mention_count Int32,
+            position Int32,
+            date DateTime,
+            model LowCardinality(String),
+            prompt_id String,
+            s3_key String
+        )
+        ENGINE = ReplacingMergeTree
+        PARTITION BY toYYYYMM(date)
+        ORDER BY (brand_report_id, date, model, brand, id)
+    """,
+    "citations": """
+        CREATE TABLE IF NOT EXISTS citations (
+            id String,
+            brand_report_id String,
+            prompt_id String,
+            date DateTime,
+            model LowCardinality(String),
+            brand String,
+            rank Nullable(Int32),
+            title Nullable(String),
+            domain LowCardinality(String),
+            norm_url String,
+            s3_key String
+        )
+        ENGINE = ReplacingMergeTree
+        PARTITION BY toYYYYMM(date)
+        ORDER BY (brand_report_id, date, model, id)
+    """,
+    "sentiments": """
+        CREATE TABLE IF NOT EXISTS sentiments (
+            id String,
+            brand_report_id String,
+            prompt_id String,
+            date DateTime,
+            model LowCardinality(String),
+            brand String,
+            brand_model Nullable(String),
+            positive_phrases Array(String),
+            negative_phrases Array(String)
+        )
+        ENGINE = ReplacingMergeTree
+        PARTITION BY toYYYYMM(date)
+        ORDER BY (brand_report_id, date, model, id)
+    """,
+    "token_reports": """
+        CREATE TABLE IF NOT EXISTS token_reports (
+            id String,
+            brand_report_id String,
+            prompt_id String,
+            date DateTime,
+            model LowCardinality(String),
+            prompt_token_count Int64,
+            output_token_count Int64,
+            total_token_count Int64,
+            action LowCardinality(String),
+            cached Bool
+        )
+        ENGINE = ReplacingMergeTree
+        PARTITION BY toYYYYMM(date)
+        ORDER BY (brand_report_id, date, model, id)
+    """,
+}
+
+COLUMNS = {
+    "brands": [
+        "id",
+        "brand_report_id",
+        "brand",
+        "mention_count",
+        "position",
+        "date",
+        "model",
+        "prompt_id",
+        "s3_key",
+    ],
+    "citations": [
+        "id",
+        "brand_report_id",
+        "prompt_id",
+        "date",
+        "model",
+        "brand",
+        "rank",
+        "title",
+        "domain",
+        "norm_url",
+        "s3_key",
+    ],
+    "sentiments": [
+        "id",
+        "brand_report_id",
+        "prompt_id",
+        "date",
+        "model",
+        "brand",
+        "brand_model",
+        "positive_phrases",
+        "negative_phrases",
+    ],
+    "token_reports": [
+        "id",
+        "brand_report_id",
+        "prompt_id",
+        "date",
+        "model",
+        "prompt_token_count",
+        "output_token_count",
+        "total_token_count",
+        "action",
+        "cached",
+    ],
+}
+
+# Placeholders use ClickHouse server-side parameter binding
+WINDOW = """
+    brand_report_id = {brand_report_id:String}
+    AND date >= {start_date:DateTime}
+    AND date <= {end_date:DateTime}
+"""
+MODEL_FILTER = "AND model = {model:String}"
+BRAND = "lower(brand) = lower({brand:String})"
+
+# Postgres outbox: reports with saved rows not (yet) in ClickHouse
+OUTBOX_INSERT_SQL = text(
+    "INSERT INTO clickhouse_outbox (brand_report_id) "
+    "SELECT unnest(CAST(:brand_report_ids AS VARCHAR[])) RETURNING id"
+)
+OUTBOX_PENDING_SQL = text(
+    "SELECT 1 FROM clickhouse_outbox WHERE brand_report_id = :brand_report_id "
+    "LIMIT 1"
+)
+OUTBOX_RELEASE_SQL = text("DELETE FROM clickhouse_outbox WHERE id = ANY(:ids)")
+OUTBOX_REPORTS_SQL = text(
+    "SELECT brand_report_id, MAX(id) FROM clickhouse_outbox GROUP BY brand_report_id"
+)
+OUTBOX_REPLAYED_SQL = text(
+    "DELETE FROM clickhouse_outbox "
+    "WHERE brand_report_id = :brand_report_id AND id <= :high_water"
+)
+MIRRORED_TABLES = [Brands, Citations, Sentiments, Token_Reports]
+
+_STOP = object()
+
+
+def day_start(value: Optional[str]) -> Optional[datetime]:
+    """Midnight of the given date, like Postgres' CAST(value AS DATE)"""
+    parsed = parse_date(value)
+    if not parsed:
+        return None
+    return datetime(parsed.year, parsed.month, parsed.day)
+
+
+def rank_rows(rows: list) -> list[int]:
+    """Competition ranks ("1224") of rows already sorted by mentions"""
+    ranks = []
+    for index, row in enumerate(rows):
+        if index and row[-1] == rows[index - 1][-1]:
+            ranks.append(ranks[-1])
+        else:
+            ranks.append(index + 1)
+    return ranks
+
+
+class ClickHouseAnalytics:
+    """
+    ClickHouse mirror of the report tables.
+
+    Writes are queued and inserted by a background thread, per table, once
+    `batch_size` rows are pending or every `flush_interval` seconds, so
+    saving a report never waits on ClickHouse. A failed insert is retried
+    `retries` times, `retry_backoff` seconds apart (doubling).
+    """
+
+    def __init__(
+        self,
+        batch_size: int = config.CLICKHOUSE_BATCH_SIZE,
+        flush_interval: float = config.CLICKHOUSE_FLUSH_INTERVAL,
+        retries: int = config.CLICKHOUSE_INSERT_RETRIES,
+        retry_backoff: float = config.CLICKHOUSE_RETRY_BACKOFF,
+        client: Any = None,
+    ) -> None:
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self._client = client
+        # Postgres engine holding the outbox markers (set by migrate or enqueue)
+        self.outbox_engine: Optional[Engine] = None
+        self._queue: queue.Queue = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.counters: dict[str, int] = defaultdict(int)
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                # no session id: the client is shared by API threads and
+                # the writer thread
+                self._client = clickhouse_connect.get_client(
+                    host=config.CLICKHOUSE_HOST,
+                    port=int(config.CLICKHOUSE_PORT),
+                    username=config.CLICKHOUSE_USER,
+                    password=config.CLICKHOUSE_PASSWORD,
+                    database=config.CLICKHOUSE_DB,
+                    autogenerate_session_id=False,
+                )
+            return self._client
+
+    def migrate(self, outbox_engine: Optional[Engine] = None) -> None:
+        """Create the tables (run under the Postgres migration lock)"""
+        if outbox_engine is not None:
+            self.outbox_engine = outbox_engine
+        for name, statement in TABLES.items():
+            engine = self.client.query(
+                "SELECT engine FROM system.tables "
+                "WHERE database = currentDatabase() AND name = {name:String}",
+                parameters={"name": name},
+            ).result_rows
+            if engine and engine[0][0] != "ReplacingMergeTree":
+                # MergeTree tables from before the dedup on id; rows written
+                # in between fail and are retried by the writer
+                print(f"CLICKHOUSE: Converting {name} to ReplacingMergeTree")
+                self.client.command(f"RENAME TABLE {name} TO {name}_mergetree")
+                self.client.command(statement)
+                self.client.command(
+                    f"INSERT INTO {name} SELECT * FROM {name}_mergetree"
+                )
+                self.client.command(f"DROP TABLE {name}_mergetree")
+            else:
+                self.client.command(statement)
+
+    # ------------------------------WRITES------------------------------
+    def enqueue(self, table: str, rows: list[dict]) -> None:
+        """Queue rows (dicts with the table columns) for a batched insert"""
+        self.enqueue_many({table: rows})
+
+    def enqueue_many(
+        self,
+        tables: dict[str, list[dict]],
+        markers: Iterable[int] = (),
+        outbox_engine: Optional[Engine] = None,
+    ) -> None:
+        """
+        Queue the rows of several tables; the outbox `markers` (rows of
+        `outbox_engine`) are deleted once they, and everything flushed with
+        them, are inserted
+        """
+        if outbox_engine is not None and self.outbox_engine is None:
+            self.outbox_engine = outbox_engine
+        tables = {table: rows for table, rows in tables.items() if rows}
+        markers = list(markers)
+        if not tables and not markers:
+            return
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(
+                    target=self._run, name="clickhouse-writer", daemon=True
+                )
+                self._writer.start()
+        self.counters["queued"] += sum(len(rows) for rows in tables.values())
+        self._queue.put((tables, markers))
+
+    def _run(self) -> None:
+        pending: dict[str, list[dict]] = defaultdict(list)
+        markers: list[int] = []
+        last_flush = time.monotonic()
+        while True:
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            done = None
+            if item is _STOP:
+                self._flush_pending(pending, markers)
+                return
+            if isinstance(item, threading.Event):
+                done = item
+            elif item is not None:
+                tables, item_markers = item
+                for table, rows in tables.items():
+                    pending[table].extend(rows)
+                markers.extend(item_markers)
+
+            if (
+                done is not None
+                or time.monotonic() - last_flush >= self.flush_interval
+                or any(len(rows) >= self.batch_size for rows in pending.values())
+            ):
+                self._flush_pending(pending, markers)
+                last_flush = time.monotonic()
+            if done is not None:
+                done.set()
+
+    def _flush_pending(
+        self, pending: dict[str, list[dict]], markers: list[int]
+    ) -> None:
+        written = True
+        for table, rows in pending.items():
+            for start in range(0, len(rows), self.batch_size):
+                batch = rows[start : start + self.batch_size]
+                written = self._insert(table, batch) and written
+        pending.clear()
+        # after a failure the markers stay: those reports are read from
+        # Postgres until `replay` mirrors them again
+        if written and markers:
+            self._release(markers)
+        markers.clear()
+
+    def _insert(self, table: str, rows: list[dict]) -> bool:
+        columns = COLUMNS[table]
+        data = [[row.get(column) for column in columns] for row in rows]
+        for attempt in range(self.retries + 1):
+            try:
+                self.client.insert(table, data, column_names=columns)
+                self.counters["written"] += len(rows)
+                self.counters["batches"] += 1
+                return True
+            except Exception as e:
+                if attempt == self.retries:
+                    self.counters["failed"] += len(rows)
+                    print(
+                        f"CLICKHOUSE: Unable to insert {len(rows)} rows into "
+                        f"{table}: {e}"
+                    )
+                    return False
+                self.counters["retries"] += 1
+                time.sleep(self.retry_backoff * 2**attempt)
+        return False
+
+    def _release(self, markers: list[int]) -> None:
+        if self.outbox_engine is None:
+            return
+        try:
+            with self.outbox_engine.begin() as connection:
+                connection.execute(OUTBOX_RELEASE_SQL, {"ids": markers})
+        except Exception as e:
+            print(f"CLICKHOUSE: Unable to release the outbox markers: {e}")
+
+    def flush(self, timeout: Optional[float] = 30) -> None:
+        """Block until every queued row has been written"""
+        if self._writer is None or not self._writer.is_alive():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self) -> None:
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join(timeout=30)
+        self._writer = None
+
+    def stats(self) -> dict:
+        return dict(self.counters, pending=self._queue.qsize())
+
+    def mirror_report(self, database, brand_report_id: str) -> None:
+        """Queue every Postgres row of a report (deduplicated on id)"""
+        for table in MIRRORED_TABLES:
+            for batch in database.stream_report_rows(table, brand_report_id):
+                self.enqueue(table.__tablename__, batch)
+
+    def replay(self, database) -> dict[str, bool]:
+        """
+        Mirror again the reports left in the outbox (failed inserts, lost
+        workers), and clear their markers up to the high-water mark read
+        first. Returns whether each report was written.
+        """
+        with database.engine.connect() as connection:
+            reports = connection.execute(OUTBOX_REPORTS_SQL).all()
+        replayed = {}
+        for brand_report_id, high_water in reports:
+            failed = self.counters["failed"]
+            self.mirror_report(database, brand_report_id)
+            self.flush(timeout=None)
+            replayed[brand_report_id] = self.counters["failed"] == failed
+            if replayed[brand_report_id]:
+                with database.engine.begin() as connection:
+                    connection.execute(
+                        OUTBOX_REPLAYED_SQL,
+                        {"brand_report_id": brand_report_id, "high_water": high_water},
+                    )
+        return replayed
+
+    # ------------------------------QUERIES------------------------------
+    def query(self, sql: str, parameters: dict) -> list:
+        return self.client.query(sql, parameters=parameters).result_rows
+
+    def _window(
+        self, brand_report_id: str, start_date: str, end_date: str, model: str
+    ) -> Optional[tuple[str, dict]]:
+        start_day, end_day = day_start(start_date), day_start(end_date)
+        if not start_day or not end_day:
+            return None
+        parameters = dict(
+            brand_report_id=brand_report_id, start_date=start_day, end_date=end_day
+        )
+        if model != "all":
+            parameters["model"] = model
+            return WINDOW + MODEL_FILTER, parameters
+        return WINDOW, parameters
+
+    def get_brand_summary(
+        self,
+        brand: str,
+        brand_report_id: str,
+        end_date: str,
+        model: str,
+        start_date: str,
+    ) -> dict:
+        window = self._window(brand_report_id, start_date, end_date, model)
+        if not window:
+            return {"data": {"mentions": 0, "sov": 0.0, "coverage": 0, "position": 0}}
+        where, parameters = window
+        rows = self.query(
+            f"""
+            SELECT
+                sumIf(mention_count, {BRAND}) AS mentions,
+                sumIf(mention_count, {BRAND}) / nullIf(sum(mention_count), 0)
+                    * 100 AS sov,
+                uniqExact(s3_key) AS total_s3_keys,
+                uniqExactIf(s3_key, {BRAND} AND mention_count >= 1)
+                    AS mentioned_s3_keys,
+                sumIf(position, {BRAND}) AS total_position,
+                countIf({BRAND}) AS brand_count
+            FROM brands FINAL
+            WHERE {where}
+            """,
+            dict(parameters, brand=brand),
+        )
+        mentions, sov, total, mentioned, total_position, brand_count = rows[0]
+        return {
+            "data": {
+                "mentions": mentions,
+                "sov": round(float(sov), 2) if sov else 0.0,
+                "coverage": (mentioned / total) * 100 if total else 0,
+                "position": int(total_position / brand_count) if brand_count else 0,
+            }
+        }
+
+    def get_brand_mention(self, **kwargs) -> dict:
+        return {"data": self.get_brand_summary(**kwargs)["data"]["mentions"]}
+
+    def get_brand_sov(self, **kwargs) -> dict:
+        return {"data": self.get_brand_summary(**kwargs)["data"]["sov"]}
+
+    def get_brand_coverage(self, **kwargs) -> dict:
+        return {"data": self.get_brand_summary(**kwargs)["data"]["coverage"]}
+
+    def get_brand_position(self, **kwargs) -> dict:
+        return {"data": self.get_brand_summary(**kwargs)["data"]["position"]}
+
+    def get_brand_ranking(
+        self,
+        brand_report_id: str,
+        start_date: str,
+        end_date: str,
+        model: str,
+    ) -> list:
+        window = self._window(brand_report_id, start_date, end_date, model)
+        if not window:
+            return []
+        where, parameters = window
+        rows = self.query(
+            f"""
+            SELECT brand, sum(mention_count) AS total_mentions
+            FROM brands FINAL
+            WHERE {where}
+            GROUP BY brand
+            ORDER BY total_mentions DESC
+            """,
+            parameters,
+        )
+        return [
+            {"rank": rank, "brand_name": row[0], "mention_count": row[1]}
+            for rank, row in zip(rank_rows(rows), rows)
+        ]
+
+    def get_brand_ranking_over_time(
+        self,
+        brand_report_id: str,
+        start_date: str,
+        end_date: str,
+        model: str,
+        brand: Optional[str] = None,
+        fill_gaps: bool = False,
+    ) -> list:
+        window = self._window(brand_report_id, start_date, end_date, model)
+        if not window:
+            return []
+        where, parameters = window
+        brand_filter = f"WHERE {BRAND}" if brand else ""
+        if brand:
+            parameters["brand"] = brand
+        rows = self.query(
+            f"""
+            SELECT day, brand, rank, total_mentions
+            FROM (
+                SELECT
+                    toDate(date) AS day,
+                    brand,
+                    sum(mention_count) AS total_mentions,
+                    rank() OVER (
+                        PARTITION BY day ORDER BY total_mentions DESC
+                    ) AS rank
+                FROM brands FINAL
+                WHERE {where}
+                GROUP BY day, brand
+            )
+            {brand_filter}
+            ORDER BY day ASC, rank ASC, brand
+            """,
+            parameters,
+        )
+
+        brand_points: dict[str, dict[date, dict]] = defaultdict(dict)
+        for day, brand_name, rank, mentions in rows:
+            brand_points[brand_name][day] = {
+                "date": day,
+                "rank": rank,
+                "mention_count": mentions,
+            }
+
+        days = []
+        if fill_gaps:
+            day = parameters["start_date"].date()
+            end_day = parameters["end_date"].date()
+            while day < end_day:
+                days.append(day)
+                day += timedelta(days=1)
+            # the window only holds the rows stamped at end_date midnight
+            if any(end_day in points for points in brand_points.values()):
+                days.append(end_day)
+        return [
+            {
+                "brand_name": brand_name,
+                "points": (
+                    [
+                        points.get(day, {"date": day, "rank": None, "mention_count": 0})
+                        for day in days
+                    ]
+                    if fill_gaps
+                    else list(points.values())
+                ),
+            }
+            for brand_name, points in brand_points.items()
+        ]
+
+    def get_domain_citation_coverage(
+        self,
+        brand_report_id: str,
+        domain: str,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        model: str = "all",
+        limit: int = 50,
+    ) -> dict:
+        filters = ["brand_report_id = {brand_report_id:String}"]
+        parameters = dict(brand_report_id=brand_report_id, domain=domain, limit=limit)
+        start_date_node = parse_date(start_date)
+        if start_date_node:
+            filters.append("date >= {start_date:DateTime}")
+            parameters["start_date"] = start_date_node
+        end_date_node = parse_date(end_date)
+        if end_date_node:
+            filters.append("date <= {end_date:DateTime}")
+            parameters["end_date"] = end_date_node
+        if model.lower() != "all":
+            filters.append(MODEL_FILTER.removeprefix("AND "))
+            parameters["model"] = model
+        where = " AND ".join(filters)
+
+        citation, total, with_domain = self.query(
+            f"""
+            SELECT
+                countIf(domain = {{domain:String}}),
+                uniqExact(s3_key),
+                uniqExactIf(s3_key, domain = {{domain:String}})
+            FROM citations FINAL
+            WHERE {where}
+            """,
+            parameters,
+        )[0]
+        url_rows = self.query(
+            f"""
+            SELECT norm_url, count() AS count
+            FROM citations FINAL
+            WHERE {where} AND domain = {{domain:String}}
+            GROUP BY norm_url
+            ORDER BY count DESC, norm_url
+            LIMIT {{limit:UInt32}}
+            """,
+            parameters,
+        )
+        return {
+            "citation": citation,
+            "coverage": round((with_domain / total) * 100, 2) if total else 0.0,
+            "url_data": [
+                {"normalised_url": url, "count": count, "domain": domain}
+                for url, count in url_rows
+            ],
+        }
+
+
+clickhouse_analytics = ClickHouseAnalytics()
+
+
+if __name__ == "__main__":
+    from src.infrastructure.database import DataBase, create_db_engine
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ("migrate", "backfill", "replay"):
+        print(__doc__)
+        sys.exit(1)
+
+    # the primary only: a lagging replica would miss the newest rows
+    database = DataBase(engine=create_db_engine())
+    database.analytics = clickhouse_analytics
+    database.migrate()
+    if sys.argv[1] == "backfill":
+        # Copy one report from Postgres (run once, before enabling dual-write)
+        clickhouse_analytics.mirror_report(database, sys.argv[2])
+        clickhouse_analytics.close()
+    elif sys.argv[1] == "replay":
+        for brand_report_id, written in clickhouse_analytics.replay(database).items():
+            print(f"{brand_report_id}: {'replayed' if written else 'FAILED'}")
+        clickhouse_analytics.close()
+    print(f"CLICKHOUSE: {clickhouse_analytics.stats()}")
@@ -3,33 +3,371 @@ import sys
 
 sys.path.append("..")
 
+import copy
 import json
-from datetime import date, datetime, timedelta
-from typing import List, Optional
+import threading
+import time
+from datetime import datetime
+from typing import Iterator, List, Optional
 
-import dateparser
-from sqlmodel import Session, and_, create_engine, select, text
+from sqlalchemy import JSON, Connection, Engine, QueuePool, exc
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import Session, SQLModel, create_engine, select, text
 
 from src.config import config
+from src.infrastructure.clickhouse import (
+    OUTBOX_INSERT_SQL,
+    OUTBOX_PENDING_SQL,
+    ClickHouseAnalytics,
+    clickhouse_analytics,
+)
+from src.infrastructure.dates import parse_date
+from src.infrastructure.migrations import migrate, require_head
+from src.infrastructure.partitions import partition_manager
+from src.infrastructure.prompt_repository import prompt_repository
+from src.infrastructure.queries import (
+    REPLICA_LAG_SQL,
+    brand_coverage_result,
+    brand_coverage_stmt,
+    brand_mention_result,
+    brand_mention_stmt,
+    brand_position_result,
+    brand_position_stmt,
+    brand_ranking_over_time_result,
+    brand_ranking_over_time_stmt,
+    brand_ranking_result,
+    brand_ranking_stmt,
+    brand_sov_result,
+    brand_sov_stmt,
+    brand_summary_result,
+    brand_summary_stmt,
+    db_url,
+    domain_coverage_result,
+    domain_coverage_stmts,
+    latest_date_stmt,
+    prompt_rows_stmt,
+    report_dates_stmt,
+    report_output_stmt,
+    report_rows_stmt,
+    reports_stmt,
+    unique_report_dates,
+)
+from src.infrastructure.rollup import update_daily_metrics
 from src.infrastructure.models import (
     Brands,
     Citations,
     Output_Reports,
     Sentiments,
-    SQLModel,
     Token_Reports,
 )
 
 
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that counts checkouts, waits and timeouts for sizing"""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.counters: dict[str, int] = defaultdict(int)
+        self.wait_seconds = 0.0
+        self.peak_checked_out = 0
+
+    def _do_get(self):
+        # Same condition QueuePool uses to block on the queue
+        must_wait = (
+            self._max_overflow > -1
+            and self.overflow() >= self._max_overflow
+            and self.checkedin() == 0
+        )
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.counters["timeouts"] += 1
+            raise
+        finally:
+            if must_wait:
+                self.counters["waits"] += 1
+                self.wait_seconds += time.perf_counter() - start
+        self.counters["checkouts"] += 1
+        self.peak_checked_out = max(self.peak_checked_out, self.checkedout())
+        return connection
+
+    def stats(self) -> dict:
+        return {
+            "pool_size": self.size(),
+            "max_overflow": self._max_overflow,
+            "checked_out": self.checkedout(),
+            "checked_in": self.checkedin(),
+            "overflow": max(self.overflow(), 0),
+            "peak_checked_out": self.peak_checked_out,
+            "checkouts": self.counters["checkouts"],
+            "waits": self.counters["waits"],
+            "wait_seconds": round(self.wait_seconds, 4),
+            "timeouts": self.counters["timeouts"],
+        }
+
+
+class ReplicaLag:
+    """
+    Last measured lag of the read replica, refreshed at most every
+    `check_interval` seconds, and the number of reads routed to each side.
+    The replica may have fallen behind since the measure, so its staleness
+    is taken as the lag plus the age of the measure.
+    """
+
+    def __init__(
+        self, check_interval: float = config.DB_READ_LAG_CHECK_INTERVAL
+    ) -> None:
+        self.check_interval = check_interval
+        self.lag = float("inf")
+        self._checked_at = float("-inf")
+        self._measured_at = float("-inf")
+        self._lock = threading.Lock()
+        self.counters: dict[str, int] = defaultdict(int)
+
+    def due(self) -> bool:
+        """True for the one caller that should measure the lag now"""
+        with self._lock:
+            now = time.monotonic()
+            if now - self._checked_at < self.check_interval:
+                return False
+            self._checked_at = now
+            return True
+
+    def update(self, lag: Optional[float]) -> None:
+        # unknown lag (or an unreachable replica) counts as too stale
+        self.lag = float(lag) if lag is not None else float("inf")
+        self._measured_at = time.monotonic()
+
+    def staleness(self) -> float:
+        """Upper bound of the replica's lag now"""
+        return self.lag + (time.monotonic() - self._measured_at)
+
+    def route(self, max_staleness: float) -> str:
+        target = "replica" if self.staleness() <= max_staleness else "primary"
+        with self._lock:
+            self.counters[target] += 1
+        return target
+
+    def stats(self) -> dict:
+        return {
+            "lag_seconds": self.lag if self.lag != float("inf") else None,
+            "replica_reads": self.counters["replica"],
+            "primary_reads": self.counters["primary"],
+        }
+
+
+def create_db_engine(dsn: Optional[str] = None, **kwargs) -> Engine:
+    """
+    Create a pooled engine (on `dsn`, or on the DB_* settings); keyword
+    arguments override the pool settings
+    """
+    options = dict(
+        poolclass=InstrumentedQueuePool,
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_timeout=config.DB_POOL_TIMEOUT,
+        pool_recycle=config.DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+        query_cache_size=config.DB_QUERY_CACHE_SIZE,
+        # server-side prepared statements after N executions of a query
+        connect_args={"prepare_threshold": config.DB_PREPARE_THRESHOLD},
+    )
+    options.update(kwargs)
+    return create_engine(db_url("psycopg", dsn), **options)
+
+
+def copy_rows(connection: Connection, table: type[SQLModel], rows: list[dict]) -> list:
+    """
+    COPY rows into a temporary staging table, then move them into `table`
+    with INSERT ... SELECT ... ON CONFLICT DO NOTHING (no conflict target:
+    the partitioned tables are keyed on (id, date)). Returns the inserted ids.
+    """
+    name = table.__tablename__
+    columns = list(table.__table__.columns)
+    json_columns = {c.name for c in columns if isinstance(c.type, JSON)}
+    column_list = ", ".join(c.name for c in columns)
+
+    connection.exec_driver_sql(
+        f"CREATE TEMP TABLE IF NOT EXISTS staging_{name} "
+        f"(LIKE {name} INCLUDING DEFAULTS) ON COMMIT DROP"
+    )
+    cursor = connection.connection.driver_connection.cursor()
+    with cursor.copy(f"COPY staging_{name} ({column_list}) FROM STDIN") as copy:
+        for row in rows:
+            copy.write_row(
+                [
+                    (json.dumps(row[c.name]) if c.name in json_columns else row[c.name])
+                    for c in columns
+                ]
+            )
+    inserted = (
+        connection.exec_driver_sql(
+            f"INSERT INTO {name} ({column_list}) "
+            f"SELECT {column_list} FROM staging_{name} "
+            f"ON CONFLICT DO NOTHING RETURNING id"
+        )
+        .scalars()
+        .all()
+    )
+    connection.exec_driver_sql(f"TRUNCATE staging_{name}")
+    return inserted
+
+
 class DataBase:
-    def __init__(self) -> None:
-        self.engine = create_engine(
-            f"postgresql+psycopg://{config.DB_USER}:{config.DB_PASSWORD}@{config.DB_HOST}:5432/{config.DB_NAME}"
+    def __init__(
+        self, engine: Optional[Engine] = None, read_engine: Optional[Engine] = None
+    ) -> None:
+        self.analytics: Optional[ClickHouseAnalytics] = (
+            clickhouse_analytics if config.CLICKHOUSE_ENABLED else None
+        )
+        # An engine handed in by the caller is shared (and already checked),
+        # so only a self-built engine checks the schema.
+        if engine is None:
+            self.engine = create_db_engine()
+            self.require_schema()
+            if read_engine is None and config.DB_READ_DSN:
+                read_engine = create_db_engine(config.DB_READ_DSN)
+        else:
+            self.engine = engine
+        # get_* reads go to the replica (when set), writes to the primary
+        self.read_engine = read_engine
+        self.replica_lag = ReplicaLag()
+        self.max_staleness = config.DB_READ_MAX_STALENESS
+
+    def fresh(self, max_staleness: float) -> "DataBase":
+        """
+        Same database, but its reads only use the replica while it lags at
+        most `max_staleness` seconds (0: only a fully caught up replica)
+        """
+        database = copy.copy(self)
+        database.max_staleness = max_staleness
+        return database
+
+    def _read_engine(self) -> Engine:
+        if self.read_engine is None:
+            return self.engine
+        if self.replica_lag.due():
+            try:
+                with self.read_engine.connect() as connection:
+                    lag = connection.execute(REPLICA_LAG_SQL).scalar()
+            except exc.SQLAlchemyError as e:
+                print(f"DATABASE: Read replica unavailable: {e}")
+                lag = None
+            self.replica_lag.update(lag)
+        if self.replica_lag.route(self.max_staleness) == "replica":
+            return self.read_engine
+        return self.engine
+
+    def dispose(self) -> None:
+        """Close the pooled connections (primary and replica)"""
+        self.engine.dispose()
+        if self.read_engine is not None:
+            self.read_engine.dispose()
+
+    def pool_stats(self) -> dict:
+        stats = getattr(self.engine.pool, "stats", None)
+        result = stats() if stats else {"status": self.engine.pool.status()}
+        if self.read_engine is not None:
+            stats = getattr(self.read_engine.pool, "stats", None)
+            result["replica"] = dict(
+                stats() if stats else {"status": self.read_engine.pool.status()},
+                **self.replica_lag.stats(),
+            )
+        return result
+
+    def require_schema(self) -> None:
+        """Refuse to start against a database that is not migrated"""
+        require_head(self.engine)
+
+    def migrate(self) -> list[int]:
+        """
+        Apply pending schema migrations, then the partition / ClickHouse
+        maintenance (from the migrations CLI, never on process start)
+        """
+        maintenance = [partition_manager.maintain]
+        if self.analytics:
+            maintenance.append(self.analytics.migrate)
+        return migrate(self.engine, maintenance=maintenance)
+
+    def _outbox(self, session: Session, **tables: list[dict]) -> list[int]:
+        """
+        Mark the reports of the rows as not yet in ClickHouse, in the save
+        transaction (when it is enabled)
+        """
+        if not self.analytics:
+            return []
+        report_ids = sorted(
+            {row["brand_report_id"] for rows in tables.values() for row in rows}
+        )
+        if not report_ids:
+            return []
+        return list(
+            session.execute(
+                OUTBOX_INSERT_SQL, {"brand_report_ids": report_ids}
+            ).scalars()
         )
-        self.create_all_tables()
 
-    def create_all_tables(self):
-        SQLModel.metadata.create_all(self.engine)
+    def _mirror(self, markers: list[int], **tables: list[dict]) -> None:
+        """Queue committed rows for ClickHouse (when it is enabled)"""
+        if not self.analytics:
+            return
+        self.analytics.enqueue_many(tables, markers, self.engine)
+
+    def _use_analytics(self, brand_report_id: str) -> bool:
+        """
+        Whether to read a report from ClickHouse: only once all its rows
+        are there (no outbox marker left, checked on the primary)
+        """
+        if not self.analytics:
+            return False
+        with self.engine.connect() as connection:
+            pending = connection.execute(
+                OUTBOX_PENDING_SQL, {"brand_report_id": brand_report_id}
+            ).first()
+        return pending is None
+
+    def _ensure_partitions(self, **tables: list[SQLModel]) -> None:
+        """Create the monthly partitions the rows fall in, before saving"""
+        for table, items in tables.items():
+            partition_manager.ensure(self.engine, table, (i.date for i in items))
+
+    def bulk_insert(
+        self, session: Session, table: type[SQLModel], items: list[SQLModel]
+    ) -> list[dict]:
+        """
+        Insert table model objects without the ORM unit of work: one
+        multi-row INSERT (or a COPY for DB_COPY_THRESHOLD rows and more),
+        skipping rows whose primary key already exists. Returns the rows
+        actually inserted.
+        """
+        if not items:
+            return []
+        connection = session.connection()
+        if table is Brands:
+            # serial ids are reserved up front instead of RETURNING per row
+            missing = [item for item in items if item.id is None]
+            ids = connection.execute(
+                text(
+                    "SELECT nextval(pg_get_serial_sequence('brands', 'id')) "
+                    "FROM generate_series(1, :count)"
+                ),
+                {"count": len(missing)},
+            ).scalars()
+            for item, brand_id in zip(missing, ids):
+                item.id = brand_id
+
+        rows = [item.model_dump() for item in items]
+        if len(rows) >= config.DB_COPY_THRESHOLD:
+            inserted = set(copy_rows(connection, table, rows))
+        else:
+            inserted = set(
+                connection.execute(
+                    pg_insert(table).on_conflict_do_nothing().returning(table.id),
+                    rows,
+                ).scalars()
+            )
+        return [row for row in rows if row["id"] in inserted]
 
     def save_all(
         self,
@@ -37,37 +375,73 @@ class DataBase:
         citations: list[Citations],
         sentiments: list[Sentiments],
         output_report: Output_Reports,
-    ):
+        token_reports: Optional[list[Token_Reports]] = None,
+    ) -> bool:
+        """
+        Save the results of one report in one transaction. Idempotent: a
+        report whose output_reports id is already saved is skipped (returns
+        False), so a retried task never writes its rows twice.
+        """
         print("Bulk Saving all data …")
+        self._ensure_partitions(brands=brands, citations=citations)
         with Session(self.engine) as session:
-            session.add_all(brands)
-            session.add_all(citations)
-            session.add_all(sentiments)
-            session.add(output_report)
+            # the report row goes first: it locks the id against a
+            # concurrent retry and tells whether the report is already saved
+            saved = session.execute(
+                pg_insert(Output_Reports)
+                .values(output_report.model_dump())
+                .on_conflict_do_nothing()
+                .returning(Output_Reports.id)
+            ).first()
+            if saved is None:
+                print(f"Report {output_report.id} already saved, skipping")
+                session.rollback()
+                return False
+            update_daily_metrics(session.connection(), brands)
+            rows = dict(
+                brands=self.bulk_insert(session, Brands, brands),
+                citations=self.bulk_insert(session, Citations, citations),
+                sentiments=self.bulk_insert(session, Sentiments, sentiments),
+                token_reports=self.bulk_insert(
+                    session, Token_Reports, token_reports or []
+                ),
+            )
+            markers = self._outbox(session, **rows)
             session.commit()
             session.close()
+        self._mirror(markers, **rows)
+        return True
 
     def save_brands(self, brands: list[Brands]) -> None:
         """Bulk-insert a list of record dicts into the brands table."""
         print("Saving analysis data …")
+        self._ensure_partitions(brands=brands)
         with Session(self.engine) as session:
-            session.add_all(brands)
+            update_daily_metrics(session.connection(), brands)
+            rows = self.bulk_insert(session, Brands, brands)
+            markers = self._outbox(session, brands=rows)
             session.commit()
             session.close()
+        self._mirror(markers, brands=rows)
 
     def save_citations(self, citations: list[Citations]) -> None:
         print("Saving citations")
+        self._ensure_partitions(citations=citations)
         with Session(self.engine) as session:
-            session.add_all(citations)
+            rows = self.bulk_insert(session, Citations, citations)
+            markers = self._outbox(session, citations=rows)
             session.commit()
             session.close()
+        self._mirror(markers, citations=rows)
 
     def save_sentiments(self, sentiments: list[Sentiments]) -> None:
         print("Saving Sentiments")
         with Session(self.engine) as session:
-            session.add_all(sentiments)
+            rows = self.bulk_insert(session, Sentiments, sentiments)
+            markers = self._outbox(session, sentiments=rows)
             session.commit()
             session.close()
+        self._mirror(markers, sentiments=rows)
 
     def save_output_reports(self, output_report: Output_Reports) -> None:
         print("Saving Output report")
@@ -76,29 +450,25 @@ class DataBase:
             session.commit()
             session.close()
 
-    def save_token_usage(self, token_data: Token_Reports) -> None:
+    def save_token_usage(self, token_reports: list[Token_Reports]) -> None:
         print("Saving token usage")
         with Session(self.engine) as session:
-            session.add(token_data)
+            rows = self.bulk_insert(session, Token_Reports, token_reports)
+            markers = self._outbox(session, token_reports=rows)
             session.commit()
             session.close()
+        self._mirror(markers, token_reports=rows)
 
     def get_reports(
         self, brand_report_id: str, limit: int = 20, offset: int = 0
     ) -> list[dict]:
         """Get all the reports from the output_reports table"""
-        with Session(self.engine) as session:
-            stmt = (
-                select(Output_Reports)
-                .where(Output_Reports.brand_report_id == brand_report_id)
-                .limit(limit)
-                .offset(offset)
-            )
-            results = session.exec(stmt).all()
+        with Session(self._read_engine()) as session:
+            stmt = reports_stmt(brand_report_id, limit, offset)
+            results = session.execute(stmt).mappings().all()
             session.close()
 
-        reports = [json.loads(result.model_dump_json()) for result in results]
-        return reports
+        return [dict(result) for result in results]
 
     def get_report_outputs(
         self,
@@ -118,45 +488,27 @@ class DataBase:
         Returns:
             dict | None: Dictionary with 'snapshot' and 'markdown' keys, or None if no match is found.
         """
-        with Session(self.engine) as session:
+        with Session(self._read_engine()) as session:
             # If no date is provided, retrieve the most recent date for this brand_report_id
             if date is None:
-                latest_date = session.exec(
-                    select(Output_Reports.date)
-                    .where(
-                        and_(
-                            Output_Reports.brand_report_id == brand_report_id,
-                            Output_Reports.prompt_id == prompt_id,
-                        )
+                report_date = session.execute(
+                    latest_date_stmt(
+                        Output_Reports,
+                        brand_report_id=brand_report_id,
+                        prompt_id=prompt_id,
                     )
-                    .order_by(Output_Reports.date.desc())
-                ).first()
-
-                if not latest_date:
-                    return None
-
-                date = latest_date
-
-            print(date)
-            # Base query
-            statement = select(Output_Reports).where(
-                Output_Reports.brand_report_id == brand_report_id,
-                Output_Reports.prompt_id == prompt_id,
-                Output_Reports.date == date,
-            )
-
-            # Apply optional model filter
-            if model.lower() != "all":
-                statement = statement.where(Output_Reports.model == model)
-
-            result = session.exec(statement).first()
+                ).scalar()
+            else:
+                report_date = parse_date(date)
+            if not report_date:
+                return None
 
+            print(report_date)
+            stmt = report_output_stmt(brand_report_id, prompt_id, report_date, model)
+            result = session.execute(stmt).mappings().first()
             session.close()
 
-            if not result:
-                return None
-
-            return {"snapshot": result.snapshot, "markdown": result.markdown}
+        return dict(result) if result else None
 
     def get_citations(
         self,
@@ -175,32 +527,7 @@ class DataBase:
         Returns:
             list[dict]: List of citation objects as dictionaries.
         """
-        with Session(self.engine) as session:
-            if date is None:
-                latest_date = session.exec(
-                    select(Citations.date)
-                    .where(Citations.prompt_id == prompt_id)
-                    .order_by(Citations.date.desc())
-                ).first()
-
-                if not latest_date:
-                    return []
-
-                date = latest_date
-
-            statement = select(Citations).where(
-                Citations.prompt_id == prompt_id,
-                Citations.date == date,
-            )
-
-            if model.lower() != "all":
-                statement = statement.where(Citations.model == model)
-
-            results = session.exec(statement).all()
-            session.close()
-
-        citations = [json.loads(result.model_dump_json()) for result in results]
-        return citations
+        return self._get_prompt_rows(Citations, prompt_id, date, model)
 
     def get_citations_by_report(
         self,
@@ -223,27 +550,14 @@ class DataBase:
             list[dict]: List of citation objects.
         """
 
-        with Session(self.engine) as session:
-            statement = select(Citations).where(
-                Citations.brand_report_id == brand_report_id
+        with Session(self._read_engine()) as session:
+            statement = report_rows_stmt(
+                Citations, brand_report_id, start_date, end_date, model
             )
-
-            # ---- Date filtering ----
-            if start_date:
-                statement = statement.where(Citations.date >= start_date)
-
-            if end_date:
-                statement = statement.where(Citations.date <= end_date)
-
-            # ---- Model filtering ----
-            if model.lower() != "all":
-                statement = statement.where(Citations.model == model)
-
-            results = session.exec(statement).all()
+            results = session.execute(statement).mappings().all()
             session.close()
 
-        citations = [json.loads(result.model_dump_json()) for result in results]
-        return citations
+        return [dict(result) for result in results]
 
     def get_sentiments(
         self,
@@ -262,32 +576,31 @@ class DataBase:
         Returns:
             list[dict]: List of sentiment analysis results as dictionaries.
         """
-        with Session(self.engine) as session:
-            if date is None:
-                latest_date = session.exec(
-                    select(Sentiments.date)
-                    .where(Sentiments.prompt_id == prompt_id)
-                    .order_by(Sentiments.date.desc())
-                ).first()
+        return self._get_prompt_rows(Sentiments, prompt_id, date, model)
 
-                if not latest_date:
-                    return []
-
-                date = latest_date
-
-            statement = select(Sentiments).where(
-                Sentiments.prompt_id == prompt_id,
-                Sentiments.date == date,
-            )
-
-            if model.lower() != "all":
-                statement = statement.where(Sentiments.model == model)
+    def _get_prompt_rows(
+        self,
+        table: type[SQLModel],
+        prompt_id: str,
+        date: Optional[str] = None,
+        model: str = "all",
+    ) -> list[dict]:
+        """Rows of a prompt on `date` (or on its most recent date)"""
+        with Session(self._read_engine()) as session:
+            if date is None:
+                report_date = session.execute(
+                    latest_date_stmt(table, prompt_id=prompt_id)
+                ).scalar()
+            else:
+                report_date = parse_date(date)
+            if not report_date:
+                return []
 
-            results = session.exec(statement).all()
+            statement = prompt_rows_stmt(table, prompt_id, report_date, model)
+            results = session.execute(statement).mappings().all()
             session.close()
 
-        sentiments = [json.loads(result.model_dump_json()) for result in results]
-        return sentiments
+        return [dict(result) for result in results]
 
     def get_report_dates(
         self, prompt_id: str, max_dates: str = "7 days ago"
@@ -303,52 +616,67 @@ class DataBase:
         Returns:
             list[str]: List of unique dates formatted as "YYYY-MM-DD", sorted descending.
         """
-        with Session(self.engine) as session:
-            # Get today's date
-            today = datetime.today().date()
-
-            # Convert the provided max_dates string into a date object
-            start_date_node = dateparser.parse(max_dates)
-            start_date = (
-                start_date_node.date()
-                if start_date_node
-                else today - timedelta(days=7)  # Fallback if parsing fails
-            )
-
-            # Build the SQL query to fetch all dates >= start_date
-            statement = (
-                select(Output_Reports.date)
-                .where(
-                    and_(
-                        Output_Reports.date >= start_date,
-                        Output_Reports.prompt_id == prompt_id,
-                    )
-                )
-                .order_by(Output_Reports.date.desc())
-            )
+        with Session(self._read_engine()) as session:
+            statement = report_dates_stmt(prompt_id, max_dates)
+            results = session.execute(statement).scalars().all()
+            session.close()
 
-            results = session.exec(
-                statement
-            ).all()  # Returns a list of date or string values
-
-            # Remove duplicates and sort in descending order
-            unique_dates = sorted(set(results), reverse=True)
-
-            # Normalize all values into "YYYY-MM-DD" formatted strings
-            unique_dates_str = [
-                (
-                    unique_date.strftime("%Y-%m-%d")
-                    if isinstance(unique_date, (datetime, date))
-                    else str(unique_date)
-                )
-                for unique_date in unique_dates
-            ]
+        return unique_report_dates(results)
 
-            session.close()
+    # ------------------------EXPORT-----------------------------------
+    def stream_report_rows(
+        self,
+        table: type[SQLModel],
+        brand_report_id: str,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        model: str = "all",
+        batch_size: int = config.DB_EXPORT_BATCH_SIZE,
+    ) -> Iterator[list[dict]]:
+        """
+        Yield the rows of a report table in batches of `batch_size`, read
+        through a server-side cursor so memory does not grow with the result.
+        """
+        statement = report_rows_stmt(
+            table, brand_report_id, start_date, end_date, model
+        ).order_by(table.date, table.id)
 
-        return unique_dates_str
+        with Session(self._read_engine()) as session:
+            result = session.execute(statement.execution_options(yield_per=batch_size))
+            for partition in result.mappings().partitions():
+                yield [dict(row) for row in partition]
 
     # ------------------------DOMAIN-----------------------------------
+    def get_domain_citation_coverage(
+        self,
+        brand_report_id: str,
+        domain: str,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        model: str = "all",
+        limit: int = 50,
+    ) -> dict:
+        """
+        Citation count and document coverage of an (already normalized)
+        domain, plus its `limit` most cited URLs.
+        """
+        if self._use_analytics(brand_report_id):
+            return self.analytics.get_domain_citation_coverage(
+                brand_report_id=brand_report_id,
+                domain=domain,
+                start_date=start_date,
+                end_date=end_date,
+                model=model,
+                limit=limit,
+            )
+        totals_stmt, urls_stmt = domain_coverage_stmts(
+            brand_report_id, domain, start_date, end_date, model, limit
+        )
+        with Session(self._read_engine()) as session:
+            totals = session.execute(totals_stmt).one()
+            url_rows = session.execute(urls_stmt).fetchall()
+
+        return domain_coverage_result(domain, totals, url_rows)
 
     def get_markdown_s3_keys(
         self,
@@ -359,7 +687,7 @@ class DataBase:
     ):
         """Get the citation for a particular domain"""
         s3_keys = []
-        with Session(self.engine) as session:
+        with Session(self._read_engine()) as session:
             # get all s3 keys of the selected brand_report_id
             stmt = select(Output_Reports.markdown).where(
                 Output_Reports.brand_report_id == brand_report_id
@@ -379,12 +707,8 @@ class DataBase:
 
     # ------------------------PROMPT-------------------------
     def get_prompt(self, prompt_id: str) -> str:
-        with Session(self.engine) as session:
-            query = text(
-                f"SELECT prompt FROM schedules WHERE prompt_id = '{prompt_id}'"
-            )
-            result = session.execute(query).scalar()
-            return str(result) if result is not None else ""
+        # on the primary: a prompt created a moment ago must be found
+        return prompt_repository.get_prompt(self.engine, prompt_id)
 
     # --------------------------ANALYTICS------------------------------
     def get_brand_mention(
@@ -395,30 +719,18 @@ class DataBase:
         model: str,
         start_date: str,
     ) -> dict:
-        model_filter = "AND model = :model" if model != "all" else ""
-        stmt = text(
-            f"""
-            SELECT COALESCE(SUM(mention_count), 0) AS total_mentions
-            FROM brands
-            WHERE LOWER(brand)    = LOWER(:brand)
-              AND brand_report_id = :brand_report_id
-              AND date            >= CAST(:start_date AS DATE)
-              AND date            <= CAST(:end_date AS DATE)
-              {model_filter}
-        """
-        )
-        params = dict(
-            brand=brand,
-            brand_report_id=brand_report_id,
-            start_date=start_date,
-            end_date=end_date,
-        )
-        if model != "all":
-            params["model"] = model
-
-        with Session(self.engine) as session:
-            row = session.exec(stmt.bindparams(**params)).first()
-            return {"data": row[0] if row else 0}
+        if self._use_analytics(brand_report_id):
+            return self.analytics.get_brand_mention(
+                brand=brand,
+                brand_report_id=brand_report_id,
+                end_date=end_date,
+                model=model,
+                start_date=start_date,
+            )
+        stmt = brand_mention_stmt(brand, brand_report_id, start_date, end_date, model)
+        with Session(self._read_engine()) as session:
+            row = session.execute(stmt).first()
+        return brand_mention_result(row)
 
     def get_brand_sov(
         self,
@@ -428,41 +740,18 @@ class DataBase:
         model: str,
         start_date: str,
     ) -> dict:
-        model_filter = "AND model = :model" if model != "all" else ""
-        stmt = text(
-            f"""
-            SELECT
-                (
-                    SUM(
-                        CASE
-                            WHEN LOWER(brand) = LOWER(:brand)
-                            THEN COALESCE(mention_count, 0)::FLOAT
-                            ELSE 0
-                        END
-                    )
-                    /
-                    NULLIF(SUM(COALESCE(mention_count, 0)::FLOAT), 0)
-                ) * 100 AS sov
-            FROM brands
-            WHERE brand_report_id = :brand_report_id
-                AND date >= CAST(:start_date AS DATE)
-                AND date <= CAST(:end_date AS DATE)
-                {model_filter}
-        """
-        )
-        params = dict(
-            brand=brand,
-            brand_report_id=brand_report_id,
-            start_date=start_date,
-            end_date=end_date,
-        )
-        if model != "all":
-            params["model"] = model
-
-        with Session(self.engine) as session:
-            row = session.exec(stmt.bindparams(**params)).first()
-            sov = row[0] if row else None
-            return {"data": round(float(sov), 2) if sov else 0.0}
+        if self._use_analytics(brand_report_id):
+            return self.analytics.get_brand_sov(
+                brand=brand,
+                brand_report_id=brand_report_id,
+                end_date=end_date,
+                model=model,
+                start_date=start_date,
+            )
+        stmt = brand_sov_stmt(brand, brand_report_id, start_date, end_date, model)
+        with Session(self._read_engine()) as session:
+            row = session.execute(stmt).first()
+        return brand_sov_result(row)
 
     def get_brand_coverage(
         self,
@@ -472,46 +761,18 @@ class DataBase:
         model: str,
         start_date: str,
     ) -> dict:
-        model_filter = "AND model = :model" if model != "all" else ""
-        stmt = text(
-            f"""
-            SELECT
-                COUNT(*) AS total_s3_keys,
-                COUNT(*) FILTER (WHERE has_mention = 1) AS mentioned_s3_keys
-            FROM (
-                SELECT
-                    s3_key,
-                    MAX(
-                        CASE
-                            WHEN LOWER(brand) = LOWER(:brand)
-                                 AND COALESCE(mention_count, 0) >= 1
-                            THEN 1 ELSE 0
-                        END
-                    ) AS has_mention
-                FROM brands
-                WHERE brand_report_id = :brand_report_id
-                  AND date >= CAST(:start_date AS DATE)
-                  AND date <= CAST(:end_date AS DATE)
-                  {model_filter}
-                GROUP BY s3_key
-            ) subquery
-        """
-        )
-        params = dict(
-            brand=brand,
-            brand_report_id=brand_report_id,
-            start_date=start_date,
-            end_date=end_date,
-        )
-        if model != "all":
-            params["model"] = model
-
-        with Session(self.engine) as session:
-            row = session.exec(stmt.bindparams(**params)).first()
-            total = row[0] if row else 0
-            mentioned = row[1] if row else 0
-            coverage = (mentioned / total) * 100 if total else 0
-            return {"data": coverage}
+        if self._use_analytics(brand_report_id):
+            return self.analytics.get_brand_coverage(
+                brand=brand,
+                brand_report_id=brand_report_id,
+                end_date=end_date,
+                model=model,
+                start_date=start_date,
+            )
+        stmt = brand_coverage_stmt(brand, brand_report_id, start_date, end_date, model)
+        with Session(self._read_engine()) as session:
+            row = session.execute(stmt).first()
+        return brand_coverage_result(row)
 
     def get_brand_position(
         self,
@@ -521,37 +782,43 @@ class DataBase:
         model: str,
         start_date: str,
     ) -> dict:
-        model_filter = "AND model = :model" if model != "all" else ""
-        stmt = text(
-            f"""
-            SELECT
-                SUM(position) FILTER (WHERE LOWER(brand) = LOWER(:brand)) AS total_position,
-                COUNT(*)      FILTER (WHERE LOWER(brand) = LOWER(:brand)) AS brand_count
-            FROM brands
-            WHERE brand_report_id = :brand_report_id
-                AND date >= CAST(:start_date AS DATE)
-                AND date <= CAST(:end_date AS DATE)
-                {model_filter}
-        """
-        )
-        params = dict(
-            brand=brand,
-            brand_report_id=brand_report_id,
-            start_date=start_date,
-            end_date=end_date,
-        )
-        if model != "all":
-            params["model"] = model
-
-        with Session(self.engine) as session:
-            row = session.exec(stmt.bindparams(**params)).first()
-            total_position = row[0] or 0
-            brand_count = row[1] or 0
-            if brand_count == 0:
-                return {"data": 0}
-            avg_position = total_position / brand_count
-            return {"data": int(avg_position)}
+        if self._use_analytics(brand_report_id):
+            return self.analytics.get_brand_position(
+                brand=brand,
+                brand_report_id=brand_report_id,
+                end_date=end_date,
+                model=model,
+                start_date=start_date,
+            )
+        stmt = brand_position_stmt(brand, brand_report_id, start_date, end_date, model)
+        with Session(self._read_engine()) as session:
+            row = session.execute(stmt).first()
+        return brand_position_result(row)
 
+    def get_brand_summary(
+        self,
+        brand: str,
+        brand_report_id: str,
+        end_date: str,
+        model: str,
+        start_date: str,
+    ) -> dict:
+        """
+        Mentions, share of voice, coverage and position of a brand in one
+        query, with the same values as the four get_brand_* methods.
+        """
+        if self._use_analytics(brand_report_id):
+            return self.analytics.get_brand_summary(
+                brand=brand,
+                brand_report_id=brand_report_id,
+                end_date=end_date,
+                model=model,
+                start_date=start_date,
+            )
+        stmt = brand_summary_stmt(brand, brand_report_id, start_date, end_date, model)
+        with Session(self._read_engine()) as session:
+            row = session.execute(stmt).first()
+        return brand_summary_result(row)
 
     def get_brand_ranking(
         self,
@@ -560,54 +827,17 @@ class DataBase:
         end_date: str,
         model: str,
     ) -> list:
-        model_filter = "AND model = :model" if model != "all" else ""
-        stmt = text(
-            f"""
-            SELECT brand, SUM(mention_count) AS total_mentions
-            FROM brands
-            WHERE brand_report_id = :brand_report_id
-                AND date >= CAST(:start_date AS DATE)
-                AND date <= CAST(:end_date AS DATE)
-                {model_filter}
-            GROUP BY brand
-            ORDER BY total_mentions DESC
-        """
-        )
-        params = dict(
-            brand_report_id=brand_report_id,
-            start_date=start_date,
-            end_date=end_date,
-        )
-        if model != "all":
-            params["model"] = model
-
-        with Session(self.engine) as session:
-            rows = session.exec(stmt.bindparams(**params)).fetchall()
-
-        if not rows:
-            return []
-
-        ranking = []
-        prev_mentions = None
-        rank = 0
-        skip = 1
-        for row in rows:
-            mentions = row[1] or 0
-            if mentions == prev_mentions:
-                skip += 1
-            else:
-                rank += skip
-                skip = 1
-            ranking.append(
-                {
-                    "rank": rank,
-                    "brand_name": row[0],
-                    "mention_count": mentions,
-                }
+        if self._use_analytics(brand_report_id):
+            return self.analytics.get_brand_ranking(
+                brand_report_id=brand_report_id,
+                start_date=start_date,
+                end_date=end_date,
+                model=model,
             )
-            prev_mentions = mentions
-        return ranking
-
+        stmt = brand_ranking_stmt(brand_report_id, start_date, end_date, model)
+        with Session(self._read_engine()) as session:
+            rows = session.execute(stmt).fetchall()
+        return brand_ranking_result(rows)
 
     def get_brand_ranking_over_time(
         self,
@@ -615,64 +845,130 @@ class DataBase:
         start_date: str,
         end_date: str,
         model: str,
+        brand: Optional[str] = None,
+        fill_gaps: bool = False,
     ) -> list:
-        model_filter = "AND model = :model" if model != "all" else ""
-        stmt = text(
-            f"""
-            SELECT
-                date::DATE AS day,
-                brand,
-                SUM(mention_count) AS total_mentions
-            FROM brands
-            WHERE brand_report_id = :brand_report_id
-                AND date >= CAST(:start_date AS DATE)
-                AND date <= CAST(:end_date AS DATE)
-                {model_filter}
-            GROUP BY day, brand
-            ORDER BY day ASC, total_mentions DESC
         """
+        Daily rank of every brand (or only `brand`) by mentions. Ranks are
+        computed over all the brands of the day; with `fill_gaps` the days of
+        the window without mentions are returned with rank None.
+        """
+        if self._use_analytics(brand_report_id):
+            return self.analytics.get_brand_ranking_over_time(
+                brand_report_id=brand_report_id,
+                start_date=start_date,
+                end_date=end_date,
+                model=model,
+                brand=brand,
+                fill_gaps=fill_gaps,
+            )
+        stmt = brand_ranking_over_time_stmt(
+            brand_report_id, start_date, end_date, model, brand, fill_gaps
         )
-        params = dict(
-            brand_report_id=brand_report_id,
-            start_date=start_date,
-            end_date=end_date,
+        with Session(self._read_engine()) as session:
+            rows = session.execute(stmt).fetchall()
+        return brand_ranking_over_time_result(rows)
+
+
+if __name__ == "__main__":
+    # Serialization of a 50k-row citations result: ORM objects + a
+    # model_dump_json/json.loads round trip + FastAPI encoding vs row
+    # mappings rendered by orjson. Then write throughput of the same rows:
+    # ORM add_all vs multi-row INSERT vs COPY through a staging table
+    import tracemalloc
+
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse, ORJSONResponse
+    from sqlmodel import delete, insert
+
+    database = DataBase()
+    prompt_id = "benchmark-serialization"
+    day = datetime(2025, 1, 1)
+    rows = [
+        dict(
+            id=f"{prompt_id}-{i}",
+            brand_report_id=prompt_id,
+            prompt_id=prompt_id,
+            date=day,
+            model="chatgpt",
+            brand="brand",
+            rank=i % 20 + 1,
+            title=f"Title {i}",
+            domain="example.com",
+            norm_url=f"https://www.example.com/page-{i}",
+            s3_key=f"{prompt_id}/{i // 20}",
         )
-        if model != "all":
-            params["model"] = model
+        for i in range(50_000)
+    ]
+    with Session(database.engine) as session:
+        session.execute(insert(Citations), rows)
+        session.commit()
+
+    def orm_path() -> bytes:
+        with Session(database.engine) as session:
+            results = session.exec(
+                select(Citations).where(
+                    Citations.prompt_id == prompt_id, Citations.date == day
+                )
+            ).all()
+        citations = [json.loads(result.model_dump_json()) for result in results]
+        return JSONResponse(jsonable_encoder({"citations": citations})).body
+
+    def mapping_path() -> bytes:
+        citations = database.get_citations(prompt_id, "2025-01-01", "chatgpt")
+        return ORJSONResponse({"citations": citations}).body
+
+    try:
+        assert json.loads(orm_path()) == json.loads(mapping_path())
+        for name, func in (("orm", orm_path), ("mappings", mapping_path)):
+            cpu, wall = time.process_time(), time.perf_counter()
+            body = func()
+            cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+            # separate run: tracemalloc slows the measured code down
+            tracemalloc.start()
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(
+                f"{name:>8}: {wall * 1000:7.1f} ms wall | {cpu * 1000:7.1f} ms cpu"
+                f" | peak {peak / 2**20:6.1f} MiB | {len(body) / 2**20:.1f} MiB body"
+            )
+    finally:
+        with Session(database.engine) as session:
+            session.execute(delete(Citations).where(Citations.prompt_id == prompt_id))
+            session.commit()
 
-        with Session(self.engine) as session:
-            rows = session.exec(stmt.bindparams(**params)).fetchall()
+    def orm_write(session: Session, items: list[Citations]) -> None:
+        session.add_all(items)
 
-        if not rows:
-            return []
+    def insert_write(session: Session, items: list[Citations]) -> None:
+        session.execute(
+            pg_insert(Citations).on_conflict_do_nothing(),
+            [item.model_dump() for item in items],
+        )
 
-        grouped_by_date = defaultdict(list)
-        for row in rows:
-            grouped_by_date[row[0]].append(row)
-
-        brand_points = defaultdict(list)
-        for day in sorted(grouped_by_date.keys()):
-            day_rows = grouped_by_date[day]
-            prev_mentions = None
-            rank = 0
-            skip = 1
-            for row in day_rows:
-                mentions = row[2] or 0
-                if mentions == prev_mentions:
-                    skip += 1
-                else:
-                    rank += skip
-                    skip = 1
-                brand_points[row[1]].append(
-                    {
-                        "date": day,
-                        "rank": rank,
-                        "mention_count": mentions,
-                    }
-                )
-                prev_mentions = mentions
+    def copy_write(session: Session, items: list[Citations]) -> None:
+        copy_rows(
+            session.connection(), Citations, [item.model_dump() for item in items]
+        )
 
-        return [
-            {"brand_name": brand_name, "points": points}
-            for brand_name, points in brand_points.items()
-        ]
+    for name, func in (
+        ("orm", orm_write),
+        ("insert", insert_write),
+        ("copy", copy_write),
+    ):
+        # the parser builds the model objects anyway: only time the write
+        items = [Citations(**row) for row in rows]
+        try:
+            wall = time.perf_counter()
+            with Session(database.engine) as session:
+                func(session, items)
+                session.commit()
+            wall = time.perf_counter() - wall
+            print(f"{name:>8}: {wall:6.2f} s | {len(rows) / wall:9.0f} rows/s")
+        finally:
+            with Session(database.engine) as session:
+                session.execute(
+                    delete(Citations).where(Citations.prompt_id == prompt_id)
+                )
+                session.commit()
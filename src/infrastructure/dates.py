@@ -0,0 +1,107 @@
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+import dateparser
+
+from src.config import config
+
+# YYYY-MM-DD, optionally followed by a time and a UTC offset
+ISO_PATTERN = re.compile(
+    r"^\d{4}-\d{2}-\d{2}"
+    r"(?:[ T]\d{2}:\d{2}(?::\d{2}(?:\.\d{1,6})?)?(?:Z|[+-]\d{2}:?\d{2})?)?$"
+)
+
+
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class DateParser:
+    """
+    Date parsing with a zero-dependency fast path for ISO strings and a
+    memoized dateparser fallback for everything else ("7 days ago", ...).
+
+    Fallback results are only cached for `ttl` seconds because relative
+    phrases depend on the current time.
+
+    Values with a UTC offset are converted to naive UTC (like the TIMESTAMP
+    columns), so every result can be compared with every other one.
+    """
+
+    def __init__(
+        self,
+        ttl: int = config.DATE_PARSE_CACHE_TTL,
+        max_entries: int = 1024,
+    ) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._cache: dict[str, tuple[float, Optional[datetime]]] = {}
+        self._lock = threading.Lock()
+        self.fast_hits = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _fallback(self, value: str) -> Optional[datetime]:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(value)
+            if cached and cached[0] > now:
+                self.cache_hits += 1
+                return cached[1]
+            self.cache_misses += 1
+
+        result = naive_utc(dateparser.parse(value))
+
+        with self._lock:
+            if len(self._cache) >= self.max_entries:
+                self._cache.clear()
+            self._cache[value] = (now + self.ttl, result)
+        return result
+
+    def parse(self, value: Optional[str]) -> Optional[datetime]:
+        if not value:
+            return None
+        value = value.strip()
+        if ISO_PATTERN.match(value):
+            try:
+                parsed = datetime.fromisoformat(value)
+                self.fast_hits += 1
+                return naive_utc(parsed)
+            except ValueError:
+                pass
+        return self._fallback(value)
+
+    def stats(self) -> dict:
+        return {
+            "fast_hits": self.fast_hits,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+        }
+
+
+date_parser = DateParser()
+
+
+def parse_date(value: Optional[str]) -> Optional[datetime]:
+    return date_parser.parse(value)
+
+
+if __name__ == "__main__":
+    # Per-call cost of dateparser.parse vs parse_date
+    import timeit
+
+    samples = ["2025-10-05", "2025-10-05 12:30:00", "7 days ago"]
+    for sample in samples:
+        assert parse_date(sample) is not None
+        runs = 200
+        before = timeit.timeit(lambda: dateparser.parse(sample), number=runs) / runs
+        after = timeit.timeit(lambda: parse_date(sample), number=runs) / runs
+        print(
+            f"{sample!r:>24}: dateparser {before * 1e6:8.1f} us"
+            f" | parse_date {after * 1e6:8.1f} us"
+        )
@@ -0,0 +1,81 @@
+import os
+from functools import lru_cache
+
+import tldextract
+
+from src.config import config
+
+BLOCKED_DOMAINS = {
+    "www.google.com",
+    "google.com",
+    "gstatic.com",
+    "www.gstatic.com",
+    "accounts.google.com",
+    "support.google.com",
+}
+
+
+class DomainNormalizer:
+    """
+    Offline, memoized URL -> registered domain normalization.
+
+    The public suffix list comes from the snapshot bundled with tldextract (or
+    from a local file when DOMAIN_SUFFIX_LIST_FILE is set), so no lookup ever
+    touches the network. Results are kept in a bounded LRU.
+    """
+
+    def __init__(
+        self,
+        cache_size: int = config.DOMAIN_CACHE_SIZE,
+        suffix_list_file: str = config.DOMAIN_SUFFIX_LIST_FILE,
+        blocked_domains: set[str] = BLOCKED_DOMAINS,
+    ) -> None:
+        suffix_list_urls = (
+            (f"file://{os.path.abspath(suffix_list_file)}",)
+            if suffix_list_file
+            else ()
+        )
+        self._extract = tldextract.TLDExtract(
+            cache_dir=None,
+            suffix_list_urls=suffix_list_urls,
+            fallback_to_snapshot=True,
+        )
+        self._normalize_cached = lru_cache(maxsize=cache_size)(self._normalize)
+        # blocked on the registered domain label, whatever the suffix:
+        # google.com blocks google.com.au and google.co.uk too
+        self.blocked_labels = {self._extract(d).domain for d in blocked_domains}
+        self.blocked_checks = 0
+        self.blocked_hits = 0
+
+    def _normalize(self, url: str) -> str:
+        if not url:
+            return ""
+        domain_node = self._extract(url.lower().strip())
+        return f"{domain_node.domain}.{domain_node.suffix}"
+
+    def normalize(self, url: str) -> str:
+        return self._normalize_cached(url)
+
+    def is_blocked(self, domain: str) -> bool:
+        """Check the label of an already normalized domain (label.suffix)"""
+        self.blocked_checks += 1
+        blocked = domain.split(".", 1)[0] in self.blocked_labels
+        if blocked:
+            self.blocked_hits += 1
+        return blocked
+
+    def stats(self) -> dict:
+        info = self._normalize_cached.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            "hits": info.hits,
+            "misses": info.misses,
+            "hit_rate": round(info.hits / lookups, 4) if lookups else 0.0,
+            "size": info.currsize,
+            "max_size": info.maxsize,
+            "blocked_checks": self.blocked_checks,
+            "blocked_hits": self.blocked_hits,
+        }
+
+
+domain_normalizer = DomainNormalizer()
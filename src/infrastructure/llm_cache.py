@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Optional
+
+import redis
+from pydantic import TypeAdapter
+
+from src.config import config
+
+KEY_PREFIX = "llm_cache:"
+INDEX_KEY = "llm_cache:index"
+STATS_KEY = "llm_cache:stats"
+
+
+class LLMResponseCache:
+    """
+    Content-hash keyed cache for structured Gemini responses.
+
+    Entries are looked up in Redis first and then in an optional local disk
+    directory (useful for offline runs). Both tiers expire entries after
+    `ttl` seconds and evict the oldest entries once `max_entries` is reached.
+
+    The disk tier keeps an index of its files (oldest first) instead of
+    listing the directory on every write. Other processes write to the same
+    directory, so the index is reloaded from it every `max_entries / 10`
+    writes.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = config.LLM_CACHE_ENABLED,
+        ttl: int = config.LLM_CACHE_TTL,
+        max_entries: int = config.LLM_CACHE_MAX_ENTRIES,
+        disk_dir: str = config.LLM_CACHE_DIR,
+    ) -> None:
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._redis: Optional[redis.Redis] = None
+        self._adapters: dict[Any, TypeAdapter] = {}
+        self._lock = threading.Lock()
+        self.counters: dict[str, int] = defaultdict(int)
+        self._disk_index: Optional[OrderedDict[str, None]] = None
+        self._disk_writes = 0
+        self.disk_rescan_writes = max(1, max_entries // 10)
+
+    # ------------------------------KEYS------------------------------
+    def adapter(self, response_schema: Any) -> TypeAdapter:
+        if response_schema not in self._adapters:
+            self._adapters[response_schema] = TypeAdapter(response_schema)
+        return self._adapters[response_schema]
+
+    def make_key(
+        self,
+        model_name: str,
+        system_prompt: str,
+        user_prompt: str,
+        response_schema: Any,
+    ) -> str:
+        schema = self.adapter(response_schema).json_schema()
+        payload = json.dumps(
+            [model_name, system_prompt, user_prompt, schema], sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    # ------------------------------REDIS------------------------------
+    def redis_session(self) -> redis.Redis:
+        if self._redis is None:
+            self._redis = redis.Redis(
+                host=config.REDIS_HOST,
+                port=config.REDIS_PORT,
+                db=config.REDIS_DB,
+                decode_responses=True,
+            )
+        return self._redis
+
+    def _redis_get(self, key: str) -> Optional[dict]:
+        try:
+            value = self.redis_session().get(KEY_PREFIX + key)
+        except Exception as e:
+            print(f"LLM CACHE: Redis error {e}")
+            return None
+        return json.loads(value) if value else None
+
+    def _redis_set(self, key: str, value: dict) -> None:
+        try:
+            session = self.redis_session()
+            pipe = session.pipeline()
+            pipe.set(KEY_PREFIX + key, json.dumps(value), ex=self.ttl)
+            pipe.zadd(INDEX_KEY, {key: time.time()})
+            pipe.zremrangebyscore(INDEX_KEY, "-inf", time.time() - self.ttl)
+            pipe.execute()
+            # Size-based eviction: drop the oldest entries beyond max_entries
+            overflow = session.zcard(INDEX_KEY) - self.max_entries
+            if overflow > 0:
+                evicted = [k for k, _ in session.zpopmin(INDEX_KEY, overflow)]
+                session.delete(*[KEY_PREFIX + k for k in evicted])
+                self._count("evictions", len(evicted))
+        except Exception as e:
+            print(f"LLM CACHE: Redis error {e}")
+
+    # ------------------------------DISK------------------------------
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _disk_get(self, key: str) -> Optional[dict]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("expires_at", 0) < time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            with self._lock:
+                if self._disk_index is not None:
+                    self._disk_index.pop(key, None)
+            return None
+        return entry.get("value")
+
+    def _disk_scan(self) -> OrderedDict[str, None]:
+        """Keys of the entries on disk, oldest first"""
+        entries = []
+        for entry in os.scandir(self.disk_dir):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                entries.append((entry.stat().st_mtime, entry.name[: -len(".json")]))
+            except OSError:
+                continue  # removed meanwhile (expired / evicted elsewhere)
+        entries.sort()
+        return OrderedDict((key, None) for _, key in entries)
+
+    def _disk_set(self, key: str, value: dict) -> None:
+        if not self.disk_dir:
+            return
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            tmp_path = self._disk_path(key) + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"expires_at": time.time() + self.ttl, "value": value}, f)
+            os.replace(tmp_path, self._disk_path(key))
+
+            with self._lock:
+                self._disk_writes += 1
+                if (
+                    self._disk_index is None
+                    or self._disk_writes % self.disk_rescan_writes == 0
+                ):
+                    self._disk_index = self._disk_scan()
+                else:
+                    self._disk_index[key] = None
+                    self._disk_index.move_to_end(key)
+                overflow = len(self._disk_index) - self.max_entries
+                evicted = [
+                    self._disk_index.popitem(last=False)[0] for _ in range(overflow)
+                ]
+            for evicted_key in evicted:
+                try:
+                    os.remove(self._disk_path(evicted_key))
+                except FileNotFoundError:
+                    pass
+            if evicted:
+                self._count("evictions", len(evicted))
+        except OSError as e:
+            print(f"LLM CACHE: Disk error {e}")
+
+    # ------------------------------PUBLIC------------------------------
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += amount
+        try:
+            self.redis_session().hincrby(STATS_KEY, name, amount)
+        except Exception:
+            pass
+
+    def get(self, key: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        value = self._redis_get(key)
+        if value is not None:
+            self._count("redis_hits")
+            return value
+        value = self._disk_get(key)
+        if value is not None:
+            self._count("disk_hits")
+            self._redis_set(key, value)
+            return value
+        self._count("misses")
+        return None
+
+    def set(self, key: str, value: dict) -> None:
+        if not self.enabled:
+            return
+        self._redis_set(key, value)
+        self._disk_set(key, value)
+
+    def stats(self) -> dict:
+        """Hit/miss counters for this process and across all processes"""
+        try:
+            shared = {
+                name: int(count)
+                for name, count in self.redis_session().hgetall(STATS_KEY).items()
+            }
+        except Exception:
+            shared = {}
+        with self._lock:
+            local = dict(self.counters)
+        return {"process": local, "global": shared}
+
+
+llm_cache = LLMResponseCache()
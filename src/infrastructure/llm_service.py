@@ -1,7 +1,7 @@
 import sys
-import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-import dateparser
 from selectolax.parser import HTMLParser
 
 
@@ -9,15 +9,19 @@ sys.path.append(".")
 
 import logging
 import time
-import markdown2
-from markdownify import markdownify as md
-from google import genai
+from typing import Any, Callable, Optional
 from google.genai.types import GenerateContentConfig
+from sqlmodel import SQLModel
 
 from src.config import config
-from src.infrastructure.shared import to_canonical, extract_clean_links
+from src.infrastructure.shared import parse_markdown, to_canonical
 from src.infrastructure.aws_storage import AWSStorage
+from src.infrastructure.brand_matcher import BrandMatcher
+from src.infrastructure.checkpoints import StageCheckpoints
 from src.infrastructure.database import DataBase
+from src.infrastructure.dates import parse_date
+from src.infrastructure.llm_cache import llm_cache
+from src.infrastructure.resources import resources
 from src.infrastructure.models import (
     Brands,
     Citations,
@@ -26,14 +30,19 @@ from src.infrastructure.models import (
     Sentiments,
     Token_Reports,
     Brand_List,
+    BrandSentimentBody,
 )
 from src.infrastructure.prompt import (
+    BRAND_SENTIMENT_SYSTEM_PROMPT,
     SENTIMENT_SYSTEM_PROMPT,
     SYSTEM_PROMPT,
+    get_brand_sentiment_user_prompt,
     get_sentiment_user_prompt,
     get_user_prompt,
 )
 
+EXTRACTION_MODES = ("split", "fused")
+
 
 class LLMService:
     def __init__(
@@ -47,12 +56,15 @@ class LLMService:
         s3_key: str,
         logger: logging.Logger,
         save_to_db: bool = True,
+        concurrent: bool = True,
+        extraction_mode: str = "split",
     ) -> None:
         # report ids
         self.process_id = process_id
         self.brand_report_id = brand_report_id
         self.prompt_id = prompt_id
         self.date = date
+        self.report_date = parse_date(date)
         self.model = model
         self.brand = brand
         self.s3_key = s3_key
@@ -62,60 +74,34 @@ class LLMService:
 
         # initialise others
         self.bucket = config.BUCKET_NAME
-        self.client = genai.Client(api_key=config.GEMINI_API_KEY)
-        self.storage = AWSStorage()
+        self.client = resources.get_genai_client()
+        self.storage = AWSStorage(s3_client=resources.get_s3_client())
         self.content = ""
         self.clean_content = ""
+        self.clean_content_without_links = ""
+        self.links: list[dict] = []
         self.google_citations = ""
+        # token usage of the run, written with the results (or on failure)
+        self.token_reports: list[Token_Reports] = []
+        # ids of the token reports loaded from a previous attempt
+        self.previous_token_ids: set[str] = set()
+        self._token_lock = threading.Lock()
         # initialise db
-        self.database = DataBase()
+        self.database = DataBase(engine=resources.get_engine())
         # initialise logger
         self.logger = logger
         self.save_to_db = save_to_db
-        print(config.MODEL_NAME)
-
-    def count_word_with_apostrophe(self, word: str, content: str):
-        pattern = r"\b" + re.escape(word) + r"(?:'s)?\b"
-        return len(re.findall(pattern, content, flags=re.IGNORECASE))
-
-    def remove_links(self, content: str):
-        """
-        Remove all URLs and markdown links from text
-        """
-
-        # 1. Remove markdown links [text](url) — keep nothing (inline citations)
-        text = re.sub(r"\[([^\]]*)\]\([^)]*\)", "", content)
-
-        # 2. Remove markdown reference-style links [text][ref] — keep nothing
-        text = re.sub(r"\[([^\]]*)\]\[[^\]]*\]", "", text)
-
-        # 3. Remove bare URLs (http, https, ftp, www)
-        text = re.sub(r"https?://\S+|www\.\S+|ftp://\S+", "", text)
-
-        # 4. Clean up extra whitespace
-        text = re.sub(r"\s+", " ", text).strip()
-
-        return text
-
-    def clean_markdown(self, content: str | None = None) -> str:
-        self.logger.info("Cleaning Content")
-        if not self.content:
-            return ""
-        html_content = markdown2.markdown(content if content else self.content)
-        cleaned_markdown = md(
-            html_content,
-            strip=[
-                "img",
-                "picture",
-                "figure",
-                "source",
-                "svg",
-                "object",
-                "embed",
-                "iframe",
-            ],
+        # completed stages, so a redelivered task resumes where it stopped
+        self.checkpoints = StageCheckpoints(
+            process_id, enabled=save_to_db and config.CHECKPOINTS_ENABLED
         )
-        return cleaned_markdown.strip()
+        # run the independent extraction steps in parallel
+        self.concurrent = concurrent
+        # "split": separate brand and sentiment calls, "fused": one call
+        if extraction_mode not in EXTRACTION_MODES:
+            raise ValueError(f"Unknown extraction mode: {extraction_mode}")
+        self.extraction_mode = extraction_mode
+        print(config.MODEL_NAME)
 
     def google_parser(self):
         if not self.html_content:
@@ -139,66 +125,134 @@ class LLMService:
         node_text = node.text(separator=" ")
         return node_text
 
-    def extract_brand_mentions(self) -> list[Brands]:
-        logging.info("- Starting the LLM prompt parsing system")
-        parsed_results = []
-
-        if self.model.lower() == "google":
-            content = self.google_parser()
-        if self.model.lower() == "chatgpt":
-            content = self.chatgpt_parser()
-        if self.model.lower() == "perplexity":
-            content = self.remove_links(self.clean_content)
+    def generate(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        response_schema: Any,
+        action: str,
+    ) -> Any:
+        """
+        Run a structured Gemini call, served from the response cache when the
+        same (model, prompts, schema) was already answered.
+        Token usage is recorded for both cached and live responses.
+        """
+        cache_key = llm_cache.make_key(
+            config.MODEL_NAME, system_prompt, user_prompt, response_schema
+        )
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            self.logger.info(f"LLM cache hit for {action}")
+            usage = cached.get("usage") or {}
+            self.record_token_usage(usage, action, cached=True)
+            return llm_cache.adapter(response_schema).validate_json(cached["text"])
 
-        prompt = self.database.get_prompt(self.prompt_id)
-        if not prompt:
-            return []
         response = self.client.models.generate_content(
             model=config.MODEL_NAME,
-            contents=get_user_prompt(content, prompt),
+            contents=user_prompt,
             config=GenerateContentConfig(
                 response_mime_type="application/json",
-                response_schema=list[Brand_List],
+                response_schema=response_schema,
                 system_instruction=[
-                    SYSTEM_PROMPT,
+                    system_prompt,
                 ],
             ),
         )
         # Access the usage metadata
         usage = response.usage_metadata
+        usage_data = {
+            "total_token_count": getattr(usage, "total_token_count", 0) or 0,
+            "prompt_token_count": getattr(usage, "prompt_token_count", 0) or 0,
+            "candidates_token_count": getattr(usage, "candidates_token_count", 0)
+            or 0,
+        }
         if usage:
-            token_data = Token_Reports(
-                id=str(time.time_ns()),
-                brand_report_id=self.brand_report_id,
-                prompt_id=self.prompt_id,
-                date=self.date,
-                model=self.model,
-                total_token_count=getattr(usage, "total_token_count", 0),
-                prompt_token_count=getattr(usage, "prompt_token_count", 0),
-                output_token_count=getattr(usage, "candidates_token_count", 0),
-                action="get_brand_mentions",
+            self.record_token_usage(usage_data, action)
+
+        if response.parsed is not None and response.text:
+            llm_cache.set(cache_key, {"text": response.text, "usage": usage_data})
+        return response.parsed
+
+    def record_token_usage(self, usage: dict, action: str, cached: bool = False):
+        token_data = Token_Reports(
+            id=f"{self.process_id}-{action}-{time.time_ns()}",
+            brand_report_id=self.brand_report_id,
+            prompt_id=self.prompt_id,
+            date=self.report_date,
+            model=self.model,
+            total_token_count=usage.get("total_token_count", 0),
+            prompt_token_count=usage.get("prompt_token_count", 0),
+            output_token_count=usage.get("candidates_token_count", 0),
+            action=action,
+            cached=cached,
+        )
+        with self._token_lock:
+            self.token_reports.append(token_data)
+            # paid for even if the task dies before saving
+            self.checkpoints.save(
+                "token_reports",
+                [report.model_dump(mode="json") for report in self.token_reports],
             )
-            if self.save_to_db:
-                self.database.save_token_usage(token_data)
 
-        dedup = {}
-        results = response.parsed if response else []
+    def flush_token_usage(self) -> None:
+        """Write the token usage not saved yet (used when the run fails)"""
+        with self._token_lock:
+            token_reports = self.token_reports
+            self.token_reports = []
+        if not token_reports or not self.save_to_db:
+            return
+        try:
+            self.database.save_token_usage(token_reports)
+        except Exception as e:
+            self.logger.error(f"Unable to save the token usage: {e}")
+
+    def get_answer_content(self) -> str:
+        """Get the model specific answer text used for brand extraction"""
+        content = ""
+        if self.model.lower() == "google":
+            content = self.google_parser()
+        if self.model.lower() == "chatgpt":
+            content = self.chatgpt_parser()
+        if self.model.lower() == "perplexity":
+            content = self.clean_content_without_links
+        return content
+
+    def extract_brand_mentions(self) -> list[Brands]:
+        logging.info("- Starting the LLM prompt parsing system")
+        content = self.get_answer_content()
+
+        prompt = self.database.get_prompt(self.prompt_id)
+        if not prompt:
+            return []
+        results = self.generate(
+            system_prompt=SYSTEM_PROMPT,
+            user_prompt=get_user_prompt(content, prompt),
+            response_schema=list[Brand_List],
+            action="get_brand_mentions",
+        )
+        return self.build_brands(results, content)
 
+    def build_brands(self, results: Any, content: str) -> list[Brands]:
+        """Dedup, rank and count the LLM brands against the answer content"""
+        dedup = {}
         if not isinstance(results, list):
             return []
 
-        content_lower = content.lower()
-        # STEP 1: collect unique brands with index
+        # STEP 1: collect unique brands, then count and locate all of them
+        # in a single pass over the content
+        brand_names = []
         for r in results:
             raw_brand = r.brand.lower().strip()
             brand_clean = to_canonical(raw_brand)
             if brand_clean.endswith("."):
                 brand_clean = brand_clean.rstrip(".")
-            if brand_clean in dedup:
-                continue
+            brand_names.append(brand_clean)
 
-            index = content_lower.find(brand_clean)
-            dedup[brand_clean] = index if index != -1 else None
+        matches = BrandMatcher(brand_names).match(content)
+        mention_counts = {}
+        for brand_clean, (mention_count, index) in matches.items():
+            dedup[brand_clean] = index
+            mention_counts[brand_clean] = mention_count
 
         # STEP 2: build ordered list (ONLY brands found in content)
         brand_positions = [
@@ -212,17 +266,13 @@ class LLMService:
 
         # STEP 4: build final results (preserve dict order)
         parsed_results = []
-
         for brand, index in dedup.items():
-            mention_count = self.count_word_with_apostrophe(brand, content)
+            mention_count = mention_counts[brand]
             if mention_count == 0:
                 continue
             brand_rank = rank_map.get(brand)
             if not brand_rank:
                 continue
-            date_node = dateparser.parse(self.date)
-            if not date_node:
-                continue
             parsed_results.append(
                 Brands(
                     brand_report_id=self.brand_report_id,
@@ -230,7 +280,7 @@ class LLMService:
                     brand=brand.title(),
                     mention_count=mention_count,
                     position=brand_rank,
-                    date=date_node,
+                    date=self.report_date,
                     model=self.model,
                     s3_key=self.text_key,
                 )
@@ -245,7 +295,7 @@ class LLMService:
             id=self.process_id,
             brand_report_id=self.brand_report_id,
             prompt_id=self.prompt_id,
-            date=self.date,
+            date=self.report_date,
             model=self.model,
             snapshot=self.image_key,
             markdown=self.text_key,
@@ -256,37 +306,18 @@ class LLMService:
     def get_sentiments(self) -> list[Sentiments]:
         """Get the sentiment with LLM"""
         self.logger.info("Getting Sentiments with LLM")
-        parsed_sentiments = []
-        response = self.client.models.generate_content(
-            model=config.MODEL_NAME,
-            contents=get_sentiment_user_prompt(self.clean_content),
-            config=GenerateContentConfig(
-                response_mime_type="application/json",
-                response_schema=list[SentimentBody],
-                system_instruction=[
-                    SENTIMENT_SYSTEM_PROMPT,
-                ],
-            ),
+        sentiments = self.generate(
+            system_prompt=SENTIMENT_SYSTEM_PROMPT,
+            user_prompt=get_sentiment_user_prompt(self.clean_content),
+            response_schema=list[SentimentBody],
+            action="get_sentiments",
         )
-        # Access the usage metadata
-        usage = response.usage_metadata
-        if usage:
-            token_data = Token_Reports(
-                id=str(time.time_ns()),
-                brand_report_id=self.brand_report_id,
-                prompt_id=self.prompt_id,
-                date=self.date,
-                model=self.model,
-                total_token_count=getattr(usage, "total_token_count", 0),
-                prompt_token_count=getattr(usage, "prompt_token_count", 0),
-                output_token_count=getattr(usage, "candidates_token_count", 0),
-                action="get_sentiments",
-            )
-            self.database.save_token_usage(token_data)
+        return self.build_sentiments(sentiments)
 
-        # Validate sentiments
+    def build_sentiments(self, sentiments: Any) -> list[Sentiments]:
+        """Validate and dedup the LLM sentiments"""
+        parsed_sentiments = []
         dedup = set()
-        sentiments = response.parsed if response.parsed else []
         if not isinstance(sentiments, list):
             return []
 
@@ -301,7 +332,7 @@ class LLMService:
                     id=f"{self.process_id}-{idx}",
                     brand_report_id=self.brand_report_id,
                     prompt_id=self.prompt_id,
-                    date=self.date,
+                    date=self.report_date,
                     model=self.model,
                     brand=sentiment.brand,
                     brand_model=sentiment.brand_model,
@@ -312,25 +343,46 @@ class LLMService:
 
         return parsed_sentiments
 
+    def extract_brands_and_sentiments(
+        self,
+    ) -> tuple[list[Brands], list[Sentiments]]:
+        """Get brands and their sentiments with a single (fused) LLM call"""
+        self.logger.info("Getting Brands and Sentiments with one LLM call")
+        content = self.get_answer_content()
+
+        prompt = self.database.get_prompt(self.prompt_id)
+        if not prompt:
+            return [], []
+        result = self.generate(
+            system_prompt=BRAND_SENTIMENT_SYSTEM_PROMPT,
+            # same inputs as the split calls: the answer text for the
+            # brands, the whole clean markdown for the sentiments
+            user_prompt=get_brand_sentiment_user_prompt(
+                content, self.clean_content, prompt
+            ),
+            response_schema=BrandSentimentBody,
+            action="get_brand_sentiments",
+        )
+        if not isinstance(result, BrandSentimentBody):
+            return [], []
+
+        brands = self.build_brands(result.brands, content)
+        sentiments = self.build_sentiments(result.sentiments)
+        return brands, sentiments
+
     def get_citations(self) -> list[Citations]:
         """Build and store citations"""
 
         self.logger.info("Getting the citations")
 
-        links = extract_clean_links(
-            content=self.content if self.content else "",
-            model=self.model,
-            google_citations=self.google_citations,
-        )
-
         citations = []
 
-        for rank, link in enumerate(links, start=1):
+        for rank, link in enumerate(self.links, start=1):
             citation = Citations(
                 id=f"{self.process_id}-{rank}",
                 brand_report_id=self.brand_report_id,
                 prompt_id=self.prompt_id,
-                date=self.date,
+                date=self.report_date,
                 model=self.model,
                 brand=self.brand,
                 rank=rank,
@@ -344,27 +396,146 @@ class LLMService:
         print(f"Found -> {len(citations)} citations")
         return citations
 
-    def main(self) -> None:
-        """Start the whole parser workflow"""
-        self.logger.info("Starting the whole workflow")
-        # download the content from s3
+    def load_stage(self, stage: str, table: type[SQLModel]) -> Optional[list]:
+        rows = self.checkpoints.load(stage)
+        if rows is None:
+            return None
+        self.logger.info(f"Resuming from the {stage} checkpoint")
+        return [table.model_validate(row) for row in rows]
+
+    def save_stage(self, stage: str, items: list[SQLModel]) -> None:
+        self.checkpoints.save(stage, [item.model_dump(mode="json") for item in items])
+
+    def run_stage(
+        self, stage: str, table: type[SQLModel], extract: Callable[[], list]
+    ) -> list:
+        """Results of `stage` from its checkpoint, or `extract` and save them"""
+        items = self.load_stage(stage, table)
+        if items is None:
+            items = extract()
+            self.save_stage(stage, items)
+        return items
+
+    def get_brands_stage(self) -> list[Brands]:
+        return self.run_stage("brands", Brands, self.extract_brand_mentions)
+
+    def get_sentiments_stage(self) -> list[Sentiments]:
+        return self.run_stage("sentiments", Sentiments, self.get_sentiments)
 
+    def get_brands_and_sentiments_stage(
+        self,
+    ) -> tuple[list[Brands], list[Sentiments]]:
+        brands = self.load_stage("brands", Brands)
+        sentiments = self.load_stage("sentiments", Sentiments)
+        if brands is None or sentiments is None:
+            brands, sentiments = self.extract_brands_and_sentiments()
+            self.save_stage("brands", brands)
+            self.save_stage("sentiments", sentiments)
+        return brands, sentiments
+
+    def download(self) -> None:
+        """
+        Get the answer files from S3. Not checkpointed: the raw answers stay
+        in S3 (their keys come with the task), only the cleaned text is kept.
+        """
         self.logger.info("Downloaiding content from S3")
         self.content = self.storage.get_file_content(self.text_key)
         self.html_content = self.storage.get_file_content(self.html_key)
-        if not self.content:
+
+    def clean(self) -> None:
+        """Clean the content and extract its links in a single parse"""
+        cleaned = self.checkpoints.load("cleaned")
+        if cleaned is not None:
+            self.logger.info("Resuming from the cleaned checkpoint")
+        else:
+            self.logger.info("Cleaning Content")
+            parsed = parse_markdown(self.content, self.model, self.google_citations)
+            cleaned = {
+                "clean_text": parsed.clean_text,
+                "text_without_links": parsed.text_without_links,
+                "links": parsed.links,
+            }
+            self.checkpoints.save("cleaned", cleaned)
+        self.clean_content = cleaned["clean_text"]
+        self.clean_content_without_links = cleaned["text_without_links"]
+        self.links = cleaned["links"]
+
+    def main(self) -> None:
+        """Start the whole parser workflow"""
+        try:
+            self.run()
+        finally:
+            # token usage of a failed run (LLM calls already paid for)
+            self.flush_token_usage()
+
+    def run(self) -> None:
+        """Parse the report and save the results with the token usage"""
+        self.logger.info("Starting the whole workflow")
+        if not self.report_date:
+            self.logger.error(f"Unable to parse the report date: {self.date}")
             return None
 
-        # clean the content
-        self.clean_content = self.clean_markdown()
+        if self.checkpoints.persisted():
+            self.logger.info("Report already saved by a previous attempt")
+            return None
+        # token usage of the LLM calls made by a previous attempt
+        previous = self.load_stage("token_reports", Token_Reports)
+        if previous:
+            with self._token_lock:
+                self.token_reports = previous + self.token_reports
+                self.previous_token_ids = {report.id for report in previous}
+
+        self.download()
+        if not self.content:
+            return None
+        self.clean()
 
         # get and save parsed data
-        brands = self.extract_brand_mentions()
-        citations = self.get_citations()
-        sentiments = self.get_sentiments()
+        if self.extraction_mode == "fused":
+            if self.concurrent:
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    fused_future = executor.submit(self.get_brands_and_sentiments_stage)
+                    citations_future = executor.submit(self.get_citations)
+                    brands, sentiments = fused_future.result()
+                    citations = citations_future.result()
+            else:
+                brands, sentiments = self.get_brands_and_sentiments_stage()
+                citations = self.get_citations()
+        elif self.concurrent:
+            # The two Gemini calls are independent, so they (and the CPU-only
+            # citation step) run side by side and are joined before saving.
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                brands_future = executor.submit(self.get_brands_stage)
+                sentiments_future = executor.submit(self.get_sentiments_stage)
+                citations_future = executor.submit(self.get_citations)
+                brands = brands_future.result()
+                citations = citations_future.result()
+                sentiments = sentiments_future.result()
+        else:
+            brands = self.get_brands_stage()
+            citations = self.get_citations()
+            sentiments = self.get_sentiments_stage()
         output_report = self.save_brand_report_output()
         if self.save_to_db:
-            self.database.save_all(brands, citations, sentiments, output_report)
+            with self._token_lock:
+                token_reports = list(self.token_reports)
+            # idempotent: skipped if a previous attempt already saved it
+            if not self.database.save_all(
+                brands, citations, sentiments, output_report, token_reports
+            ):
+                self.logger.info("Report already saved by a previous attempt")
+                # the calls repeated by this attempt were still paid for (the
+                # previous attempts' ones were saved with the report)
+                self.database.save_token_usage(
+                    [
+                        report
+                        for report in token_reports
+                        if report.id not in self.previous_token_ids
+                    ]
+                )
+            with self._token_lock:
+                self.token_reports = []
+            self.checkpoints.mark_persisted()
 
 
 if __name__ == "__main__":
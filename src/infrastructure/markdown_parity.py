@@ -0,0 +1,181 @@
+"""
+Pinned markdown parsing outputs.
+
+PARITY_CASES hold, for a small corpus (lists, tables, iframes, footnote and
+reference citations, Google citations, blocked Google domains), the clean
+text, link-free text and links produced by the per-link implementation that
+parse_markdown replaced. `check` compares parse_markdown, clean_markdown and
+extract_clean_links with these literal values.
+
+Usage:
+    python -m src.infrastructure.markdown_parity check
+"""
+
+import sys
+
+from src.infrastructure.shared import (
+    clean_markdown,
+    extract_clean_links,
+    parse_markdown,
+)
+
+PARITY_CASES = [
+    {
+        "content": "# Best shoes\n\n**Nike** is great [1](https://www.nike.com/a?x=1#frag). ![img](https://x.com/a.png)\n\n- Adidas [site](https://adidas.com)\n- Hoka\n\n[^1]: https://runnersworld.com/review\n",
+        "model": "Google",
+        "google_citations": "[^9]: https://extra.com/a",
+        "clean_text": "Best shoes\n==========\n\n**Nike** is great [1](https://www.nike.com/a?x=1#frag).\n\n* Adidas [site](https://adidas.com)\n* Hoka",
+        "text_without_links": "Best shoes ========== **Nike** is great . * Adidas * Hoka",
+        "links": [
+            {
+                "title": "",
+                "domain": "runnersworld.com",
+                "url": "https://runnersworld.com/review",
+            },
+            {"title": "", "domain": "extra.com", "url": "https://extra.com/a"},
+            {"title": "1", "domain": "nike.com", "url": "https://www.nike.com/a?x=1"},
+            {"title": "site", "domain": "adidas.com", "url": "https://adidas.com"},
+        ],
+    },
+    {
+        "content": "# Best shoes\n\n**Nike** is great [1](https://www.nike.com/a?x=1#frag). ![img](https://x.com/a.png)\n\n- Adidas [site](https://adidas.com)\n- Hoka\n\n[^1]: https://runnersworld.com/review\n",
+        "model": "chatgpt",
+        "google_citations": "",
+        "clean_text": "Best shoes\n==========\n\n**Nike** is great [1](https://www.nike.com/a?x=1#frag).\n\n* Adidas [site](https://adidas.com)\n* Hoka",
+        "text_without_links": "Best shoes ========== **Nike** is great . * Adidas * Hoka",
+        "links": [
+            {
+                "title": "",
+                "domain": "runnersworld.com",
+                "url": "https://runnersworld.com/review",
+            },
+            {"title": "1", "domain": "nike.com", "url": "https://www.nike.com/a?x=1"},
+            {"title": "site", "domain": "adidas.com", "url": "https://adidas.com"},
+        ],
+    },
+    {
+        "content": "Text with www.example.com and https://google.com/search?q=x and [g](https://support.google.com/x)\n\n| a | b |\n|---|---|\n| [t](https://t.co) | 2 |\n",
+        "model": "Google",
+        "google_citations": "[^9]: https://extra.com/a",
+        "clean_text": "Text with www.example.com and https://google.com/search?q=x and [g](https://support.google.com/x)\n\n| a | b |\n|---|---|\n| [t](https://t.co) | 2 |",
+        "text_without_links": "Text with and and | a | b | |---|---| | | 2 |",
+        "links": [
+            {"title": "", "domain": "extra.com", "url": "https://extra.com/a"},
+            {"title": "t", "domain": "t.co", "url": "https://t.co"},
+        ],
+    },
+    {
+        "content": "Text with www.example.com and https://google.com/search?q=x and [g](https://support.google.com/x)\n\n| a | b |\n|---|---|\n| [t](https://t.co) | 2 |\n",
+        "model": "chatgpt",
+        "google_citations": "",
+        "clean_text": "Text with www.example.com and https://google.com/search?q=x and [g](https://support.google.com/x)\n\n| a | b |\n|---|---|\n| [t](https://t.co) | 2 |",
+        "text_without_links": "Text with and and | a | b | |---|---| | | 2 |",
+        "links": [{"title": "t", "domain": "t.co", "url": "https://t.co"}],
+    },
+    {
+        "content": "<iframe src='https://y.com'></iframe> plain <a href='#'>x</a> <a href='https://blog.co.uk/p'>Blog</a>\n\n* [] google stuff\n* item",
+        "model": "Google",
+        "google_citations": "[^9]: https://extra.com/a",
+        "clean_text": "plain [x](#) [Blog](https://blog.co.uk/p)\n\n* [] google stuff\n* item",
+        "text_without_links": "plain * [] google stuff * item",
+        "links": [
+            {"title": "", "domain": "extra.com", "url": "https://extra.com/a"},
+            {"title": "Blog", "domain": "blog.co.uk", "url": "https://blog.co.uk/p"},
+        ],
+    },
+    {
+        "content": "<iframe src='https://y.com'></iframe> plain <a href='#'>x</a> <a href='https://blog.co.uk/p'>Blog</a>\n\n* [] google stuff\n* item",
+        "model": "chatgpt",
+        "google_citations": "",
+        "clean_text": "plain [x](#) [Blog](https://blog.co.uk/p)\n\n* [] google stuff\n* item",
+        "text_without_links": "plain * [] google stuff * item",
+        "links": [
+            {"title": "Blog", "domain": "blog.co.uk", "url": "https://blog.co.uk/p"}
+        ],
+    },
+    {
+        "content": "",
+        "model": "Google",
+        "google_citations": "[^9]: https://extra.com/a",
+        "clean_text": "",
+        "text_without_links": "",
+        "links": [],
+    },
+    {
+        "content": "",
+        "model": "chatgpt",
+        "google_citations": "",
+        "clean_text": "",
+        "text_without_links": "",
+        "links": [],
+    },
+    {
+        "content": "1. one\n2. two [ref][r]\n\n[r]: https://ref.org/page\n\n```\ncode https://code.io\n```\n",
+        "model": "Google",
+        "google_citations": "[^9]: https://extra.com/a",
+        "clean_text": "1. one\n2. two [ref](https://ref.org/page)\n\n`code https://code.io`",
+        "text_without_links": "1. one 2. two `code",
+        "links": [
+            {"title": "", "domain": "extra.com", "url": "https://extra.com/a"},
+            {"title": "ref", "domain": "ref.org", "url": "https://ref.org/page"},
+        ],
+    },
+    {
+        "content": "1. one\n2. two [ref][r]\n\n[r]: https://ref.org/page\n\n```\ncode https://code.io\n```\n",
+        "model": "chatgpt",
+        "google_citations": "",
+        "clean_text": "1. one\n2. two [ref](https://ref.org/page)\n\n`code https://code.io`",
+        "text_without_links": "1. one 2. two `code",
+        "links": [{"title": "ref", "domain": "ref.org", "url": "https://ref.org/page"}],
+    },
+    {
+        "content": "See [AU](https://www.google.com.au/maps) and [^2] [BR](https://google.com.br/x)\n\n[^2]: https://fonts.gstatic.com/a.css\n",
+        "model": "Google",
+        "google_citations": "[^9]: https://extra.com/a",
+        "clean_text": "See [AU](https://www.google.com.au/maps) and [^2] [BR](https://google.com.br/x)",
+        "text_without_links": "See and [^2]",
+        "links": [{"title": "", "domain": "extra.com", "url": "https://extra.com/a"}],
+    },
+    {
+        "content": "See [AU](https://www.google.com.au/maps) and [^2] [BR](https://google.com.br/x)\n\n[^2]: https://fonts.gstatic.com/a.css\n",
+        "model": "chatgpt",
+        "google_citations": "",
+        "clean_text": "See [AU](https://www.google.com.au/maps) and [^2] [BR](https://google.com.br/x)",
+        "text_without_links": "See and [^2]",
+        "links": [],
+    },
+]
+
+
+def check_case(case: dict) -> list[str]:
+    """Outputs that differ from the pinned values of `case`"""
+    content, model = case["content"], case["model"]
+    parsed = parse_markdown(content, model, case["google_citations"])
+    outputs = {
+        "clean_text": parsed.clean_text,
+        "text_without_links": parsed.text_without_links,
+        "links": parsed.links,
+        "clean_markdown": clean_markdown(content),
+        "extract_clean_links": extract_clean_links(
+            content, model, case["google_citations"]
+        ),
+    }
+    pinned = dict(
+        case, clean_markdown=case["clean_text"], extract_clean_links=case["links"]
+    )
+    return [name for name, value in outputs.items() if value != pinned[name]]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "check":
+        print(__doc__)
+        sys.exit(1)
+
+    failures = 0
+    for index, case in enumerate(PARITY_CASES):
+        fields = check_case(case)
+        if fields:
+            failures += 1
+            print(f"MISMATCH case {index} ({case['model']}): {', '.join(fields)}")
+    print(f"{len(PARITY_CASES)} cases checked, {failures} mismatches")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,913 @@
+"""
+Versioned schema migrations.
+
+Every migration runs once and is recorded in the `schema_migrations` table.
+Migrations (some of them long data backfills) and the partition / ClickHouse
+maintenance run from this CLI, as a one-shot job before the API and the
+workers start (the `migrate` service of docker-compose). A process only checks
+at start that the schema is at head, and refuses to start otherwise. A Postgres
+advisory lock makes concurrent runs wait for each other instead of racing.
+
+Usage:
+    python -m src.infrastructure.migrations migrate
+    python -m src.infrastructure.migrations status
+    python -m src.infrastructure.migrations check
+"""
+
+import json
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Iterable, Optional
+
+from sqlalchemy import Connection, Engine, event, exc, text
+
+from src.infrastructure import rollup
+from src.infrastructure.domains import domain_normalizer
+from src.infrastructure.partitions import (
+    PARTITIONED_TABLES,
+    create_partition,
+    month_start,
+    partition_manager,
+)
+
+# Arbitrary constant identifying the migration advisory lock
+MIGRATION_LOCK_KEY = 48151623
+
+
+class Migration:
+    def __init__(
+        self,
+        version: int,
+        description: str,
+        statements: Optional[list[str]] = None,
+        run: Optional[Callable[[Engine], None]] = None,
+        transactional: bool = True,
+    ) -> None:
+        self.version = version
+        self.description = description
+        self.statements = statements or []
+        self.run = run
+        # Non transactional migrations (e.g. CREATE INDEX CONCURRENTLY) run
+        # in autocommit mode and must be idempotent.
+        self.transactional = transactional
+
+    def apply(self, engine: Engine) -> None:
+        if self.run:
+            self.run(engine)
+            return
+        if self.transactional:
+            with engine.begin() as connection:
+                for statement in self.statements:
+                    connection.execute(text(statement))
+            return
+        with engine.connect() as connection:
+            connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+            for statement in self.statements:
+                connection.execute(text(statement))
+
+
+# ------------------------------BASELINE------------------------------
+BASELINE = [
+    """
+    CREATE TABLE IF NOT EXISTS brands (
+        id SERIAL NOT NULL,
+        brand_report_id VARCHAR NOT NULL,
+        brand VARCHAR NOT NULL,
+        mention_count INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        date TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        model VARCHAR NOT NULL,
+        prompt_id VARCHAR NOT NULL,
+        s3_key VARCHAR NOT NULL,
+        PRIMARY KEY (id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS citations (
+        id VARCHAR NOT NULL,
+        brand_report_id VARCHAR NOT NULL,
+        prompt_id VARCHAR NOT NULL,
+        date VARCHAR NOT NULL,
+        model VARCHAR NOT NULL,
+        brand VARCHAR NOT NULL,
+        rank INTEGER,
+        title VARCHAR,
+        domain VARCHAR,
+        norm_url VARCHAR,
+        s3_key VARCHAR,
+        PRIMARY KEY (id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS output_reports (
+        id VARCHAR NOT NULL,
+        brand_report_id VARCHAR NOT NULL,
+        prompt_id VARCHAR NOT NULL,
+        date VARCHAR NOT NULL,
+        model VARCHAR NOT NULL,
+        snapshot VARCHAR NOT NULL,
+        markdown VARCHAR NOT NULL,
+        PRIMARY KEY (id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sentiments (
+        id VARCHAR NOT NULL,
+        brand_report_id VARCHAR NOT NULL,
+        prompt_id VARCHAR NOT NULL,
+        date VARCHAR NOT NULL,
+        model VARCHAR NOT NULL,
+        brand VARCHAR NOT NULL,
+        brand_model VARCHAR,
+        positive_phrases JSON NOT NULL,
+        negative_phrases JSON NOT NULL,
+        PRIMARY KEY (id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS token_reports (
+        id VARCHAR NOT NULL,
+        brand_report_id VARCHAR NOT NULL,
+        prompt_id VARCHAR NOT NULL,
+        date VARCHAR NOT NULL,
+        model VARCHAR NOT NULL,
+        prompt_token_count INTEGER NOT NULL,
+        output_token_count INTEGER NOT NULL,
+        total_token_count INTEGER NOT NULL,
+        action VARCHAR NOT NULL,
+        PRIMARY KEY (id)
+    )
+    """,
+    """
+    ALTER TABLE token_reports
+    ADD COLUMN IF NOT EXISTS cached BOOLEAN NOT NULL DEFAULT FALSE
+    """,
+]
+
+
+# ------------------------------INDEXES------------------------------
+# (index name, table, indexed expression) matching the DataBase access paths
+ANALYTICS_INDEXES = [
+    # get_brand_sov / coverage / position / ranking / ranking_over_time
+    ("ix_brands_report_date_model", "brands", "brand_report_id, date, model"),
+    # get_brand_mention: LOWER(brand) = LOWER(:brand)
+    (
+        "ix_brands_report_lower_brand_date",
+        "brands",
+        "brand_report_id, LOWER(brand), date",
+    ),
+    # get_citations
+    ("ix_citations_prompt_date_model", "citations", "prompt_id, date, model"),
+    # get_citations_by_report
+    ("ix_citations_report_date", "citations", "brand_report_id, date"),
+    # get_sentiments
+    ("ix_sentiments_prompt_date_model", "sentiments", "prompt_id, date, model"),
+    # get_report_dates
+    ("ix_output_reports_prompt_date", "output_reports", "prompt_id, date"),
+    # get_report_outputs
+    (
+        "ix_output_reports_report_prompt_date",
+        "output_reports",
+        "brand_report_id, prompt_id, date",
+    ),
+]
+
+
+def create_indexes(
+    engine: Engine, indexes: list[tuple[str, str, str]] = ANALYTICS_INDEXES
+) -> None:
+    """Build indexes without blocking writes (CREATE INDEX CONCURRENTLY)"""
+    with engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        for name, table, columns in indexes:
+            # A failed concurrent build leaves an INVALID index behind
+            invalid = connection.execute(
+                text("""
+                    SELECT 1 FROM pg_index i
+                    JOIN pg_class c ON c.oid = i.indexrelid
+                    WHERE c.relname = :name AND NOT i.indisvalid
+                    """),
+                {"name": name},
+            ).first()
+            if invalid:
+                connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+            print(f"MIGRATIONS: Creating index {name}")
+            connection.execute(
+                text(
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+                    f"ON {table} ({columns})"
+                )
+            )
+
+
+# ------------------------------TYPED DATES------------------------------
+TYPED_DATE_TABLES = ["citations", "sentiments", "output_reports", "token_reports"]
+BACKFILL_BATCH_SIZE = 5000
+
+TRY_TIMESTAMP_FUNCTION = """
+CREATE OR REPLACE FUNCTION migration_try_timestamp(value TEXT)
+RETURNS TIMESTAMP AS $$
+BEGIN
+    RETURN value::TIMESTAMP;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE
+"""
+
+SYNC_TYPED_DATE_FUNCTION = """
+CREATE OR REPLACE FUNCTION migration_sync_typed_date()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.date_typed := migration_try_timestamp(NEW.date);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def column_type(connection: Connection, table: str, column: str) -> Optional[str]:
+    return connection.execute(
+        text(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE table_name = :table AND column_name = :column"
+        ),
+        {"table": table, "column": column},
+    ).scalar()
+
+
+def convert_date_column(
+    engine: Engine, table: str, batch_size: int = BACKFILL_BATCH_SIZE
+) -> None:
+    """
+    Convert `table.date` from VARCHAR to TIMESTAMP without a long lock:
+    add a shadow column kept in sync by a trigger, backfill it in small
+    committed batches, index it concurrently, then swap the columns in one
+    short transaction.
+    """
+    with engine.begin() as connection:
+        if column_type(connection, table, "date") != "character varying":
+            return
+        connection.execute(
+            text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS date_typed TIMESTAMP")
+        )
+        connection.execute(text(f"DROP TRIGGER IF EXISTS {table}_sync_date ON {table}"))
+        connection.execute(
+            text(
+                f"CREATE TRIGGER {table}_sync_date BEFORE INSERT OR UPDATE OF date "
+                f"ON {table} FOR EACH ROW EXECUTE FUNCTION migration_sync_typed_date()"
+            )
+        )
+
+    # Backfill by primary key ranges, committing each batch
+    last_id = ""
+    while True:
+        with engine.begin() as connection:
+            ids = (
+                connection.execute(
+                    text(
+                        f"SELECT id FROM {table} WHERE id > :last_id "
+                        f"ORDER BY id LIMIT :batch_size"
+                    ),
+                    {"last_id": last_id, "batch_size": batch_size},
+                )
+                .scalars()
+                .all()
+            )
+            if not ids:
+                break
+            connection.execute(
+                text(
+                    f"UPDATE {table} SET date_typed = migration_try_timestamp(date) "
+                    f"WHERE id = ANY(:ids)"
+                ),
+                {"ids": list(ids)},
+            )
+            last_id = ids[-1]
+        print(f"MIGRATIONS: {table} backfilled up to id {last_id}")
+
+    # Index the new column before the swap so reads never lose their index
+    typed_indexes = [
+        (f"{name}_typed", index_table, columns.replace("date", "date_typed"))
+        for name, index_table, columns in ANALYTICS_INDEXES
+        if index_table == table and "date" in columns
+    ]
+    create_indexes(engine, typed_indexes)
+
+    with engine.begin() as connection:
+        connection.execute(text(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE"))
+        connection.execute(text(f"DROP TRIGGER IF EXISTS {table}_sync_date ON {table}"))
+        connection.execute(text(f"ALTER TABLE {table} DROP COLUMN date"))
+        connection.execute(
+            text(f"ALTER TABLE {table} RENAME COLUMN date_typed TO date")
+        )
+        for name, _, _ in typed_indexes:
+            connection.execute(
+                text(f"ALTER INDEX IF EXISTS {name} RENAME TO {name[: -len('_typed')]}")
+            )
+        unparsed = connection.execute(
+            text(f"SELECT COUNT(*) FROM {table} WHERE date IS NULL")
+        ).scalar()
+    if unparsed:
+        print(f"MIGRATIONS: {table} has {unparsed} rows with an unparseable date")
+        return
+    # SET NOT NULL only scans the table, it does not rewrite it
+    with engine.begin() as connection:
+        connection.execute(text(f"ALTER TABLE {table} ALTER COLUMN date SET NOT NULL"))
+
+
+def convert_date_columns(engine: Engine) -> None:
+    with engine.begin() as connection:
+        connection.execute(text(TRY_TIMESTAMP_FUNCTION))
+        connection.execute(text(SYNC_TYPED_DATE_FUNCTION))
+    for table in TYPED_DATE_TABLES:
+        convert_date_column(engine, table)
+    with engine.begin() as connection:
+        connection.execute(text("DROP FUNCTION IF EXISTS migration_sync_typed_date()"))
+        connection.execute(
+            text("DROP FUNCTION IF EXISTS migration_try_timestamp(TEXT)")
+        )
+
+
+# ------------------------------DAILY ROLLUP------------------------------
+DAILY_ROLLUP = [
+    """
+    CREATE TABLE IF NOT EXISTS brand_daily_metrics (
+        brand_report_id VARCHAR NOT NULL,
+        day DATE NOT NULL,
+        model VARCHAR NOT NULL,
+        brand VARCHAR NOT NULL,
+        mention_sum BIGINT NOT NULL DEFAULT 0,
+        position_sum BIGINT NOT NULL DEFAULT 0,
+        position_count INTEGER NOT NULL DEFAULT 0,
+        mentioned_s3_keys INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (brand_report_id, day, model, brand)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS report_daily_documents (
+        brand_report_id VARCHAR NOT NULL,
+        day DATE NOT NULL,
+        model VARCHAR NOT NULL,
+        document_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (brand_report_id, day, model)
+    )
+    """,
+]
+# rollup.update_daily_metrics looks up the documents already saved
+ROLLUP_INDEXES = [("ix_brands_s3_key", "brands", "s3_key")]
+
+
+def create_daily_rollup(engine: Engine) -> None:
+    with engine.begin() as connection:
+        for statement in DAILY_ROLLUP:
+            connection.execute(text(statement))
+    create_indexes(engine, ROLLUP_INDEXES)
+    rollup.rebuild(engine)
+
+
+# ------------------------------CITATION DOMAINS------------------------------
+# get_domain_citation_coverage filters on the stored normalized domain
+CITATION_DOMAIN_INDEXES = [
+    ("ix_citations_domain_report_date", "citations", "domain, brand_report_id, date")
+]
+# domains renamed per UPDATE (one scan of citations each)
+DOMAIN_BATCH_SIZE = 1000
+
+
+def normalize_citation_domains(engine: Engine) -> None:
+    """Make sure every stored citations.domain is normalized, then index it"""
+    with engine.begin() as connection:
+        domains = connection.execute(
+            text("SELECT DISTINCT domain FROM citations WHERE domain IS NOT NULL")
+        ).scalars()
+        renamed = {
+            domain: domain_normalizer.normalize(domain)
+            for domain in domains
+            if domain_normalizer.normalize(domain) != domain
+        }
+    mappings = sorted(renamed.items())
+    for start in range(0, len(mappings), DOMAIN_BATCH_SIZE):
+        batch = mappings[start : start + DOMAIN_BATCH_SIZE]
+        with engine.begin() as connection:
+            connection.execute(
+                text("""
+                    UPDATE citations c SET domain = m.normalized
+                    FROM unnest(
+                        CAST(:domains AS VARCHAR[]), CAST(:normalized AS VARCHAR[])
+                    ) AS m(domain, normalized)
+                    WHERE c.domain = m.domain
+                    """),
+                {
+                    "domains": [domain for domain, _ in batch],
+                    "normalized": [normalized for _, normalized in batch],
+                },
+            )
+    print(f"MIGRATIONS: Normalized {len(renamed)} citation domains")
+    create_indexes(engine, CITATION_DOMAIN_INDEXES)
+
+
+# ------------------------------PARTITIONS------------------------------
+SWAP_LOCK_TIMEOUT = "5s"
+SWAP_ATTEMPTS = 5
+SYNC_PARTITIONED_FUNCTION = """
+CREATE OR REPLACE FUNCTION migration_sync_partitioned()
+RETURNS TRIGGER AS $$
+BEGIN
+    EXECUTE format(
+        'INSERT INTO %I SELECT ($1).* ON CONFLICT DO NOTHING',
+        TG_TABLE_NAME || '_partitioned'
+    ) USING NEW;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def is_partitioned(connection: Connection, table: str) -> bool:
+    return bool(
+        connection.execute(
+            text(
+                "SELECT 1 FROM pg_partitioned_table "
+                "WHERE partrelid = to_regclass(:table)"
+            ),
+            {"table": table},
+        ).first()
+    )
+
+
+def partition_table(
+    engine: Engine, table: str, batch_size: int = BACKFILL_BATCH_SIZE
+) -> None:
+    """
+    Rebuild `table` as a table partitioned by month on `date` (primary key
+    (id, date)) without a long lock: new rows are mirrored by a trigger
+    while the existing ones are copied in small committed batches, then
+    the tables are swapped in one short transaction.
+    """
+    shadow = f"{table}_partitioned"
+    indexes = [
+        (name, columns)
+        for name, index_table, columns in ANALYTICS_INDEXES
+        + ROLLUP_INDEXES
+        + CITATION_DOMAIN_INDEXES
+        if index_table == table
+    ]
+    with engine.begin() as connection:
+        if is_partitioned(connection, table):
+            return
+        unparsed = connection.execute(
+            text(f"SELECT COUNT(*) FROM {table} WHERE date IS NULL")
+        ).scalar()
+        if unparsed:
+            # the partition key is part of the primary key: it cannot be NULL
+            connection.execute(
+                text(f"CREATE TABLE IF NOT EXISTS {table}_undated (LIKE {table})")
+            )
+            connection.execute(
+                text(
+                    f"WITH moved AS (DELETE FROM {table} WHERE date IS NULL "
+                    f"RETURNING *) INSERT INTO {table}_undated SELECT * FROM moved"
+                )
+            )
+            print(
+                f"MIGRATIONS: Moved {unparsed} undated {table} rows to {table}_undated"
+            )
+        first, last = connection.execute(
+            text(f"SELECT MIN(date), MAX(date) FROM {table}")
+        ).one()
+        connection.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {shadow} "
+                f"(LIKE {table} INCLUDING DEFAULTS, "
+                f"CONSTRAINT {shadow}_pkey PRIMARY KEY (id, date)) "
+                f"PARTITION BY RANGE (date)"
+            )
+        )
+        # every month holding data, up to the partitions made ahead
+        today = month_start(datetime.now())
+        month = min(month_start(first), today) if first else today
+        end = max(month_start(last), today) if last else today
+        end = month_start(end, partition_manager.premake_months)
+        while month <= end:
+            create_partition(connection, table, month, parent=shadow)
+            month = month_start(month, 1)
+        # a backdated insert during the copy must not fail in the trigger
+        connection.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {table}_pdefault "
+                f"PARTITION OF {shadow} DEFAULT"
+            )
+        )
+        # index the empty parent (and so every partition) before loading it
+        for name, columns in indexes:
+            connection.execute(
+                text(
+                    f"CREATE INDEX IF NOT EXISTS {name}_partitioned ON {shadow} ({columns})"
+                )
+            )
+        connection.execute(
+            text(f"DROP TRIGGER IF EXISTS {table}_sync_partitioned ON {table}")
+        )
+        connection.execute(
+            text(
+                f"CREATE TRIGGER {table}_sync_partitioned AFTER INSERT ON {table} "
+                f"FOR EACH ROW EXECUTE FUNCTION migration_sync_partitioned()"
+            )
+        )
+        last_id = 0 if column_type(connection, table, "id") == "integer" else ""
+
+    # Copy by primary key ranges, committing each batch
+    while True:
+        with engine.begin() as connection:
+            ids = (
+                connection.execute(
+                    text(
+                        f"SELECT id FROM {table} WHERE id > :last_id "
+                        f"ORDER BY id LIMIT :batch_size"
+                    ),
+                    {"last_id": last_id, "batch_size": batch_size},
+                )
+                .scalars()
+                .all()
+            )
+            if not ids:
+                break
+            connection.execute(
+                text(
+                    f"INSERT INTO {shadow} SELECT * FROM {table} "
+                    f"WHERE id = ANY(:ids) ON CONFLICT DO NOTHING"
+                ),
+                {"ids": list(ids)},
+            )
+            last_id = ids[-1]
+        print(f"MIGRATIONS: {table} copied up to id {last_id}")
+
+    with engine.begin() as connection:
+        drain_default(connection, table, shadow, reattach=True)
+
+    # The trigger mirrors a row in the transaction inserting it, so any one
+    # snapshot sees both tables alike: the check needs no lock, and the swap
+    # below does not scan anything while it blocks the table.
+    with engine.begin() as connection:
+        counts = connection.execute(
+            text(
+                f"SELECT (SELECT COUNT(*) FROM {table}), (SELECT COUNT(*) FROM {shadow})"
+            )
+        ).one()
+    if counts[0] != counts[1]:
+        raise RuntimeError(f"{table}: copied {counts[1]} of {counts[0]} rows")
+
+    for attempt in range(1, SWAP_ATTEMPTS + 1):
+        try:
+            swap_partitioned(engine, table, shadow, indexes)
+            return
+        except exc.OperationalError as e:
+            # lock_timeout: a long transaction holds the table, try again
+            print(f"MIGRATIONS: {table} swap attempt {attempt} failed: {e.orig}")
+            time.sleep(attempt)
+    raise RuntimeError(f"{table}: unable to lock the table for the swap")
+
+
+def drain_default(
+    connection: Connection, table: str, shadow: str, reattach: bool
+) -> None:
+    """
+    Move the rows of the shadow's DEFAULT partition (dates outside the
+    months made up front) to their own month partitions. The partitioned
+    table is left without a DEFAULT partition, so that later months can
+    always be created.
+    """
+    default = f"{table}_pdefault"
+    months = (
+        connection.execute(
+            text(f"SELECT DISTINCT date_trunc('month', date) FROM {default}")
+        )
+        .scalars()
+        .all()
+    )
+    if months:
+        connection.execute(text(f"ALTER TABLE {shadow} DETACH PARTITION {default}"))
+        for month in months:
+            create_partition(connection, table, month.date(), parent=shadow)
+        connection.execute(text(f"INSERT INTO {shadow} SELECT * FROM {default}"))
+        connection.execute(text(f"TRUNCATE {default}"))
+        if reattach:
+            connection.execute(
+                text(f"ALTER TABLE {shadow} ATTACH PARTITION {default} DEFAULT")
+            )
+    if not reattach:
+        connection.execute(text(f"DROP TABLE {default}"))
+
+
+def swap_partitioned(
+    engine: Engine, table: str, shadow: str, indexes: list[tuple[str, str]]
+) -> None:
+    """Replace `table` by its partitioned copy (a few catalog updates)"""
+    with engine.begin() as connection:
+        # waiting for the lock queues every other query behind it: give up
+        # early instead
+        connection.execute(text(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'"))
+        connection.execute(text(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE"))
+        connection.execute(
+            text(f"DROP TRIGGER IF EXISTS {table}_sync_partitioned ON {table}")
+        )
+        # usually empty: rows routed there since the first drain
+        drain_default(connection, table, shadow, reattach=False)
+        # the brands id sequence must survive the old table
+        sequence = connection.execute(
+            text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": table}
+        ).scalar()
+        if sequence:
+            connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {shadow}.id"))
+        connection.execute(text(f"DROP TABLE {table}"))
+        connection.execute(text(f"ALTER TABLE {shadow} RENAME TO {table}"))
+        connection.execute(
+            text(f"ALTER TABLE {table} RENAME CONSTRAINT {shadow}_pkey TO {table}_pkey")
+        )
+        for name, _ in indexes:
+            connection.execute(text(f"ALTER INDEX {name}_partitioned RENAME TO {name}"))
+
+
+def partition_tables(engine: Engine) -> None:
+    with engine.begin() as connection:
+        connection.execute(text(SYNC_PARTITIONED_FUNCTION))
+    for table in PARTITIONED_TABLES:
+        partition_table(engine, table)
+    with engine.begin() as connection:
+        connection.execute(text("DROP FUNCTION IF EXISTS migration_sync_partitioned()"))
+    partition_manager.reset()
+
+
+# ------------------------------CLICKHOUSE OUTBOX------------------------------
+# reports with saved rows not (yet) mirrored to ClickHouse, see clickhouse.py
+CLICKHOUSE_OUTBOX = [
+    """
+    CREATE TABLE IF NOT EXISTS clickhouse_outbox (
+        id BIGSERIAL PRIMARY KEY,
+        brand_report_id VARCHAR NOT NULL,
+        created_at TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_clickhouse_outbox_report "
+    "ON clickhouse_outbox (brand_report_id)",
+]
+
+
+MIGRATIONS = [
+    Migration(1, "Baseline tables", statements=BASELINE),
+    Migration(
+        2,
+        "Analytics indexes",
+        run=create_indexes,
+        transactional=False,
+    ),
+    Migration(
+        3,
+        "Typed date columns for citations, sentiments and reports",
+        run=convert_date_columns,
+        transactional=False,
+    ),
+    Migration(
+        4,
+        "Daily brand rollup",
+        run=create_daily_rollup,
+        transactional=False,
+    ),
+    Migration(
+        5,
+        "Normalized citation domains",
+        run=normalize_citation_domains,
+        transactional=False,
+    ),
+    Migration(
+        6,
+        "Monthly partitions for brands and citations",
+        run=partition_tables,
+        transactional=False,
+    ),
+    Migration(7, "ClickHouse outbox", statements=CLICKHOUSE_OUTBOX),
+]
+
+
+# ------------------------------RUNNER------------------------------
+@contextmanager
+def migration_lock(engine: Engine):
+    with engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        connection.execute(
+            text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY}
+        )
+        try:
+            yield
+        finally:
+            connection.execute(
+                text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY}
+            )
+
+
+def applied_versions(engine: Engine) -> set[int]:
+    with engine.begin() as connection:
+        connection.execute(text("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    description VARCHAR NOT NULL,
+                    applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+                )
+                """))
+        rows = connection.execute(text("SELECT version FROM schema_migrations"))
+        return {row[0] for row in rows}
+
+
+def pending_versions(engine: Engine) -> list[int]:
+    """Versions of the migrations not applied yet (read only)"""
+    done = set()
+    with engine.connect() as connection:
+        table = connection.execute(text("SELECT to_regclass('schema_migrations')"))
+        if table.scalar() is not None:
+            rows = connection.execute(text("SELECT version FROM schema_migrations"))
+            done = {row[0] for row in rows}
+    return [m.version for m in MIGRATIONS if m.version not in done]
+
+
+def require_head(engine: Engine) -> None:
+    """Fail fast when the schema is behind the code"""
+    pending = pending_versions(engine)
+    if pending:
+        raise RuntimeError(
+            f"Database schema is not at head, pending migrations {pending}: "
+            "run `python -m src.infrastructure.migrations migrate`"
+        )
+
+
+def migrate(
+    engine: Engine, maintenance: Iterable[Callable[[Engine], None]] = ()
+) -> list[int]:
+    """
+    Apply every pending migration, in order, and return their versions.
+    The `maintenance` steps run next, still holding the migration lock.
+    """
+    applied = []
+    with migration_lock(engine):
+        done = applied_versions(engine)
+        for migration in MIGRATIONS:
+            if migration.version in done:
+                continue
+            print(f"MIGRATIONS: Applying {migration.version} {migration.description}")
+            migration.apply(engine)
+            with engine.begin() as connection:
+                connection.execute(
+                    text(
+                        "INSERT INTO schema_migrations (version, description) "
+                        "VALUES (:version, :description)"
+                    ),
+                    {
+                        "version": migration.version,
+                        "description": migration.description,
+                    },
+                )
+            applied.append(migration.version)
+        for step in maintenance:
+            step(engine)
+    return applied
+
+
+# ------------------------------INDEX CHECK------------------------------
+# (DataBase method, arguments, index the query must use)
+WINDOW = dict(
+    brand_report_id="x", start_date="2025-01-01", end_date="2025-01-08", model="all"
+)
+INDEX_CHECKS = [
+    ("get_brand_mention", dict(WINDOW, brand="x"), "brand_daily_metrics_pkey"),
+    ("get_brand_sov", dict(WINDOW, brand="x"), "brand_daily_metrics_pkey"),
+    ("get_brand_coverage", dict(WINDOW, brand="x"), "brand_daily_metrics_pkey"),
+    ("get_brand_position", dict(WINDOW, brand="x"), "brand_daily_metrics_pkey"),
+    ("get_brand_ranking", WINDOW, "brand_daily_metrics_pkey"),
+    ("get_brand_ranking_over_time", WINDOW, "brand_daily_metrics_pkey"),
+    (
+        "get_citations",
+        dict(prompt_id="x", date="2025-01-01", model="chatgpt"),
+        "ix_citations_prompt_date_model",
+    ),
+    ("get_citations_by_report", WINDOW, "ix_citations_report_date"),
+    (
+        "get_domain_citation_coverage",
+        dict(WINDOW, domain="x.com"),
+        "ix_citations_domain_report_date",
+    ),
+    (
+        "get_sentiments",
+        dict(prompt_id="x", date="2025-01-01", model="chatgpt"),
+        "ix_sentiments_prompt_date_model",
+    ),
+    (
+        "get_report_outputs",
+        dict(brand_report_id="x", prompt_id="x", date="2025-01-01", model="chatgpt"),
+        "ix_output_reports_report_prompt_date",
+    ),
+    (
+        "get_report_dates",
+        dict(prompt_id="x", max_dates="2025-01-01"),
+        "ix_output_reports_prompt_date",
+    ),
+]
+
+
+def _plan_indexes(plan: dict) -> set[str]:
+    names = set()
+    if "Index Name" in plan:
+        names.add(plan["Index Name"])
+    for child in plan.get("Plans", []):
+        names |= _plan_indexes(child)
+    return names
+
+
+def check_indexes(database) -> list[dict]:
+    """
+    Run every analytics query of `database` and EXPLAIN the SQL it sends
+    (with sequential scans disabled, so empty tables do not hide missing
+    indexes). Returns one result per query with the indexes it used.
+    """
+    results = []
+    for method, arguments, expected in INDEX_CHECKS:
+        captured: list[tuple[str, object]] = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            captured.append((statement, parameters))
+
+        event.listen(database.engine, "before_cursor_execute", capture)
+        try:
+            getattr(database, method)(**arguments)
+        finally:
+            event.remove(database.engine, "before_cursor_execute", capture)
+
+        used: set[str] = set()
+        with database.engine.begin() as connection:
+            connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+            for statement, parameters in captured:
+                used |= explain(connection, statement, parameters)
+            used |= parent_indexes(connection, used)
+        results.append(
+            {
+                "query": method,
+                "expected": expected,
+                "used": sorted(used),
+                "ok": expected in used,
+            }
+        )
+    return results
+
+
+def parent_indexes(connection: Connection, names: set[str]) -> set[str]:
+    """Names of the partitioned indexes the partition indexes belong to"""
+    return set(
+        connection.execute(
+            text(
+                "SELECT parent.relname FROM pg_inherits i "
+                "JOIN pg_class parent ON parent.oid = i.inhparent "
+                "JOIN pg_class child ON child.oid = i.inhrelid "
+                "WHERE child.relname = ANY(:names)"
+            ),
+            {"names": list(names)},
+        ).scalars()
+    )
+
+
+def explain(connection: Connection, statement: str, parameters) -> set[str]:
+    row = connection.exec_driver_sql(
+        f"EXPLAIN (FORMAT JSON) {statement}", parameters or ()
+    ).first()
+    plan = row[0] if row else []
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return _plan_indexes(plan[0]["Plan"]) if plan else set()
+
+
+if __name__ == "__main__":
+    from src.infrastructure.database import DataBase, create_db_engine
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "migrate"
+    engine = create_db_engine()
+
+    if command == "migrate":
+        applied = DataBase(engine=engine).migrate()
+        print(f"Applied: {applied or 'nothing to do'}")
+    elif command == "status":
+        done = applied_versions(engine)
+        for migration in MIGRATIONS:
+            state = "applied" if migration.version in done else "pending"
+            print(f"{migration.version:>4} {state:<8} {migration.description}")
+    elif command == "check":
+        failed = False
+        for result in check_indexes(DataBase(engine=engine)):
+            status = "OK  " if result["ok"] else "FAIL"
+            failed = failed or not result["ok"]
+            print(
+                f"{status} {result['query']:<28} expected {result['expected']} used {result['used']}"
+            )
+        sys.exit(1 if failed else 0)
+    else:
+        print(__doc__)
+        sys.exit(2)
@@ -27,7 +27,7 @@ class Sentiments(SQLModel, table=True):
     id: str = Field(primary_key=True)
     brand_report_id: str
     prompt_id: str
-    date: str
+    date: datetime
     model: str
     brand: str
     brand_model: Optional[str]
@@ -39,7 +39,7 @@ class Citations(SQLModel, table=True):
     id: str = Field(primary_key=True)
     brand_report_id: str
     prompt_id: str
-    date: str
+    date: datetime
     model: str
     brand: str
     rank: Optional[int]
@@ -53,7 +53,7 @@ class Output_Reports(SQLModel, table=True):
     id: str = Field(primary_key=True)
     brand_report_id: str
     prompt_id: str
-    date: str
+    date: datetime
     model: str
     snapshot: str
     markdown: str
@@ -63,12 +63,13 @@ class Token_Reports(SQLModel, table=True):
     id: str = Field(primary_key=True)
     brand_report_id: str
     prompt_id: str
-    date: str
+    date: datetime
     model: str
     prompt_token_count: int
     output_token_count: int
     total_token_count: int
     action: str
+    cached: bool = False
 
 
 class Brand_Metrics(BaseModel):
@@ -82,5 +83,10 @@ class Brand_List(BaseModel):
     # position: int
 
 
+class BrandSentimentBody(BaseModel):
+    brands: list[Brand_List]
+    sentiments: list[SentimentBody]
+
+
 class Domain_Model(BaseModel):
     domain: str
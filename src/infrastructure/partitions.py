@@ -0,0 +1,209 @@
+"""
+Monthly range partitions of `brands` and `citations` (on `date`).
+
+Partitions are named <table>_pYYYYMM. `maintain` (run under the migration
+lock after the migrations, by the one-shot migrate job; schedule the command
+below to keep it applied between deploys) creates the partitions of the coming
+PARTITION_PREMAKE_MONTHS months and applies the retention policy: the
+partitions entirely older than PARTITION_RETENTION_MONTHS are detached
+and moved to the PARTITION_ARCHIVE_SCHEMA schema (kept, but no longer
+queried). The daily rollup keeps the brand metrics of archived months.
+
+Usage:
+    python -m src.infrastructure.partitions maintain
+    python -m src.infrastructure.partitions status
+"""
+
+import sys
+import threading
+from datetime import date, datetime
+from typing import Iterable, Optional
+
+from sqlalchemy import Connection, Engine, text
+
+from src.config import config
+
+PARTITIONED_TABLES = ["brands", "citations"]
+# Arbitrary constant identifying the partition creation advisory lock
+PARTITION_LOCK_KEY = 48151624
+
+
+def month_start(value: date, offset: int = 0) -> date:
+    """First day of the month of `value`, shifted by `offset` months"""
+    months = value.year * 12 + value.month - 1 + offset
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+def create_partition(
+    connection: Connection, table: str, month: date, parent: Optional[str] = None
+) -> None:
+    """Create the `month` partition of `table` (attached to `parent` if set)"""
+    connection.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} "
+            f"PARTITION OF {parent or table} "
+            f"FOR VALUES FROM ('{month}') TO ('{month_start(month, 1)}')"
+        )
+    )
+
+
+class PartitionManager:
+    """
+    Creates missing monthly partitions. The months known to exist are
+    cached per process, so the check before every save is free unless a
+    row falls in a new month.
+    """
+
+    def __init__(
+        self,
+        premake_months: int = config.PARTITION_PREMAKE_MONTHS,
+        retention_months: int = config.PARTITION_RETENTION_MONTHS,
+        archive_schema: str = config.PARTITION_ARCHIVE_SCHEMA,
+    ) -> None:
+        self.premake_months = premake_months
+        self.retention_months = retention_months
+        self.archive_schema = archive_schema
+        self._lock = threading.Lock()
+        self._partitioned: dict[str, bool] = {}
+        self._months: dict[str, set[date]] = {}
+
+    def _load(self, engine: Engine, table: str) -> bool:
+        """Whether `table` is partitioned (and cache its current months)"""
+        if table in self._partitioned:
+            return self._partitioned[table]
+        with engine.connect() as connection:
+            partitioned = bool(
+                connection.execute(
+                    text(
+                        "SELECT 1 FROM pg_partitioned_table p "
+                        "JOIN pg_class c ON c.oid = p.partrelid "
+                        "WHERE c.relname = :table AND c.relnamespace = "
+                        "'public'::regnamespace"
+                    ),
+                    {"table": table},
+                ).first()
+            )
+            months = set()
+            if partitioned:
+                names = connection.execute(
+                    text(
+                        "SELECT child.relname FROM pg_inherits i "
+                        "JOIN pg_class parent ON parent.oid = i.inhparent "
+                        "JOIN pg_class child ON child.oid = i.inhrelid "
+                        "WHERE parent.relname = :table"
+                    ),
+                    {"table": table},
+                ).scalars()
+                prefix = f"{table}_p"
+                months = {
+                    datetime.strptime(name[len(prefix) :], "%Y%m").date()
+                    for name in names
+                    if name.startswith(prefix) and name[len(prefix) :].isdigit()
+                }
+        self._partitioned[table] = partitioned
+        self._months[table] = months
+        return partitioned
+
+    def reset(self) -> None:
+        with self._lock:
+            self._partitioned.clear()
+            self._months.clear()
+
+    def ensure(self, engine: Engine, table: str, dates: Iterable[datetime]) -> None:
+        """Create the partitions of `dates` that do not exist yet"""
+        with self._lock:
+            if not self._load(engine, table):
+                return
+            missing = {month_start(d) for d in dates if d} - self._months[table]
+            if not missing:
+                return
+            # own short transaction: never hold the parent lock while saving.
+            # Concurrent CREATE TABLE IF NOT EXISTS can still collide, so the
+            # processes creating partitions take turns.
+            with engine.begin() as connection:
+                connection.execute(
+                    text("SELECT pg_advisory_xact_lock(:key)"),
+                    {"key": PARTITION_LOCK_KEY},
+                )
+                for month in sorted(missing):
+                    print(f"PARTITIONS: Creating {partition_name(table, month)}")
+                    create_partition(connection, table, month)
+            self._months[table] |= missing
+
+    def maintain(self, engine: Engine, today: Optional[date] = None) -> None:
+        """Create the coming months' partitions, then apply the retention"""
+        self.reset()
+        today = today or date.today()
+        months = [
+            month_start(today, offset) for offset in range(self.premake_months + 1)
+        ]
+        for table in PARTITIONED_TABLES:
+            self.ensure(engine, table, months)
+            if self.retention_months > 0:
+                self.apply_retention(engine, table, today)
+
+    def apply_retention(self, engine: Engine, table: str, today: date) -> list[str]:
+        """Detach (and archive) the partitions older than the retention"""
+        cutoff = month_start(today, -self.retention_months)
+        with self._lock:
+            if not self._load(engine, table):
+                return []
+            expired = sorted(m for m in self._months[table] if m < cutoff)
+        detached = []
+        with engine.connect() as connection:
+            # DETACH ... CONCURRENTLY cannot run inside a transaction block
+            connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+            for month in expired:
+                name = partition_name(table, month)
+                print(f"PARTITIONS: Detaching {name}")
+                connection.execute(
+                    text(f"ALTER TABLE {table} DETACH PARTITION {name} CONCURRENTLY")
+                )
+                if self.archive_schema:
+                    connection.execute(
+                        text(f"CREATE SCHEMA IF NOT EXISTS {self.archive_schema}")
+                    )
+                    connection.execute(
+                        text(f"ALTER TABLE {name} SET SCHEMA {self.archive_schema}")
+                    )
+                detached.append(name)
+        with self._lock:
+            self._months[table] -= set(expired)
+        return detached
+
+    def status(self, engine: Engine) -> dict[str, list[str]]:
+        self.reset()
+        with self._lock:
+            return {
+                table: [
+                    partition_name(table, month)
+                    for month in sorted(self._months[table])
+                ]
+                for table in PARTITIONED_TABLES
+                if self._load(engine, table)
+            }
+
+
+partition_manager = PartitionManager()
+
+
+if __name__ == "__main__":
+    from src.infrastructure.database import create_db_engine
+
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    engine = create_db_engine()
+    if command == "maintain":
+        from src.infrastructure.migrations import migration_lock
+
+        with migration_lock(engine):
+            partition_manager.maintain(engine)
+    elif command == "status":
+        for table, names in partition_manager.status(engine).items():
+            print(f"{table}: {len(names)} partitions {names[:1]} .. {names[-1:]}")
+    else:
+        print(__doc__)
+        sys.exit(1)
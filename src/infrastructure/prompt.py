@@ -154,6 +154,40 @@ def get_sentiment_user_prompt(clean_content: str) -> str:
     """
 
 
+# BRANDS + SENTIMENTS (FUSED) ---------------------------------------
+BRAND_SENTIMENT_SYSTEM_PROMPT = f"""
+You are given a user prompt, the answer text and the full rendered markdown.
+Return a single JSON object with two keys, "brands" and "sentiments".
+
+"brands": the primary brands/entities of the answer text, following these rules:
+{SYSTEM_PROMPT}
+
+"sentiments": a sentiment analysis of every brand in the rendered markdown.
+1. Parse **only the main rendered answer text** (ignore citations, footnotes, metadata).
+2. Detect **brands** and, if present, their **models** (e.g., Adidas Ultraboost 22 → model = Ultraboost 22, brand = Adidas).
+3. Extract **short descriptive phrases** (snippets) around each brand or model mention that describe quality, performance, or characteristics.
+4. Classify each phrase as Positive or Negative and attribute it to the correct brand/model.
+5. Each item has "brand", "brand_model" (empty string if none), "positive_phrases" and "negative_phrases".
+
+THE OUTPUT MUST BE A SINGLE LINE, COMPACT JSON STRING WITH NO PRETTY PRINTING OR LINE BREAKS
+"""
+
+
+def get_brand_sentiment_user_prompt(
+    answer_content: str, clean_content: str, prompt: str
+) -> str:
+    return f"""
+    User Prompt:
+    {prompt}
+
+    Here is the answer text you must parse for brands:
+    {answer_content}
+
+    Here is the rendered markdown you must parse for sentiments:
+    {clean_content}
+    """
+
+
 GET_DOMAIN_USER_PROMPT = """
 ### 🧠 Prompt: Identify Competitor Domains from URLs
 
@@ -0,0 +1,113 @@
+import threading
+import time
+from typing import Iterable
+
+from sqlalchemy import Engine, bindparam, text
+
+from src.config import config
+
+SELECT_PROMPTS = text(
+    "SELECT prompt_id, prompt FROM schedules WHERE prompt_id IN :prompt_ids"
+).bindparams(bindparam("prompt_ids", expanding=True))
+
+
+class PromptRepository:
+    """
+    Per-process TTL cache in front of the `schedules` prompt texts.
+
+    A prompt is fetched for every model of every daily run, so entries are
+    kept for `ttl` seconds. Prompts are edited outside this service, so an
+    edit is picked up once its entry expires. Unknown prompts are not cached
+    (a prompt created just after a lookup is found). Misses are loaded with
+    one bound-parameter query, however many ids are asked for.
+    """
+
+    def __init__(
+        self,
+        ttl: int = config.PROMPT_CACHE_TTL,
+        max_entries: int = config.PROMPT_CACHE_SIZE,
+    ) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._cache: dict[str, tuple[float, str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.queries = 0
+
+    def get_prompts(self, engine: Engine, prompt_ids: Iterable[str]) -> dict[str, str]:
+        """Map every prompt id to its text ("" when it does not exist)"""
+        prompt_ids = list(dict.fromkeys(prompt_ids))
+        now = time.monotonic()
+        prompts, missing = {}, []
+        with self._lock:
+            for prompt_id in prompt_ids:
+                cached = self._cache.get(prompt_id)
+                if cached and cached[0] > now:
+                    prompts[prompt_id] = cached[1]
+                else:
+                    missing.append(prompt_id)
+            self.hits += len(prompt_ids) - len(missing)
+            self.misses += len(missing)
+        if not missing:
+            return prompts
+
+        loaded = dict.fromkeys(missing, "")
+        with engine.connect() as connection:
+            rows = connection.execute(SELECT_PROMPTS, {"prompt_ids": missing})
+            for prompt_id, prompt in rows:
+                # same as the single lookup: the first row of a prompt wins
+                if not loaded[prompt_id] and prompt is not None:
+                    loaded[prompt_id] = str(prompt)
+
+        with self._lock:
+            self.queries += 1
+            if len(self._cache) + len(loaded) > self.max_entries:
+                self._cache.clear()
+            expires_at = now + self.ttl
+            for prompt_id, prompt in loaded.items():
+                if prompt:
+                    self._cache[prompt_id] = (expires_at, prompt)
+        prompts.update(loaded)
+        return prompts
+
+    def get_prompt(self, engine: Engine, prompt_id: str) -> str:
+        return self.get_prompts(engine, [prompt_id])[prompt_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "queries": self.queries,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._cache),
+            }
+
+
+prompt_repository = PromptRepository()
+
+
+if __name__ == "__main__":
+    # Per-task prompt lookup: uncached query vs the TTL cache
+    import timeit
+
+    from src.infrastructure.database import DataBase
+
+    engine = DataBase().engine
+    with engine.begin() as connection:
+        prompt_id = connection.execute(
+            text("SELECT prompt_id FROM schedules LIMIT 1")
+        ).scalar()
+    if prompt_id is None:
+        raise SystemExit("No prompt in schedules")
+
+    uncached = PromptRepository(ttl=0)
+    runs = 500
+    for name, repository in (("uncached", uncached), ("cached", prompt_repository)):
+        seconds = timeit.timeit(
+            lambda: repository.get_prompt(engine, prompt_id), number=runs
+        )
+        print(f"{name:>8}: {seconds / runs * 1e6:8.1f} us per lookup")
+    print(f"stats: {prompt_repository.stats()}")
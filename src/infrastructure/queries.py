@@ -0,0 +1,573 @@
+"""
+Statement builders and result shaping shared by `DataBase` (sync engine)
+and `AsyncDataBase` (async engine): both run the same SQL and return the
+same values, only the execution differs.
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Optional, Sequence
+
+from sqlalchemy import Select, TextClause
+from sqlmodel import SQLModel, and_, select, text
+
+from src.config import config
+from src.infrastructure.dates import parse_date
+from src.infrastructure.models import Output_Reports
+
+
+# Replication lag of a standby in seconds: 0 when it has replayed everything
+# it received (or is not a standby), NULL when it is unknown. A standby that
+# is not streaming (primary down, receiver restarting) has nothing new to
+# replay but is stale all the same: unknown.
+REPLICA_LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (
+            SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming'
+        ) THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+""")
+
+
+def db_url(driver: str, dsn: Optional[str] = None) -> str:
+    """SQLAlchemy URL of `dsn` (postgresql://...) or of the DB_* settings"""
+    if not dsn:
+        return f"postgresql+{driver}://{config.DB_USER}:{config.DB_PASSWORD}@{config.DB_HOST}:5432/{config.DB_NAME}"
+    scheme, rest = dsn.split("://", 1)
+    return f"{scheme.split('+')[0]}+{driver}://{rest}"
+
+
+def table_columns(model: type[SQLModel]) -> list:
+    """Columns of a table model, to read rows as plain mappings (no ORM objects)"""
+    return list(model.__table__.columns)
+
+
+# same sums as the rollup, computed from the raw brands rows
+RAW_DAILY_BRANDS = """
+            SELECT
+                date::DATE AS day,
+                brand,
+                SUM(COALESCE(mention_count, 0)) AS mention_sum,
+                SUM(position) AS position_sum,
+                COUNT(*) AS position_count,
+                COUNT(DISTINCT s3_key) FILTER (
+                    WHERE COALESCE(mention_count, 0) >= 1
+                ) AS mentioned_s3_keys
+            FROM brands
+"""
+
+
+def daily_brands_cte(model_filter: str, raw: bool = False) -> str:
+    """
+    `daily` CTE with the per-day brand sums of the window
+    `date >= start_date::DATE AND date <= end_date::DATE`: the whole days
+    before end_date come from the rollup, the rows stamped exactly at
+    end_date midnight from the raw brands table (`raw`: the whole window
+    from the raw table, to check the rollup against).
+    """
+    if raw:
+        return f"""
+        WITH daily AS (
+            {RAW_DAILY_BRANDS}
+            WHERE brand_report_id = :brand_report_id
+                AND date >= CAST(:start_date AS DATE)
+                AND date <= CAST(:end_date AS DATE)
+                {model_filter}
+            GROUP BY date::DATE, model, brand
+        )
+    """
+    return f"""
+        WITH daily AS (
+            SELECT
+                day,
+                brand,
+                mention_sum,
+                position_sum,
+                position_count,
+                mentioned_s3_keys
+            FROM brand_daily_metrics
+            WHERE brand_report_id = :brand_report_id
+                AND day >= CAST(:start_date AS DATE)
+                AND day < CAST(:end_date AS DATE)
+                {model_filter}
+            UNION ALL
+            {RAW_DAILY_BRANDS}
+            WHERE brand_report_id = :brand_report_id
+                AND date = CAST(:end_date AS DATE)
+                AND date >= CAST(:start_date AS DATE)
+                {model_filter}
+            GROUP BY date::DATE, brand
+        )
+    """
+
+
+def daily_documents_sql(model_filter: str, raw: bool = False) -> str:
+    """Number of documents (s3_key) in the same window as `daily_brands_cte`"""
+    if raw:
+        return f"""
+        (
+            SELECT COUNT(DISTINCT s3_key)
+            FROM brands
+            WHERE brand_report_id = :brand_report_id
+                AND date >= CAST(:start_date AS DATE)
+                AND date <= CAST(:end_date AS DATE)
+                {model_filter}
+        )
+    """
+    return f"""
+        (
+            SELECT COALESCE(SUM(document_count), 0)::BIGINT
+            FROM report_daily_documents
+            WHERE brand_report_id = :brand_report_id
+                AND day >= CAST(:start_date AS DATE)
+                AND day < CAST(:end_date AS DATE)
+                {model_filter}
+        ) + (
+            SELECT COUNT(DISTINCT s3_key)
+            FROM brands
+            WHERE brand_report_id = :brand_report_id
+                AND date = CAST(:end_date AS DATE)
+                AND date >= CAST(:start_date AS DATE)
+                {model_filter}
+        )
+    """
+
+
+# ------------------------------REPORTS------------------------------
+def reports_stmt(brand_report_id: str, limit: int, offset: int) -> Select:
+    return (
+        select(*table_columns(Output_Reports))
+        .where(Output_Reports.brand_report_id == brand_report_id)
+        .limit(limit)
+        .offset(offset)
+    )
+
+
+def latest_date_stmt(table: type[SQLModel], **filters: str) -> Select:
+    """Most recent (non NULL) date of the rows matching column=value filters"""
+    return (
+        select(table.date)
+        .where(
+            *[getattr(table, column) == value for column, value in filters.items()],
+            table.date.is_not(None),
+        )
+        .order_by(table.date.desc())
+        .limit(1)
+    )
+
+
+def report_output_stmt(
+    brand_report_id: str, prompt_id: str, report_date: datetime, model: str
+) -> Select:
+    statement = select(Output_Reports.snapshot, Output_Reports.markdown).where(
+        Output_Reports.brand_report_id == brand_report_id,
+        Output_Reports.prompt_id == prompt_id,
+        Output_Reports.date == report_date,
+    )
+    if model.lower() != "all":
+        statement = statement.where(Output_Reports.model == model)
+    return statement.limit(1)
+
+
+def prompt_rows_stmt(
+    table: type[SQLModel], prompt_id: str, report_date: datetime, model: str
+) -> Select:
+    """Rows of a prompt on one report date (citations, sentiments)"""
+    statement = select(*table_columns(table)).where(
+        table.prompt_id == prompt_id,
+        table.date == report_date,
+    )
+    if model.lower() != "all":
+        statement = statement.where(table.model == model)
+    return statement
+
+
+def report_rows_stmt(
+    table: type[SQLModel],
+    brand_report_id: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    model: str = "all",
+) -> Select:
+    """Rows of a report in a date range (unparsable bounds are ignored)"""
+    statement = select(*table_columns(table)).where(
+        table.brand_report_id == brand_report_id
+    )
+    start_date_node = parse_date(start_date)
+    if start_date_node:
+        statement = statement.where(table.date >= start_date_node)
+    end_date_node = parse_date(end_date)
+    if end_date_node:
+        statement = statement.where(table.date <= end_date_node)
+    if model.lower() != "all":
+        statement = statement.where(table.model == model)
+    return statement
+
+
+def report_dates_stmt(prompt_id: str, max_dates: str) -> Select:
+    """Report dates of a prompt from `max_dates` (7 days ago if unparsable)"""
+    start_date_node = parse_date(max_dates)
+    start_date = (
+        start_date_node.date()
+        if start_date_node
+        else datetime.today().date() - timedelta(days=7)
+    )
+    return (
+        select(Output_Reports.date)
+        .where(
+            and_(
+                Output_Reports.date >= start_date,
+                Output_Reports.prompt_id == prompt_id,
+            )
+        )
+        .order_by(Output_Reports.date.desc())
+    )
+
+
+def unique_report_dates(dates: Sequence[datetime]) -> list[str]:
+    # Several reports can share a day: dedup on the calendar date
+    unique_dates = sorted({date.date() for date in dates}, reverse=True)
+    return [unique_date.strftime("%Y-%m-%d") for unique_date in unique_dates]
+
+
+# ------------------------------DOMAIN------------------------------
+def domain_coverage_stmts(
+    brand_report_id: str,
+    domain: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    model: str = "all",
+    limit: int = 50,
+) -> tuple[TextClause, TextClause]:
+    """Totals and top URLs statements of `domain_coverage_result`"""
+    filters = ["brand_report_id = :brand_report_id"]
+    params = dict(brand_report_id=brand_report_id, domain=domain, limit=limit)
+    start_date_node = parse_date(start_date)
+    if start_date_node:
+        filters.append("date >= :start_date")
+        params["start_date"] = start_date_node
+    end_date_node = parse_date(end_date)
+    if end_date_node:
+        filters.append("date <= :end_date")
+        params["end_date"] = end_date_node
+    if model.lower() != "all":
+        filters.append("model = :model")
+        params["model"] = model
+    where = " AND ".join(filters)
+
+    totals_stmt = text(f"""
+        SELECT
+            COUNT(*) FILTER (WHERE domain = :domain) AS citation,
+            COUNT(DISTINCT s3_key) AS total_s3_keys,
+            COUNT(DISTINCT s3_key) FILTER (WHERE domain = :domain)
+                AS domain_s3_keys
+        FROM citations
+        WHERE {where}
+    """).bindparams(**{k: v for k, v in params.items() if k != "limit"})
+    urls_stmt = text(f"""
+        SELECT norm_url, COUNT(*) AS count
+        FROM citations
+        WHERE {where} AND domain = :domain
+        GROUP BY norm_url
+        ORDER BY count DESC, norm_url
+        LIMIT :limit
+    """).bindparams(**params)
+    return totals_stmt, urls_stmt
+
+
+def domain_coverage_result(domain: str, totals: Any, url_rows: Sequence) -> dict:
+    citation, total, with_domain = totals
+    return {
+        "citation": citation,
+        "coverage": round((with_domain / total) * 100, 2) if total else 0.0,
+        "url_data": [
+            {"normalised_url": url, "count": count, "domain": domain}
+            for url, count in url_rows
+        ],
+    }
+
+
+# ------------------------------BRANDS------------------------------
+def brand_window(
+    sql: str,
+    brand_report_id: str,
+    start_date: str,
+    end_date: str,
+    model: str,
+    **params: Any,
+) -> TextClause:
+    """`daily_brands_cte` + `sql`, with the window (and extra) parameters bound"""
+    params.update(
+        brand_report_id=brand_report_id,
+        start_date=start_date,
+        end_date=end_date,
+    )
+    if model != "all":
+        params["model"] = model
+    return text(sql).bindparams(**params)
+
+
+def model_filter(model: str) -> str:
+    return "AND model = :model" if model != "all" else ""
+
+
+def brand_mention_stmt(
+    brand: str,
+    brand_report_id: str,
+    start_date: str,
+    end_date: str,
+    model: str,
+    raw: bool = False,
+) -> TextClause:
+    sql = daily_brands_cte(model_filter(model), raw) + """
+        SELECT COALESCE(SUM(mention_sum), 0)::BIGINT AS total_mentions
+        FROM daily
+        WHERE LOWER(brand) = LOWER(:brand)
+    """
+    return brand_window(sql, brand_report_id, start_date, end_date, model, brand=brand)
+
+
+def brand_mention_result(row: Any) -> dict:
+    return {"data": row[0] if row else 0}
+
+
+def brand_sov_stmt(
+    brand: str,
+    brand_report_id: str,
+    start_date: str,
+    end_date: str,
+    model: str,
+    raw: bool = False,
+) -> TextClause:
+    sql = daily_brands_cte(model_filter(model), raw) + """
+        SELECT
+            (
+                SUM(
+                    CASE
+                        WHEN LOWER(brand) = LOWER(:brand)
+                        THEN mention_sum::FLOAT
+                        ELSE 0
+                    END
+                )
+                /
+                NULLIF(SUM(mention_sum::FLOAT), 0)
+            ) * 100 AS sov
+        FROM daily
+    """
+    return brand_window(sql, brand_report_id, start_date, end_date, model, brand=brand)
+
+
+def brand_sov_result(row: Any) -> dict:
+    sov = row[0] if row else None
+    return {"data": round(float(sov), 2) if sov else 0.0}
+
+
+def brand_coverage_stmt(
+    brand: str,
+    brand_report_id: str,
+    start_date: str,
+    end_date: str,
+    model: str,
+    raw: bool = False,
+) -> TextClause:
+    sql = daily_brands_cte(model_filter(model), raw) + f"""
+        SELECT
+            {daily_documents_sql(model_filter(model), raw)} AS total_s3_keys,
+            (
+                SELECT COALESCE(SUM(mentioned_s3_keys), 0)::BIGINT
+                FROM daily
+                WHERE LOWER(brand) = LOWER(:brand)
+            ) AS mentioned_s3_keys
+    """
+    return brand_window(sql, brand_report_id, start_date, end_date, model, brand=brand)
+
+
+def brand_coverage_result(row: Any) -> dict:
+    total = row[0] if row else 0
+    mentioned = row[1] if row else 0
+    coverage = (mentioned / total) * 100 if total else 0
+    return {"data": coverage}
+
+
+def brand_position_stmt(
+    brand: str,
+    brand_report_id: str,
+    start_date: str,
+    end_date: str,
+    model: str,
+    raw: bool = False,
+) -> TextClause:
+    sql = daily_brands_cte(model_filter(model), raw) + """
+        SELECT
+            SUM(position_sum) AS total_position,
+            SUM(position_count) AS brand_count
+        FROM daily
+        WHERE LOWER(brand) = LOWER(:brand)
+    """
+    return brand_window(sql, brand_report_id, start_date, end_date, model, brand=brand)
+
+
+def brand_position_result(row: Any) -> dict:
+    total_position = row[0] or 0
+    brand_count = row[1] or 0
+    if brand_count == 0:
+        return {"data": 0}
+    avg_position = total_position / brand_count
+    return {"data": int(avg_position)}
+
+
+def brand_summary_stmt(
+    brand: str,
+    brand_report_id: str,
+    start_date: str,
+    end_date: str,
+    model: str,
+    raw: bool = False,
+) -> TextClause:
+    brand_filter = "FILTER (WHERE LOWER(brand) = LOWER(:brand))"
+    sql = daily_brands_cte(model_filter(model), raw) + f"""
+        SELECT
+            COALESCE(SUM(mention_sum) {brand_filter}, 0)::BIGINT AS mentions,
+            (
+                COALESCE(SUM(mention_sum::FLOAT) {brand_filter}, 0)
+                /
+                NULLIF(SUM(mention_sum::FLOAT), 0)
+            ) * 100 AS sov,
+            {daily_documents_sql(model_filter(model), raw)} AS total_s3_keys,
+            COALESCE(SUM(mentioned_s3_keys) {brand_filter}, 0)::BIGINT
+                AS mentioned_s3_keys,
+            SUM(position_sum) {brand_filter} AS total_position,
+            SUM(position_count) {brand_filter} AS brand_count
+        FROM daily
+    """
+    return brand_window(sql, brand_report_id, start_date, end_date, model, brand=brand)
+
+
+def brand_summary_result(row: Any) -> dict:
+    mentions, sov, total, mentioned, total_position, brand_count = row
+    return {
+        "data": {
+            "mentions": mentions,
+            "sov": round(float(sov), 2) if sov else 0.0,
+            "coverage": (mentioned / total) * 100 if total else 0,
+            "position": int(total_position / brand_count) if brand_count else 0,
+        }
+    }
+
+
+def brand_ranking_stmt(
+    brand_report_id: str, start_date: str, end_date: str, model: str, raw: bool = False
+) -> TextClause:
+    sql = daily_brands_cte(model_filter(model), raw) + """
+        SELECT brand, SUM(mention_sum)::BIGINT AS total_mentions
+        FROM daily
+        GROUP BY brand
+        ORDER BY total_mentions DESC
+    """
+    return brand_window(sql, brand_report_id, start_date, end_date, model)
+
+
+def brand_ranking_result(rows: Sequence) -> list:
+    ranking = []
+    prev_mentions = None
+    rank = 0
+    skip = 1
+    for row in rows:
+        mentions = row[1] or 0
+        if mentions == prev_mentions:
+            skip += 1
+        else:
+            rank += skip
+            skip = 1
+        ranking.append(
+            {
+                "rank": rank,
+                "brand_name": row[0],
+                "mention_count": mentions,
+            }
+        )
+        prev_mentions = mentions
+    return ranking
+
+
+def brand_ranking_over_time_stmt(
+    brand_report_id: str,
+    start_date: str,
+    end_date: str,
+    model: str,
+    brand: Optional[str] = None,
+    fill_gaps: bool = False,
+    raw: bool = False,
+) -> TextClause:
+    brand_filter = "WHERE LOWER(brand) = LOWER(:brand)" if brand else ""
+    end_day_brand_filter = "AND LOWER(brand) = LOWER(:brand)" if brand else ""
+    ranked = """
+        , ranked AS (
+            SELECT
+                day,
+                brand,
+                SUM(mention_sum)::BIGINT AS total_mentions,
+                RANK() OVER (
+                    PARTITION BY day ORDER BY SUM(mention_sum) DESC
+                ) AS rank
+            FROM daily
+            GROUP BY day, brand
+        )
+    """
+    if fill_gaps:
+        query = f"""
+        , ranked_brands AS (
+            SELECT DISTINCT brand FROM ranked {brand_filter}
+        ),
+        days AS (
+            SELECT generate_series(
+                CAST(:start_date AS DATE),
+                CAST(:end_date AS DATE) - INTERVAL '1 day',
+                INTERVAL '1 day'
+            )::DATE AS day
+            -- the window only holds the rows stamped at end_date midnight:
+            -- no empty (often future) end day
+            UNION
+            SELECT day FROM ranked
+            WHERE day = CAST(:end_date AS DATE) {end_day_brand_filter}
+        )
+        SELECT days.day, ranked_brands.brand, ranked.rank,
+            COALESCE(ranked.total_mentions, 0) AS total_mentions
+        FROM ranked_brands
+        CROSS JOIN days
+        LEFT JOIN ranked
+            ON ranked.day = days.day AND ranked.brand = ranked_brands.brand
+        ORDER BY days.day ASC, ranked.rank ASC NULLS LAST, ranked_brands.brand
+        """
+    else:
+        query = f"""
+        SELECT day, brand, rank, total_mentions
+        FROM ranked
+        {brand_filter}
+        ORDER BY day ASC, rank ASC, brand
+        """
+    params = {"brand": brand} if brand else {}
+    return brand_window(
+        daily_brands_cte(model_filter(model), raw) + ranked + query,
+        brand_report_id,
+        start_date,
+        end_date,
+        model,
+        **params,
+    )
+
+
+def brand_ranking_over_time_result(rows: Sequence) -> list:
+    brand_points = defaultdict(list)
+    for day, brand_name, rank, mentions in rows:
+        brand_points[brand_name].append(
+            {"date": day, "rank": rank, "mention_count": mentions}
+        )
+
+    return [
+        {"brand_name": brand_name, "points": points}
+        for brand_name, points in brand_points.items()
+    ]
@@ -0,0 +1,98 @@
+import threading
+from collections import defaultdict
+from typing import Any, Callable
+
+import boto3
+from google import genai
+from sqlalchemy import Engine
+
+from src.config import config
+from src.infrastructure.database import DataBase, create_db_engine
+
+
+class ResourceRegistry:
+    """
+    Per-process holder for the expensive clients used by the parser tasks.
+
+    Each Celery worker process initialises one registry when it starts and
+    tears it down on shutdown, so every task in that process reuses the same
+    Gemini client, boto3 S3 client and pooled SQLAlchemy engine instead of
+    building new ones.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._resources: dict[str, Any] = {}
+        self.created: dict[str, int] = defaultdict(int)
+        self.reused: dict[str, int] = defaultdict(int)
+
+    def _get(self, name: str, factory: Callable[[], Any]) -> Any:
+        with self._lock:
+            if name in self._resources:
+                self.reused[name] += 1
+                return self._resources[name]
+            resource = factory()
+            self._resources[name] = resource
+            self.created[name] += 1
+            return resource
+
+    def _create_engine(self) -> Engine:
+        # a worker process runs one task (at most 3 threads) at a time
+        engine = create_db_engine(pool_size=3, max_overflow=2)
+        DataBase(engine=engine).require_schema()
+        return engine
+
+    def get_genai_client(self) -> genai.Client:
+        return self._get(
+            "genai_client", lambda: genai.Client(api_key=config.GEMINI_API_KEY)
+        )
+
+    def get_s3_client(self):
+        return self._get(
+            "s3_client",
+            lambda: boto3.client(
+                "s3",
+                region_name=config.AWS_REGION_NAME,
+                aws_access_key_id=config.AWS_ACCESS_KEY_ID,
+                aws_secret_access_key=config.AWS_SECRET_ACCESS_KEY,
+            ),
+        )
+
+    def get_engine(self) -> Engine:
+        return self._get("engine", self._create_engine)
+
+    def init(self) -> None:
+        """Eagerly create every resource (called on worker process init)"""
+        self.get_genai_client()
+        self.get_s3_client()
+        self.get_engine()
+
+    def stats(self) -> dict:
+        """Creation vs reuse counters for every resource"""
+        names = set(self.created) | set(self.reused)
+        return {
+            name: {"created": self.created[name], "reused": self.reused[name]}
+            for name in sorted(names)
+        }
+
+    def close(self) -> None:
+        """Release every resource (called on worker process shutdown)"""
+        with self._lock:
+            resources = self._resources
+            self._resources = {}
+
+        engine = resources.get("engine")
+        if engine is not None:
+            engine.dispose()
+
+        for name in ("s3_client", "genai_client"):
+            close = getattr(resources.get(name), "close", None)
+            if close is None:
+                continue
+            try:
+                close()
+            except Exception as e:
+                print(f"RESOURCES: Unable to close {name}: {e}")
+
+
+resources = ResourceRegistry()
@@ -0,0 +1,410 @@
+"""
+Daily brand rollup.
+
+`brand_daily_metrics` holds, per (brand_report_id, day, model, brand), the
+sums the metrics endpoints need (mentions, positions, documents mentioning
+the brand) and `report_daily_documents` the number of documents (s3_key)
+per (brand_report_id, day, model). Both are updated in the transaction that
+saves the brands, so they never drift from the raw rows.
+
+Saving takes transaction advisory locks: one per (report, document), so two
+concurrent saves of a document do not both count it as new, and a shared
+one per report. `rebuild` takes the report lock exclusively, one report at a
+time, so it only holds back the saves of the report being rebuilt.
+
+`check` runs every brand metric reader on the rollup and the same query on
+the raw brands rows (whole report and single-day windows, every model and
+brand) and lists the differences. `summary` checks, on the same windows,
+that get_brand_summary returns the values of get_brand_mention / sov /
+coverage / position, on Postgres and on ClickHouse when it is enabled.
+
+Usage:
+    python -m src.infrastructure.rollup rebuild [brand_report_id]
+    python -m src.infrastructure.rollup check [brand_report_id]
+    python -m src.infrastructure.rollup summary [brand_report_id]
+"""
+
+import copy
+import math
+import sys
+from collections import defaultdict
+from datetime import timedelta
+from typing import Any, Iterator, Optional
+
+from sqlalchemy import Connection, Engine, text
+
+from src.infrastructure.models import Brands
+from src.infrastructure.queries import (
+    brand_coverage_result,
+    brand_coverage_stmt,
+    brand_mention_result,
+    brand_mention_stmt,
+    brand_position_result,
+    brand_position_stmt,
+    brand_ranking_over_time_result,
+    brand_ranking_over_time_stmt,
+    brand_ranking_result,
+    brand_ranking_stmt,
+    brand_sov_result,
+    brand_sov_stmt,
+    brand_summary_result,
+    brand_summary_stmt,
+)
+
+# reader: (statement builder, result shaping, one row per brand)
+READERS = {
+    "get_brand_mention": (brand_mention_stmt, brand_mention_result, True),
+    "get_brand_sov": (brand_sov_stmt, brand_sov_result, True),
+    "get_brand_coverage": (brand_coverage_stmt, brand_coverage_result, True),
+    "get_brand_position": (brand_position_stmt, brand_position_result, True),
+    "get_brand_summary": (brand_summary_stmt, brand_summary_result, True),
+    "get_brand_ranking": (brand_ranking_stmt, brand_ranking_result, False),
+    "get_brand_ranking_over_time": (
+        brand_ranking_over_time_stmt,
+        brand_ranking_over_time_result,
+        False,
+    ),
+}
+# get_brand_summary value: the endpoint reader serving it on its own
+SUMMARY_READERS = {
+    "mentions": "get_brand_mention",
+    "sov": "get_brand_sov",
+    "coverage": "get_brand_coverage",
+    "position": "get_brand_position",
+}
+
+# advisory lock classes (first key), the second key is a hash of the ids
+ROLLUP_REPORT_LOCK = 48151625
+ROLLUP_DOCUMENT_LOCK = 48151626
+
+LOCK_REPORTS_SHARED = """
+SELECT pg_advisory_xact_lock_shared(:lock_class, hashtext(report))
+FROM unnest(CAST(:reports AS VARCHAR[])) AS report
+"""
+
+LOCK_DOCUMENTS = """
+SELECT pg_advisory_xact_lock(:lock_class, hashtext(report || '/' || s3_key))
+FROM unnest(CAST(:reports AS VARCHAR[]), CAST(:s3_keys AS VARCHAR[]))
+    AS document(report, s3_key)
+"""
+
+UPSERT_DAILY_METRICS = """
+INSERT INTO brand_daily_metrics (
+    brand_report_id, day, model, brand,
+    mention_sum, position_sum, position_count, mentioned_s3_keys
+)
+VALUES (
+    :brand_report_id, :day, :model, :brand,
+    :mention_sum, :position_sum, :position_count, :mentioned_s3_keys
+)
+ON CONFLICT (brand_report_id, day, model, brand) DO UPDATE SET
+    mention_sum = brand_daily_metrics.mention_sum + EXCLUDED.mention_sum,
+    position_sum = brand_daily_metrics.position_sum + EXCLUDED.position_sum,
+    position_count = brand_daily_metrics.position_count + EXCLUDED.position_count,
+    mentioned_s3_keys = (
+        brand_daily_metrics.mentioned_s3_keys + EXCLUDED.mentioned_s3_keys
+    )
+"""
+
+UPSERT_DAILY_DOCUMENTS = """
+INSERT INTO report_daily_documents (brand_report_id, day, model, document_count)
+VALUES (:brand_report_id, :day, :model, :document_count)
+ON CONFLICT (brand_report_id, day, model) DO UPDATE SET
+    document_count = report_daily_documents.document_count
+        + EXCLUDED.document_count
+"""
+
+
+def update_daily_metrics(connection: Connection, brands: list[Brands]) -> None:
+    """
+    Add `brands` (not inserted yet) to the rollup tables.
+
+    Must run in the transaction that inserts the rows: a document (s3_key)
+    or a (document, brand) mention is only counted the first time it shows
+    up in its report on a day and model, like the per day COUNT(DISTINCT
+    s3_key) of the rebuild. So only the days of the batch are looked up (and
+    only their partitions scanned). A document is the output of one task,
+    saved with the task date, so all its rows share a day anyway.
+    """
+    if not brands:
+        return
+
+    # sorted, so concurrent saves take the locks in the same order
+    documents_saved = sorted(
+        {(brand.brand_report_id, brand.s3_key) for brand in brands}
+    )
+    reports = sorted({report for report, _ in documents_saved})
+    connection.execute(
+        text(LOCK_REPORTS_SHARED),
+        {"lock_class": ROLLUP_REPORT_LOCK, "reports": reports},
+    )
+    # the lookup below then sees the rows of a concurrent save of the same
+    # document once it committed
+    connection.execute(
+        text(LOCK_DOCUMENTS),
+        {
+            "lock_class": ROLLUP_DOCUMENT_LOCK,
+            "reports": [report for report, _ in documents_saved],
+            "s3_keys": [s3_key for _, s3_key in documents_saved],
+        },
+    )
+    days = sorted({brand.date.date() for brand in brands})
+    existing = connection.execute(
+        text(
+            "SELECT brand_report_id, s3_key, date::DATE, model, LOWER(brand), "
+            "COALESCE(mention_count, 0) FROM brands "
+            "WHERE s3_key = ANY(:s3_keys) AND brand_report_id = ANY(:reports) "
+            "AND date >= :first_day AND date < :end_day"
+        ),
+        {
+            "s3_keys": [s3_key for _, s3_key in documents_saved],
+            "reports": reports,
+            "first_day": days[0],
+            "end_day": days[-1] + timedelta(days=1),
+        },
+    ).all()
+    known_documents = {row[:4] for row in existing}
+    known_mentions = {row[:5] for row in existing if row[5] >= 1}
+
+    metrics: dict[tuple, dict] = defaultdict(
+        lambda: dict(
+            mention_sum=0, position_sum=0, position_count=0, mentioned_s3_keys=0
+        )
+    )
+    documents: dict[tuple, int] = defaultdict(int)
+    for brand in brands:
+        day = brand.date.date()
+        values = metrics[(brand.brand_report_id, day, brand.model, brand.brand)]
+        values["mention_sum"] += brand.mention_count or 0
+        values["position_sum"] += brand.position
+        values["position_count"] += 1
+
+        document = (brand.brand_report_id, brand.s3_key, day, brand.model)
+        mention_key = document + (brand.brand.lower(),)
+        if (brand.mention_count or 0) >= 1 and mention_key not in known_mentions:
+            known_mentions.add(mention_key)
+            values["mentioned_s3_keys"] += 1
+
+        if document not in known_documents:
+            known_documents.add(document)
+            documents[(brand.brand_report_id, day, brand.model)] += 1
+
+    connection.execute(
+        text(UPSERT_DAILY_METRICS),
+        [
+            dict(brand_report_id=report, day=day, model=model, brand=name, **values)
+            for (report, day, model, name), values in metrics.items()
+        ],
+    )
+    if documents:
+        connection.execute(
+            text(UPSERT_DAILY_DOCUMENTS),
+            [
+                dict(brand_report_id=report, day=day, model=model, document_count=n)
+                for (report, day, model), n in documents.items()
+            ],
+        )
+
+
+def rebuild(engine: Engine, brand_report_id: Optional[str] = None) -> None:
+    """
+    Recompute the rollup tables from the raw brands rows, one report per
+    transaction
+    """
+    if brand_report_id:
+        reports = [brand_report_id]
+    else:
+        with engine.connect() as connection:
+            reports = (
+                connection.execute(
+                    text(
+                        "SELECT brand_report_id FROM brand_daily_metrics "
+                        "UNION SELECT brand_report_id FROM report_daily_documents "
+                        "UNION SELECT DISTINCT brand_report_id FROM brands"
+                    )
+                )
+                .scalars()
+                .all()
+            )
+    for report in reports:
+        rebuild_report(engine, report)
+    print(f"ROLLUP: Rebuilt daily metrics for {brand_report_id or 'all reports'}")
+
+
+def rebuild_report(engine: Engine, brand_report_id: str) -> None:
+    params = {"brand_report_id": brand_report_id}
+    with engine.begin() as connection:
+        # waits for the saves of the report in progress, holds back the next
+        connection.execute(
+            text("SELECT pg_advisory_xact_lock(:lock_class, hashtext(:report))"),
+            {"lock_class": ROLLUP_REPORT_LOCK, "report": brand_report_id},
+        )
+        for table in ("brand_daily_metrics", "report_daily_documents"):
+            connection.execute(
+                text(f"DELETE FROM {table} WHERE brand_report_id = :brand_report_id"),
+                params,
+            )
+        connection.execute(
+            text("""
+                INSERT INTO brand_daily_metrics (
+                    brand_report_id, day, model, brand,
+                    mention_sum, position_sum, position_count, mentioned_s3_keys
+                )
+                SELECT
+                    brand_report_id,
+                    date::DATE,
+                    model,
+                    brand,
+                    SUM(COALESCE(mention_count, 0)),
+                    SUM(position),
+                    COUNT(*),
+                    COUNT(DISTINCT s3_key) FILTER (
+                        WHERE COALESCE(mention_count, 0) >= 1
+                    )
+                FROM brands
+                WHERE brand_report_id = :brand_report_id
+                GROUP BY brand_report_id, date::DATE, model, brand
+                """),
+            params,
+        )
+        connection.execute(
+            text("""
+                INSERT INTO report_daily_documents (
+                    brand_report_id, day, model, document_count
+                )
+                SELECT brand_report_id, date::DATE, model, COUNT(DISTINCT s3_key)
+                FROM brands
+                WHERE brand_report_id = :brand_report_id
+                GROUP BY brand_report_id, date::DATE, model
+                """),
+            params,
+        )
+
+
+def run_reader(
+    connection: Connection, name: str, raw: bool = False, **arguments
+) -> Any:
+    """Result of a brand metric reader, on the rollup or on the raw rows"""
+    stmt, result, per_brand = READERS[name]
+    rows = connection.execute(stmt(**arguments, raw=raw))
+    return result(rows.first() if per_brand else rows.fetchall())
+
+
+def report_windows(
+    connection: Connection, brand_report_id: Optional[str] = None
+) -> Iterator[tuple[dict, list[str]]]:
+    """
+    Every window to check (whole report, then every single day, for "all"
+    and each model) with the brands of the report
+    """
+    report_filter = (
+        "WHERE brand_report_id = :brand_report_id" if brand_report_id else ""
+    )
+    params = {"brand_report_id": brand_report_id} if brand_report_id else {}
+    reports = defaultdict(list)
+    for report, day, model, brand in connection.execute(
+        text(
+            "SELECT DISTINCT brand_report_id, date::DATE, model, brand "
+            f"FROM brands {report_filter}"
+        ),
+        params,
+    ):
+        reports[report].append((day, model, brand))
+
+    for report, rows in reports.items():
+        days = sorted({day for day, _, _ in rows})
+        models = ["all"] + sorted({model for _, model, _ in rows})
+        brands = sorted({brand for _, _, brand in rows})
+        for start, last in [(days[0], days[-1])] + [(day, day) for day in days]:
+            for model in models:
+                window = dict(
+                    brand_report_id=report,
+                    start_date=str(start),
+                    end_date=str(last + timedelta(days=1)),
+                    model=model,
+                )
+                yield window, brands
+
+
+def check(engine: Engine, brand_report_id: Optional[str] = None) -> int:
+    """Compare the rollup readers with the raw table queries (mismatch count)"""
+    checked = mismatches = 0
+    with engine.connect() as connection:
+        for window, brands in list(report_windows(connection, brand_report_id)):
+            for name, (_, _, per_brand) in READERS.items():
+                for brand in brands if per_brand else [None]:
+                    arguments = dict(window, brand=brand) if brand else window
+                    rollup = run_reader(connection, name, **arguments)
+                    raw = run_reader(connection, name, raw=True, **arguments)
+                    if name == "get_brand_ranking":
+                        # brands tied on mentions come in any order
+                        rollup = sorted(map(repr, rollup))
+                        raw = sorted(map(repr, raw))
+                    checked += 1
+                    if rollup != raw:
+                        mismatches += 1
+                        print(
+                            f"ROLLUP: {name} {arguments}: "
+                            f"rollup {rollup} != raw {raw}"
+                        )
+    print(f"ROLLUP: {checked} reader calls checked, {mismatches} mismatches")
+    return mismatches
+
+
+def check_summary(
+    database, analytics=None, brand_report_id: Optional[str] = None
+) -> int:
+    """
+    Compare get_brand_summary (on Postgres, and on `analytics` when set)
+    with the four Postgres endpoint readers (mismatch count). The reports
+    must be in ClickHouse already (backfill).
+    """
+    postgres = copy.copy(database)
+    postgres.analytics = None
+    backends = {"postgres": postgres}
+    if analytics is not None:
+        backends["clickhouse"] = analytics
+    checked = mismatches = 0
+    with database.engine.connect() as connection:
+        windows = list(report_windows(connection, brand_report_id))
+    for window, brands in windows:
+        for brand in brands:
+            arguments = dict(window, brand=brand)
+            expected = {
+                key: getattr(postgres, reader)(**arguments)["data"]
+                for key, reader in SUMMARY_READERS.items()
+            }
+            for backend, readers in backends.items():
+                summary = readers.get_brand_summary(**arguments)["data"]
+                for key, value in expected.items():
+                    checked += 1
+                    # sov is rounded to 2 decimals by both engines
+                    if not math.isclose(
+                        summary[key], value, abs_tol=0.01 if key == "sov" else 1e-9
+                    ):
+                        mismatches += 1
+                        print(
+                            f"SUMMARY: {backend} {key} {arguments}: "
+                            f"summary {summary[key]} != "
+                            f"{SUMMARY_READERS[key]} {value}"
+                        )
+    print(f"SUMMARY: {checked} values checked, {mismatches} mismatches")
+    return mismatches
+
+
+if __name__ == "__main__":
+    from src.infrastructure.database import DataBase
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ("rebuild", "check", "summary"):
+        print(__doc__)
+        sys.exit(1)
+
+    database = DataBase()
+    engine = database.engine
+    brand_report_id = sys.argv[2] if len(sys.argv) > 2 else None
+    if sys.argv[1] == "rebuild":
+        rebuild(engine, brand_report_id)
+    elif sys.argv[1] == "check":
+        sys.exit(1 if check(engine, brand_report_id) else 0)
+    elif check_summary(database, database.analytics, brand_report_id):
+        sys.exit(1)
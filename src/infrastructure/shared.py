@@ -1,12 +1,14 @@
 from datetime import datetime, timedelta
 from urllib.parse import urlparse, urlunparse
-import dateparser
 import markdown2
 from markdownify import markdownify as md
 import re
 
+from pydantic import BaseModel
 from selectolax.parser import HTMLParser
-import tldextract
+
+from src.infrastructure.dates import parse_date
+from src.infrastructure.domains import domain_normalizer
 
 CANONICAL_MAP = {
     "google": [
@@ -41,6 +43,24 @@ def to_canonical(brand: str):
     return brand  # fallback
 
 
+MEDIA_TAGS = [
+    "img",
+    "picture",
+    "figure",
+    "source",
+    "svg",
+    "object",
+    "embed",
+    "iframe",
+]
+
+
+class ParsedMarkdown(BaseModel):
+    clean_text: str
+    text_without_links: str
+    links: list[dict]
+
+
 def remove_links(content: str | None = None):
     """
     Remove all URLs from text
@@ -56,24 +76,35 @@ def remove_links(content: str | None = None):
     return text_without_urls
 
 
+def remove_markdown_links(content: str):
+    """
+    Remove all URLs and markdown links from text
+    """
+
+    # 1. Remove markdown links [text](url) — keep nothing (inline citations)
+    text = re.sub(r"\[([^\]]*)\]\([^)]*\)", "", content)
+
+    # 2. Remove markdown reference-style links [text][ref] — keep nothing
+    text = re.sub(r"\[([^\]]*)\]\[[^\]]*\]", "", text)
+
+    # 3. Remove bare URLs (http, https, ftp, www)
+    text = re.sub(r"https?://\S+|www\.\S+|ftp://\S+", "", text)
+
+    # 4. Clean up extra whitespace
+    text = re.sub(r"\s+", " ", text).strip()
+
+    return text
+
+
+def html_to_markdown(html_content: str) -> str:
+    cleaned_markdown = md(html_content, strip=MEDIA_TAGS)
+    return cleaned_markdown.strip()
+
+
 def clean_markdown(content: str | None = None) -> str:
     if not content:
         return ""
-    html_content = markdown2.markdown(content)
-    cleaned_markdown = md(
-        html_content,
-        strip=[
-            "img",
-            "picture",
-            "figure",
-            "source",
-            "svg",
-            "object",
-            "embed",
-            "iframe",
-        ],
-    )
-    return cleaned_markdown.strip()
+    return html_to_markdown(markdown2.markdown(content))
 
 
 def super_clean(content: str, model: str):
@@ -83,23 +114,19 @@ def super_clean(content: str, model: str):
     return content
 
 
-def extract_clean_links(content: str, model: str = "", google_citations: str = ""):
-    """Extract and clean links from markdown content (including citations)"""
-
-    BLOCKED_DOMAINS = {
-        "www.google.com",
-        "google.com",
-        "gstatic.com",
-        "www.gstatic.com",
-        "accounts.google.com",
-        "support.google.com",
-    }
+def _clean_link(url: str, title: str) -> dict | None:
+    parsed = urlparse(url)
+    domain = normalize_domain(url)
+    if domain_normalizer.is_blocked(domain):
+        return None
 
-    if not content:
-        return []
+    clean_url = urlunparse(
+        (parsed.scheme, parsed.netloc, parsed.path, parsed.params, parsed.query, "")
+    )
+    return {"title": title, "domain": domain, "url": clean_url}
 
-    full_content = f"{content} {google_citations}" if model == "Google" else content
 
+def _extract_links(full_content: str, html_content: str) -> list[dict]:
     links = []
 
     # -----------------------------
@@ -108,27 +135,14 @@ def extract_clean_links(content: str, model: str = "", google_citations: str = "
     citation_pattern = re.findall(r"\[\^\d+\]:\s*(https?://[^\s]+)", full_content)
 
     for url in citation_pattern:
-        parsed = urlparse(url)
-        domain = normalize_domain(url)
-        if any(blocked in domain for blocked in BLOCKED_DOMAINS):
-            continue
-
-        clean_url = urlunparse(
-            (parsed.scheme, parsed.netloc, parsed.path, parsed.params, parsed.query, "")
-        )
-
-        links.append(
-            {
-                "title": "",  # citations usually don’t have titles
-                "domain": domain,
-                "url": clean_url,
-            }
-        )
+        # citations usually don’t have titles
+        link = _clean_link(url, "")
+        if link:
+            links.append(link)
 
     # -----------------------------
     # 2. Extract normal markdown links via HTML parsing
     # -----------------------------
-    html_content = markdown2.markdown(full_content)
     html = HTMLParser(html_content)
     link_nodes = html.css("a")
 
@@ -138,39 +152,50 @@ def extract_clean_links(content: str, model: str = "", google_citations: str = "
         if not href or href.strip() in {"://", "#", "/"}:
             continue
 
-        parsed = urlparse(href)
-        domain = normalize_domain(href)
+        link = _clean_link(href, link_node.text(separator=" ").strip())
+        if link:
+            links.append(link)
 
-        if any(blocked in domain for blocked in BLOCKED_DOMAINS):
-            continue
+    return links
 
-        clean_url = urlunparse(
-            (
-                parsed.scheme,
-                parsed.netloc,
-                parsed.path,
-                parsed.params,
-                parsed.query,
-                "",
-            )
-        )
-
-        title = link_node.text(separator=" ").strip()
-
-        links.append(
-            {
-                "title": title,
-                "domain": domain,
-                "url": clean_url,
-            }
-        )
 
-    return links
+def extract_clean_links(content: str, model: str = "", google_citations: str = ""):
+    """Extract and clean links from markdown content (including citations)"""
+    if not content:
+        return []
+
+    full_content = f"{content} {google_citations}" if model == "Google" else content
+    return _extract_links(full_content, markdown2.markdown(full_content))
+
+
+def parse_markdown(
+    content: str | None, model: str = "", google_citations: str = ""
+) -> ParsedMarkdown:
+    """
+    Parse a markdown document once and return everything the pipeline needs:
+    the cleaned markdown, the same text without links, and the citation links.
+    """
+    if not content:
+        return ParsedMarkdown(clean_text="", text_without_links="", links=[])
+
+    html_content = markdown2.markdown(content)
+    clean_text = html_to_markdown(html_content)
+
+    full_content = f"{content} {google_citations}" if model == "Google" else content
+    if full_content != content:
+        # the extra citations only take part in link extraction
+        html_content = markdown2.markdown(full_content)
+
+    return ParsedMarkdown(
+        clean_text=clean_text,
+        text_without_links=remove_markdown_links(clean_text),
+        links=_extract_links(full_content, html_content),
+    )
 
 
 def get_date() -> str:
     """Get date"""
-    date_node = dateparser.parse("7 days Ago")
+    date_node = parse_date("7 days Ago")
     if date_node:
         return date_node.strftime("%Y-%m-%d %H:%M:%S")
     return ""
@@ -193,10 +218,5 @@ def common_parameters(
 
 
 def normalize_domain(d: str) -> str:
-    if not d:
-        return ""
-    d = d.lower().strip()
-    domain_node = tldextract.extract(d)
-    domain = domain_node.domain
-    suffix = domain_node.suffix
-    return f"{domain}.{suffix}"
+    return domain_normalizer.normalize(d)
+